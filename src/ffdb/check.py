@@ -0,0 +1,276 @@
+""" Checking the structure of ffindex databases. """
+
+from multiprocessing import Pool
+
+from typing import Iterable, Iterator, List, Tuple, BinaryIO
+from typing import Optional, Any, Callable
+
+from ffdb.ffindex import IndexRow, FFIndex, NumericFFIndex, is_numeric_name
+from ffdb.ffindex import chunk_rows
+from ffdb.extsort import external_sort
+from ffdb.sums import digest
+
+# Roughly how many bytes of the ffdata file each worker reads at a time.
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# A chunk of documents to scan, (path, start, end, rows, checksum).
+ScanJob = Tuple[str, int, int, List[IndexRow], bool]
+
+# The problems found in a chunk, and the (name, digest) of each document.
+ScanResult = Tuple[List[str], List[Tuple[bytes, bytes]]]
+
+
+def index_rows(
+    handle: Iterable[bytes],
+    problems: List[str],
+) -> Iterator[IndexRow]:
+    """ Parse ffindex lines, recording malformed lines instead of failing.
+
+    Examples:
+    >>> problems = []
+    >>> list(index_rows([b"a\\t0\\t2\\n", b"b\\t2\\n"], problems))
+    [IndexRow(name=b'a', start=0, size=2)]
+    >>> problems
+    ['Line 2 of the index is malformed.']
+    """
+
+    for i, line in enumerate(handle, 1):
+        if len(line.strip()) == 0:
+            continue
+
+        try:
+            row = IndexRow.parse_ffindex_line(line)
+        except ValueError:
+            problems.append(f"Line {i} of the index is malformed.")
+            continue
+
+        if row.start < 0 or row.size < 0:
+            problems.append(f"Line {i} of the index is malformed.")
+            continue
+
+        yield row
+    return
+
+
+def check_index(
+    handle: BinaryIO,
+    data_size: int,
+    keys: str = "bytes",
+    buffer_size: int = 1000000,
+    tmpdir: Optional[str] = None,
+) -> Iterator[str]:
+    """ Check an ffindex file against itself and the size of the ffdata.
+
+    Finds malformed lines, rows that point past the end of the ffdata file,
+    empty documents and duplicate names, and checks that the rows are
+    sorted by name (numerically, if keys is "numeric"). Only the first
+    unsorted row is reported. If the index isn't sorted, the names are
+    sorted on disk to find duplicates, otherwise the file is read once.
+
+    Examples:
+    >>> from io import BytesIO
+    >>> handle = BytesIO(b"a\\t0\\t2\\na\\t2\\t2\\nc\\t4\\t9\\nb\\t4\\n")
+    >>> for problem in check_index(handle, 10):
+    ...     print(problem)
+    The name 'a' is in the index more than once.
+    Document 'c' ends at byte 13, past the end of the ffdata file (10 bytes).
+    Line 4 of the index is malformed.
+    """
+
+    name_key: Callable[[IndexRow], Any]
+    if keys == "numeric":
+        name_key = NumericFFIndex.name_key
+    else:
+        name_key = FFIndex.name_key
+
+    problems: List[str] = []
+    is_sorted = True
+    last: Optional[IndexRow] = None
+
+    for row in index_rows(handle, problems):
+        yield from problems
+        problems.clear()
+
+        name = row.name.decode(errors="replace")
+
+        if row.size == 0:
+            yield f"Document '{name}' is empty, it has no null terminator."
+        elif row.start + row.size > data_size:
+            yield (
+                f"Document '{name}' ends at byte {row.start + row.size}, "
+                f"past the end of the ffdata file ({data_size} bytes)."
+            )
+
+        if keys == "numeric" and not is_numeric_name(row.name):
+            yield f"The name '{name}' isn't a number."
+            continue
+
+        if last is None or not is_sorted:
+            pass
+        elif name_key(row) < name_key(last):
+            yield (
+                f"The index isn't sorted, '{name}' comes after "
+                f"'{last.name.decode(errors='replace')}'."
+            )
+            is_sorted = False
+        elif row.name == last.name:
+            yield f"The name '{name}' is in the index more than once."
+
+        last = row
+
+    yield from problems
+
+    if is_sorted:
+        return
+
+    handle.seek(0)
+    for dup in duplicate_names(
+        (r.name for r in index_rows(handle, [])),
+        buffer_size=buffer_size,
+        tmpdir=tmpdir,
+    ):
+        yield (
+            f"The name '{dup.decode(errors='replace')}' is in the index "
+            "more than once."
+        )
+    return
+
+
+def duplicate_names(
+    names: Iterable[bytes],
+    buffer_size: int = 1000000,
+    tmpdir: Optional[str] = None,
+) -> Iterator[bytes]:
+    """ Find names that appear more than once, sorting them on disk.
+
+    Examples:
+    >>> list(duplicate_names([b"b", b"a", b"b", b"c", b"b"]))
+    [b'b']
+    """
+
+    last: Optional[bytes] = None
+    reported = False
+
+    for name in external_sort(names, buffer_size=buffer_size, tmpdir=tmpdir):
+        if name != last:
+            reported = False
+        elif not reported:
+            yield name
+            reported = True
+
+        last = name
+    return
+
+
+def check_overlaps(
+    rows: Iterable[IndexRow],
+    problems: List[str],
+) -> Iterator[IndexRow]:
+    """ Pass rows sorted by start through, recording overlapping documents.
+
+    Documents that share exactly the same byte range aren't a problem,
+    since that is how identical documents can be stored once.
+
+    Examples:
+    >>> problems = []
+    >>> rows = [IndexRow(b"a", 0, 5), IndexRow(b"b", 5, 5),
+    ...         IndexRow(b"c", 5, 5), IndexRow(b"d", 8, 4)]
+    >>> len(list(check_overlaps(rows, problems)))
+    4
+    >>> problems
+    ["Document 'd' overlaps with 'b'."]
+    """
+
+    end = 0
+    last: Optional[IndexRow] = None
+
+    for row in rows:
+        if last is not None and row.start < end:
+            if (row.start, row.size) != (last.start, last.size):
+                problems.append(
+                    f"Document '{row.name.decode(errors='replace')}' "
+                    f"overlaps with '{last.name.decode(errors='replace')}'."
+                )
+
+        if last is None or row.start + row.size > end:
+            end = row.start + row.size
+            last = row
+
+        yield row
+    return
+
+
+def scan_jobs(
+    rows: Iterable[IndexRow],
+    path: str,
+    checksum: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[ScanJob]:
+    """ Group rows sorted by start into chunks to scan, see `chunk_rows`.
+    """
+
+    for start, end, chunk in chunk_rows(rows, chunk_size):
+        yield path, start, end, chunk, checksum
+    return
+
+
+def scan_chunk(job: ScanJob) -> ScanResult:
+    """ Check that each document in a chunk ends with a null byte.
+
+    The chunk is read in a single sequential read, unless it's just one
+    very large document, in which case only the last byte is read (or the
+    whole document if checksum is True, to compute its digest).
+    """
+
+    path, chunk_start, chunk_end, rows, checksum = job
+
+    problems: List[str] = []
+    digests: List[Tuple[bytes, bytes]] = []
+
+    with open(path, "rb") as handle:
+        if len(rows) > 1 or checksum:
+            handle.seek(chunk_start)
+            buf = memoryview(handle.read(chunk_end - chunk_start))
+        else:
+            handle.seek(max(0, chunk_end - 1))
+            buf = memoryview(handle.read(1))
+            chunk_start = chunk_end - 1
+
+        for row in rows:
+            offset = row.start + row.size - 1 - chunk_start
+            if row.size == 0 or offset >= len(buf):
+                # Already reported from the index.
+                continue
+
+            if buf[offset] != 0:
+                problems.append(
+                    f"Document '{row.name.decode(errors='replace')}' "
+                    "doesn't end with a null byte."
+                )
+
+            if checksum:
+                start = row.start - chunk_start
+                digests.append((
+                    row.name,
+                    digest(buf[start: start + row.size])
+                ))
+
+    return problems, digests
+
+
+def scan_data(
+    jobs: Iterable[ScanJob],
+    cpus: int = 1,
+) -> Iterator[ScanResult]:
+    """ Scan chunks of the ffdata file, in parallel if cpus > 1.
+
+    Results are yielded in the same order as the jobs.
+    """
+
+    if cpus > 1:
+        with Pool(cpus) as pool:
+            yield from pool.imap(scan_chunk, jobs)
+    else:
+        for job in jobs:
+            yield scan_chunk(job)
+    return
@@ -50,3 +50,11 @@ class FFKeyError(FFError):
 
 class InvalidOptionError(FFError):
     ecode = 1
+
+
+class FFMapError(FFError):
+    ecode = EXIT_CODES["SOFTWARE"]
+
+
+class FFCheckError(FFError):
+    ecode = EXIT_CODES["DATAERR"]
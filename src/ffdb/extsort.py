@@ -0,0 +1,98 @@
+""" Bounded memory sorting using temporary files. """
+
+import pickle
+from heapq import merge
+from tempfile import TemporaryFile
+
+from typing import TypeVar, Callable, Any
+from typing import Iterable, Iterator, List, BinaryIO
+from typing import Optional
+
+T = TypeVar("T")
+
+# The number of items to pickle together in a run file.
+BATCH_SIZE = 4096
+
+
+def _write_run(
+    items: List[T],
+    tmpdir: Optional[str] = None,
+) -> BinaryIO:
+    """ Pickle a sorted run to a temporary file in batches. """
+
+    handle = TemporaryFile(dir=tmpdir)
+    for i in range(0, len(items), BATCH_SIZE):
+        pickle.dump(
+            items[i: i + BATCH_SIZE],
+            handle,
+            protocol=pickle.HIGHEST_PROTOCOL
+        )
+
+    handle.seek(0)
+    return handle
+
+
+def _read_run(handle: BinaryIO) -> Iterator[T]:
+    """ Read back a run written by _write_run, closing it at the end. """
+
+    try:
+        while True:
+            try:
+                batch = pickle.load(handle)
+            except EOFError:
+                break
+
+            for item in batch:
+                yield item
+    finally:
+        handle.close()
+    return
+
+
+def external_sort(
+    items: Iterable[T],
+    key: Optional[Callable[[T], Any]] = None,
+    reverse: bool = False,
+    buffer_size: int = 1000000,
+    tmpdir: Optional[str] = None,
+) -> Iterator[T]:
+    """ Sort items that might not fit in memory.
+
+    Items are sorted in runs of at most `buffer_size` items, which are
+    written to temporary files and lazily merged. If everything fits in a
+    single run, no temporary files are used.
+    Items must be picklable.
+
+    Examples:
+    >>> list(external_sort([5, 3, 1, 4, 2], buffer_size=2))
+    [1, 2, 3, 4, 5]
+    >>> list(external_sort([b"a", b"c", b"b"], reverse=True, buffer_size=2))
+    [b'c', b'b', b'a']
+    """
+
+    runs: List[BinaryIO] = []
+    buffer: List[T] = []
+
+    for item in items:
+        buffer.append(item)
+
+        if len(buffer) >= buffer_size:
+            buffer.sort(key=key, reverse=reverse)
+            runs.append(_write_run(buffer, tmpdir))
+            buffer = []
+
+    buffer.sort(key=key, reverse=reverse)
+
+    if len(runs) == 0:
+        yield from buffer
+        return
+
+    runs.append(_write_run(buffer, tmpdir))
+    del buffer
+
+    yield from merge(
+        *(_read_run(r) for r in runs),
+        key=key,
+        reverse=reverse
+    )
+    return
@@ -1,17 +1,46 @@
 """ Classes for reading and writing ffindex databases. """
 
+import os
 from os.path import split as psplit
 from os import makedirs
-from copy import deepcopy
 from shutil import copyfileobj
-from io import BytesIO
+from io import BytesIO, UnsupportedOperation
+from heapq import merge
+from hashlib import blake2b
+from bisect import bisect_left, bisect_right
+from array import array
+from collections import deque, OrderedDict
+from itertools import islice, accumulate, chain, groupby
+from concurrent.futures import ThreadPoolExecutor, Future
+from mmap import mmap, ACCESS_READ, ALLOCATIONGRANULARITY
 
 from typing import NamedTuple, Tuple
-from typing import Sequence, Iterator, List
-from typing import Dict
+from typing import Sequence, Iterable, Iterator, List
+from typing import Dict, Deque
 from typing import BinaryIO
 
-from typing import Union, Optional
+from typing import Union, Optional, Callable, Any, cast
+
+from ffdb.exceptions import FFKeyError
+from ffdb.sums import SumRow, SumSpool
+from ffdb.extsort import external_sort
+
+try:
+    from mmap import MADV_NORMAL, MADV_SEQUENTIAL, MADV_RANDOM
+    MADVICE: Dict[str, Optional[int]] = {
+        "normal": MADV_NORMAL,
+        "sequential": MADV_SEQUENTIAL,
+        "random": MADV_RANDOM,
+    }
+except ImportError:
+    # madvise isn't available on all platforms.
+    MADVICE = {"normal": None, "sequential": None, "random": None}
+
+# A document, or a piece of one, that can be written without copying it.
+Buffer = Union[bytes, bytearray, memoryview]
+
+# The number of new NumericFFIndex rows to sort at a time.
+SORT_BLOCK = 65536
 
 
 class IndexRow(NamedTuple):
@@ -52,8 +81,214 @@ class IndexRow(NamedTuple):
         ])
 
 
+class Layout(NamedTuple):
+    """ A summary of how the index rows are laid out in the ffdata file. """
+
+    data_size: int
+    live_bytes: int
+    holes: int
+    hole_bytes: int
+    overlaps: int
+    shared: int
+
+    @property
+    def reclaimable(self) -> int:
+        return self.data_size - self.live_bytes
+
+
+def coalesce_rows(
+    rows: Iterable[IndexRow],
+    gap: int = 0,
+) -> Iterator[Tuple[int, int, List[IndexRow]]]:
+    """ Group rows sorted by start into contiguous byte ranges.
+
+    Rows that overlap, or are separated by no more than `gap` bytes, are
+    put in the same group. Yields the start and end of each range, and the
+    rows within it.
+
+    Examples:
+    >>> rows = [IndexRow(b"a", 0, 5), IndexRow(b"b", 5, 5),
+    ...         IndexRow(b"c", 20, 5), IndexRow(b"d", 20, 5)]
+    >>> [(s, e, len(r)) for s, e, r in coalesce_rows(rows)]
+    [(0, 10, 2), (20, 25, 2)]
+    """
+
+    group: List[IndexRow] = []
+    group_start = 0
+    group_end = 0
+
+    for row in rows:
+        if len(group) > 0 and row.start > group_end + gap:
+            yield group_start, group_end, group
+            group = []
+
+        if len(group) == 0:
+            group_start = row.start
+            group_end = row.start + row.size
+        else:
+            group_end = max(group_end, row.start + row.size)
+
+        group.append(row)
+
+    if len(group) > 0:
+        yield group_start, group_end, group
+    return
+
+
+def chunk_rows(
+    rows: Iterable[IndexRow],
+    chunk_size: int,
+) -> Iterator[Tuple[int, int, List[IndexRow]]]:
+    """ Group rows sorted by start into chunks of about chunk_size bytes.
+
+    Documents aren't split between chunks, so a chunk can be bigger than
+    chunk_size if it has a single large document. Yields the start and end
+    of each chunk in the ffdata, and the rows within it.
+
+    Examples:
+    >>> rows = [IndexRow(b"a", 0, 5), IndexRow(b"b", 5, 5),
+    ...         IndexRow(b"c", 10, 5)]
+    >>> [(s, e, len(r)) for s, e, r in chunk_rows(rows, 8)]
+    [(0, 5, 1), (5, 10, 1), (10, 15, 1)]
+    >>> [(s, e, len(r)) for s, e, r in chunk_rows(rows, 10)]
+    [(0, 10, 2), (10, 15, 1)]
+    """
+
+    chunk: List[IndexRow] = []
+    chunk_start = 0
+    chunk_end = 0
+
+    for row in rows:
+        end = row.start + row.size
+        if len(chunk) > 0 and max(chunk_end, end) - chunk_start > chunk_size:
+            yield chunk_start, chunk_end, chunk
+            chunk = []
+
+        if len(chunk) == 0:
+            chunk_start = row.start
+            chunk_end = end
+        else:
+            chunk_end = max(chunk_end, end)
+
+        chunk.append(row)
+
+    if len(chunk) > 0:
+        yield chunk_start, chunk_end, chunk
+    return
+
+
+def rows_layout(
+    rows: Iterable[IndexRow],
+    data_size: Optional[int] = None,
+) -> Layout:
+    """ Find holes, overlaps and shared ranges from rows sorted by start.
+
+    See `FFIndex.layout`. The rows are only iterated over once, so they
+    can come from a file that is sorted on disk.
+    """
+
+    live_bytes = 0
+    holes = 0
+    hole_bytes = 0
+    overlaps = 0
+    shared = 0
+
+    end = 0
+    last: Optional[IndexRow] = None
+    for row in rows:
+        if last is not None and (row.start, row.size) == last[1:]:
+            shared += 1
+        elif row.start < end:
+            overlaps += 1
+        elif row.start > end:
+            holes += 1
+            hole_bytes += row.start - end
+
+        live_bytes += max(0, row.start + row.size - max(row.start, end))
+        end = max(end, row.start + row.size)
+        last = row
+
+    if data_size is None:
+        data_size = end
+    elif data_size > end:
+        holes += 1
+        hole_bytes += data_size - end
+
+    return Layout(
+        data_size,
+        live_bytes,
+        holes,
+        hole_bytes,
+        overlaps,
+        shared
+    )
+
+
+def write_index_rows(
+    rows: Iterable[IndexRow],
+    handle: BinaryIO,
+    offset: int = 0,
+) -> int:
+    """ Write rows to an .ffindex file in the order given.
+
+    `offset` is added to the start of each row as it is written.
+    """
+
+    length = 0
+    for ind in rows:
+        line = "{}\t{}\t{}\n".format(
+            ind.name.decode("utf-8"),
+            ind.start + offset,
+            ind.size
+        )
+        length += handle.write(line.encode())
+
+    return length
+
+
+def partition_of(name: bytes, npartitions: int) -> int:
+    """ Assign a name to a partition using a stable hash.
+
+    Unlike python's `hash`, this gives the same result every time.
+
+    Examples:
+    >>> partition_of(b"one", 4) == partition_of(b"one", 4)
+    True
+    >>> 0 <= partition_of(b"two", 4) < 4
+    True
+    """
+
+    digest = blake2b(name, digest_size=8).digest()
+    return int.from_bytes(digest, "little") % npartitions
+
+
+def partition_paths(template: str, name: str, index: int) -> Tuple[str, str]:
+    """ Get the ffdata and ffindex paths for a partition.
+
+    Creates any missing directories.
+    """
+
+    paths = []
+    for ext in ("ffdata", "ffindex"):
+        path = template.format(name=name, index=index, ext=ext)
+
+        dirname = psplit(path)[0]
+        if dirname != "":
+            makedirs(dirname, exist_ok=True)
+
+        paths.append(path)
+
+    return paths[0], paths[1]
+
+
 class FFIndex(object):
 
+    @staticmethod
+    def name_key(row: IndexRow) -> Any:
+        """ The sort key used to order rows by name when writing. """
+
+        return row.name
+
     def __init__(self, index: Optional[Sequence[IndexRow]] = None) -> None:
         """ Construct an ffindex given a list of index rows. """
 
@@ -107,14 +342,23 @@ class FFIndex(object):
 
         return cls(index=indices)
 
-    def append(self, value: IndexRow) -> None:
+    def append(self, value: IndexRow, start: Optional[int] = None) -> None:
+        """ Add a row to the end of the index.
+
+        By default the row is placed directly after the last row, ignoring
+        the start of the row provided. If `start` is given, that is used
+        instead.
+        """
+
         assert isinstance(value, IndexRow)
 
-        name, start, size = value
+        name, _, size = value
 
         assert name not in self
 
-        if len(self.index) > 0:
+        if start is not None:
+            pass
+        elif len(self.index) > 0:
             last_row = self.index[-1]
             last_end = last_row.start + last_row.size
             start = last_end
@@ -128,101 +372,1619 @@ class FFIndex(object):
         return
 
     def extend(self, values: Sequence[IndexRow]) -> int:
-        for value in values:
-            self.append(value)
-        return len(values)
+        """ Add rows to the end of the index, one directly after another.
+
+        Like `append`, the starts of the rows are ignored.
+        """
+
+        return self.extend_columns(
+            [v.name for v in values],
+            [v.size for v in values]
+        )
+
+    def extend_columns(
+        self,
+        names: Sequence[bytes],
+        sizes: Sequence[int],
+        start: Optional[int] = None,
+        starts: Optional[Sequence[int]] = None,
+    ) -> int:
+        """ Add many rows to the end of the index from names and sizes.
+
+        The rows are placed one directly after another, starting at `start`
+        or after the last row. The starts are computed in one pass, and the
+        names are checked for duplicates before anything is added.
+        If documents don't follow each other (e.g. when some share bytes),
+        give their `starts` instead.
+
+        Examples:
+        >>> index = FFIndex()
+        >>> index.extend_columns([b"a", b"b"], [5, 3], start=10)
+        2
+        >>> index.extend_columns([b"c"], [2])
+        1
+        >>> index[b"c"]
+        IndexRow(name=b'c', start=18, size=2)
+        """
+
+        assert len(names) == len(sizes)
+
+        if start is None and len(self.index) > 0:
+            last_row = self.index[-1]
+            start = last_row.start + last_row.size
+        elif start is None:
+            start = 0
+
+        self.check_new_names(names)
+
+        if starts is None:
+            # accumulate has no `initial` argument before python 3.8.
+            return self.append_rows(
+                map(
+                    IndexRow,
+                    names,
+                    accumulate(chain([start], sizes)),
+                    sizes
+                )
+            )
+
+        assert len(starts) == len(sizes)
+        return self.append_rows(map(IndexRow, names, starts, sizes))
+
+    def check_new_names(self, names: Iterable[bytes]) -> None:
+        """ Raise an FFKeyError if any names are repeated or already used.
+        """
+
+        snames = sorted(names)
+        for name, next_name in zip(snames, islice(snames, 1, None)):
+            if name == next_name:
+                raise FFKeyError(
+                    f"The key {name.decode()} is given more than once."
+                )
+
+        for name in snames:
+            if name in self:
+                raise FFKeyError(
+                    f"The key {name.decode()} is already in the index."
+                )
+        return
+
+    def write_to(
+        self,
+        handle: BinaryIO,
+        base: Optional[Iterable[IndexRow]] = None
+    ) -> int:
+        """ Write the index sorted by name.
+
+        If `base` is provided, it should yield rows that are already sorted
+        by name (e.g. a SortedFFIndex), and these will be merged with the
+        rows in this index while writing. Only the rows in this index need
+        to be sorted.
+        """
+
+        rows: Iterable[IndexRow] = sorted(self.index, key=self.name_key)
+        if base is not None:
+            rows = merge(base, rows, key=self.name_key)
+
+        return write_index_rows(rows, handle)
+
+    def layout(self, data_size: Optional[int] = None) -> Layout:
+        """ Find holes, overlaps and shared ranges in the ffdata file.
+
+        Only the index is needed for this. Bytes after the last document
+        only count as a hole if the `data_size` is given.
+
+        Examples:
+        >>> index = FFIndex([IndexRow(b"a", 0, 5), IndexRow(b"b", 8, 4),
+        ...                  IndexRow(b"c", 8, 4), IndexRow(b"d", 10, 4)])
+        >>> index.layout(20)
+        Layout(data_size=20, live_bytes=11, holes=2, hole_bytes=9, \
+overlaps=1, shared=1)
+        """
+
+        return rows_layout(self.index, data_size)
+
+    def append_rows(self, rows: Iterable[IndexRow]) -> int:
+        """ Add rows to the end of the index, keeping their starts.
+
+        The rows should come after any existing rows in the ffdata file.
+        """
+
+        nrows = len(self.index)
+        self.index.extend(rows)
+
+        for row in islice(self.index, nrows, None):
+            self.lookup[row.name] = row
+
+        if len(self.lookup) != len(self.index):
+            # Find out which names were the problem for the error message.
+            new_rows = self.index[nrows:]
+            del self.index[nrows:]
+            self.lookup = {r.name: r for r in self.index}
+            self.check_new_names(r.name for r in new_rows)
+
+        return len(self.index) - nrows
+
+    def view(
+        self,
+        lo: int = 0,
+        hi: Optional[int] = None,
+        offset: int = 0
+    ) -> "IndexView":
+        return IndexView(self.index, lo, hi, offset, self.name_key)
+
+    def empty_like(self) -> "FFIndex":
+        """ A new empty index using the same kind of names. """
+
+        return self.__class__()
+
+    def bump_starts(self, by: int = 0) -> "IndexView":
+        """ The index with `by` added to every start, without copying it. """
+
+        return self.view(offset=by)
+
+
+class IndexView(object):
+
+    def __init__(
+        self,
+        rows: Sequence[IndexRow],
+        lo: int = 0,
+        hi: Optional[int] = None,
+        offset: int = 0,
+        name_key: Callable[[IndexRow], Any] = FFIndex.name_key,
+    ) -> None:
+        """ A slice of a list of rows, with `offset` added to every start.
+
+        Nothing is copied when the view is created, and the offset is only
+        applied to rows as they are used (or while writing them out). This
+        makes it cheap to describe partitions of an index, or an index that
+        is being moved to a different place in the ffdata file.
+
+        Examples:
+        >>> rows = [IndexRow(b"a", 10, 5), IndexRow(b"b", 15, 3),
+        ...         IndexRow(b"c", 18, 2)]
+        >>> view = IndexView(rows, 1, offset=-15)
+        >>> list(view)
+        [IndexRow(name=b'b', start=0, size=3), \
+IndexRow(name=b'c', start=3, size=2)]
+        >>> view.rebase(100)[0]
+        IndexRow(name=b'b', start=100, size=3)
+        """
+
+        if hi is None:
+            hi = len(rows)
+
+        self.rows = rows
+        self.lo = lo
+        self.hi = hi
+        self.offset = offset
+        self.name_key = name_key
+        return
+
+    def __len__(self) -> int:
+        return self.hi - self.lo
+
+    def __getitem__(self, i: int) -> IndexRow:
+        if i < 0:
+            i += len(self)
+
+        if not (0 <= i < len(self)):
+            raise IndexError("IndexView index out of range")
+
+        name, start, size = self.rows[self.lo + i]
+        return IndexRow(name, start + self.offset, size)
+
+    def __iter__(self) -> Iterator[IndexRow]:
+        offset = self.offset
+        for name, start, size in islice(self.rows, self.lo, self.hi):
+            yield IndexRow(name, start + offset, size)
+        return
+
+    def names(self) -> Iterator[bytes]:
+        for row in islice(self.rows, self.lo, self.hi):
+            yield row.name
+        return
+
+    def rebase(self, by: int) -> "IndexView":
+        """ Another view of the same rows with `by` added to the offset. """
+
+        return self.__class__(
+            self.rows,
+            self.lo,
+            self.hi,
+            self.offset + by,
+            self.name_key
+        )
 
     def write_to(self, handle: BinaryIO) -> int:
-        length = 0
-        for ind in sorted(self.index, key=lambda x: x.name):
-            line = "{}\t{}\t{}\n".format(
-                ind.name.decode("utf-8"),
-                ind.start,
-                ind.size
+        """ Write the rows sorted by name, applying the offset as we go. """
+
+        rows = sorted(
+            islice(self.rows, self.lo, self.hi),
+            key=self.name_key
+        )
+        return write_index_rows(rows, handle, self.offset)
+
+
+def is_numeric_name(name: bytes) -> bool:
+    """ Check if a name is a plain non-negative integer, like MMseqs2 keys.
+
+    Names with leading zeros don't count, because they wouldn't be the
+    same when written back out.
+
+    Examples:
+    >>> is_numeric_name(b"10")
+    True
+    >>> is_numeric_name(b"010")
+    False
+    """
+
+    return name.isdigit() and (name == b"0" or not name.startswith(b"0"))
+
+
+class _NumericRows(Sequence[IndexRow]):
+    """ The rows of a NumericFFIndex in start order, built on demand. """
+
+    def __init__(self, index: "NumericFFIndex") -> None:
+        self._owner = index
+        return
+
+    def __len__(self) -> int:
+        return len(self._owner.keys)
+
+    def __getitem__(self, i):  # type: ignore
+        if isinstance(i, slice):
+            return [self._owner._row(j) for j in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+
+        if not (0 <= i < len(self)):
+            raise IndexError("index out of range")
+
+        return self._owner._row(i)
+
+    def __iter__(self) -> Iterator[IndexRow]:
+        for key, start, size in zip(
+            self._owner.keys,
+            self._owner.starts,
+            self._owner.sizes
+        ):
+            yield IndexRow(b"%d" % key, start, size)
+        return
+
+
+def _argsort(values: array, first: Sequence[int] = ()) -> array:
+    """ The positions of `values` in sorted order.
+
+    `first` should be the sorted positions of the values before the
+    `len(first)`th, if those are already known. The rest are sorted in
+    blocks of `SORT_BLOCK`, which are merged with `first`, so only a block
+    of positions is held as python ints at a time.
+
+    Examples:
+    >>> _argsort(array("I", [5, 1, 4, 2]), [1, 0])
+    array('Q', [1, 3, 2, 0])
+    """
+
+    runs: List[Iterable[int]] = [first]
+
+    for lo in range(len(first), len(values), SORT_BLOCK):
+        runs.append(array("Q", sorted(
+            range(lo, min(len(values), lo + SORT_BLOCK)),
+            key=values.__getitem__
+        )))
+
+    return array("Q", merge(*runs, key=values.__getitem__))
+
+
+class _SortedKeys(object):
+    """ The sorted part of a NumericFFIndex's keys, for bisect. """
+
+    def __init__(self, keys: array, order: Optional[array], n: int) -> None:
+        self.keys = keys
+        self.order = order
+        self.n = n
+        return
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, i: int) -> int:
+        if self.order is None:
+            return self.keys[i]
+        return self.keys[self.order[i]]
+
+
+class NumericFFIndex(FFIndex):
+
+    @staticmethod
+    def name_key(row: IndexRow) -> Any:
+        return int(row.name)
+
+    def __init__(self, index: Optional[Sequence[IndexRow]] = None) -> None:
+        """ An index where every name is a non-negative integer.
+
+        This is how MMseqs2 databases are keyed. The names are stored as
+        numbers in arrays, rather than as IndexRows with a lookup table,
+        which takes roughly a tenth of the memory. Names are still given and
+        returned as bytes, but rows are written in numeric order (which is
+        what MMseqs2 expects) rather than sorted as text.
+
+        Examples:
+        >>> index = NumericFFIndex([IndexRow(b"10", 0, 5),
+        ...                         IndexRow(b"2", 5, 3)])
+        >>> index[b"2"]
+        IndexRow(name=b'2', start=5, size=3)
+        >>> handle = BytesIO()
+        >>> _ = index.write_to(handle)
+        >>> handle.getvalue()
+        b'2\\t5\\t3\\n10\\t0\\t5\\n'
+        """
+
+        # Keys are stored as uint32 until one doesn't fit.
+        self.keys = array("I")
+        self.starts = array("Q")
+        self.sizes = array("Q")
+
+        # Positions of the rows sorted by key, None if they already are.
+        # Rows after `_nsorted` were added since by `append`, and are in
+        # `_tail`.
+        self._order: Optional[array] = None
+        self._nsorted = 0
+        self._tail: Dict[int, int] = {}
+
+        if index is not None:
+            self.append_rows(sorted(index, key=lambda x: x.start))
+        return
+
+    @property
+    def index(self) -> Sequence[IndexRow]:  # type: ignore
+        return _NumericRows(self)
+
+    @staticmethod
+    def _to_key(name: bytes) -> int:
+        if not is_numeric_name(name):
+            raise FFKeyError(
+                f"The name {name.decode()} isn't a numeric key."
             )
-            length += handle.write(line.encode())
+        return int(name)
 
-        return length
+    def _row(self, i: int) -> IndexRow:
+        return IndexRow(b"%d" % self.keys[i], self.starts[i], self.sizes[i])
 
-    def bump_starts(self, by: int = 0):
-        if by == 0:
-            return deepcopy(self)
+    def _add(self, key: int, start: int, size: int) -> None:
+        if key > 0xFFFFFFFF and self.keys.typecode == "I":
+            self.keys = array("Q", self.keys)
 
-        new_index: List[IndexRow] = []
-        for name, start, size in self.index:
-            new_index.append(IndexRow(name, start + by, size))
+        self.keys.append(key)
+        self.starts.append(start)
+        self.sizes.append(size)
+        return
 
-        # Construct a new object
-        return self.__class__(new_index)
+    def _sort(self) -> None:
+        """ Fold the recently added rows into the sorted order. """
 
+        keys = self.keys
+        n = len(keys)
+        nsorted = self._nsorted
 
-class FFData(object):
+        if self._order is None and all(
+            keys[i] <= keys[i + 1]
+            for i in range(max(0, nsorted - 1), n - 1)
+        ):
+            pass
+        else:
+            self._order = _argsort(
+                keys,
+                range(nsorted) if self._order is None else self._order
+            )
 
-    def __init__(self, handle: BinaryIO) -> None:
-        self.handle = handle
+        self._nsorted = n
+        self._tail = {}
         return
 
-    def __getitem__(
+    def _check_sorted_keys(self) -> None:
+        """ Raise an FFKeyError if a key is in the index more than once. """
+
+        keys = _SortedKeys(self.keys, self._order, self._nsorted)
+        previous = None
+        for i in range(len(keys)):
+            key = keys[i]
+            if key == previous:
+                raise FFKeyError(
+                    f"The name {key} is in the index more than once."
+                )
+            previous = key
+        return
+
+    def _find(self, name: bytes) -> Optional[int]:
+        """ Find the position of a row by name. """
+
+        if not is_numeric_name(name):
+            return None
+
+        key = int(name)
+        pos = self._tail.get(key, None)
+        if pos is not None:
+            return pos
+
+        keys = _SortedKeys(self.keys, self._order, self._nsorted)
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return i if self._order is None else self._order[i]
+
+        return None
+
+    def __getitem__(  # type: ignore
         self,
-        key: Union[IndexRow, List[IndexRow]]
-    ) -> Union[bytes, List[bytes]]:
+        key: Union[bytes, slice, int]
+    ) -> Union[IndexRow, List[IndexRow]]:
 
-        if isinstance(key, IndexRow):
-            name, start, size = key
-            self.handle.seek(start)
-            return self.handle.read(size)
+        if isinstance(key, int):
+            return self.index[key]
+        elif isinstance(key, slice):
+            return list(self.index[key])
+        elif isinstance(key, bytes):
+            pos = self._find(key)
+            if pos is None:
+                raise KeyError(key)
+            return self._row(pos)
+        else:
+            raise ValueError(
+                "Expected either a bytes, an int, or a slice."
+            )
 
-        elif isinstance(key, list):
-            records = []
-            for name, start, size in key:
-                self.handle.seek(start)
-                records.append(self.handle.read(size))
-            return records
+    def __contains__(self, key: bytes) -> bool:
+        return self._find(key) is not None
+
+    def __iter__(self) -> Iterator[IndexRow]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def from_file(cls, handle: BinaryIO) -> "NumericFFIndex":
+        index = read_index(handle, keys="numeric")
+        assert isinstance(index, cls)
+        return index
+
+    def append(self, value: IndexRow, start: Optional[int] = None) -> None:
+        assert isinstance(value, IndexRow)
+
+        name, _, size = value
+        key = self._to_key(name)
 
+        assert name not in self
+
+        if start is not None:
+            pass
+        elif len(self.keys) > 0:
+            start = self.starts[-1] + self.sizes[-1]
         else:
-            raise ValueError("Must be an IndexRow or a list of IndexRows")
+            start = 0
 
-    def append(self, b: bytes) -> int:
-        self.handle.seek(0, 2)  # Go to end of file.
-        assert b[-1:] == b"\0"
-        return self.handle.write(b)
+        self._tail[key] = len(self.keys)
+        self._add(key, start, size)
+
+        # Keep the tail small, so that it stays cheap to look in.
+        if len(self._tail) > max(1024, self._nsorted // 16):
+            self._sort()
+        return
+
+    def append_rows(self, rows: Iterable[IndexRow]) -> int:
+        """ Add many rows, sorting them into the index once at the end.
+
+        Examples:
+        >>> index = NumericFFIndex([IndexRow(b"3", 0, 2)])
+        >>> index.append_rows([IndexRow(b"1", 2, 2), IndexRow(b"3", 4, 2)])
+        Traceback (most recent call last):
+        ...
+        ffdb.exceptions.FFKeyError: The name 3 is in the index more than once.
+        >>> len(index), index[b"3"]
+        (1, IndexRow(name=b'3', start=0, size=2))
+        """
+
+        if len(self._tail) > 0:
+            self._sort()
+
+        n = len(self.keys)
+        old_keys = self.keys
+        old_order = self._order
+
+        try:
+            for name, start, size in rows:
+                self._add(self._to_key(name), start, size)
+
+            self._sort()
+            self._check_sorted_keys()
+        except FFKeyError:
+            # Leave the index as it was.
+            self.keys = old_keys
+            del self.keys[n:]
+            del self.starts[n:]
+            del self.sizes[n:]
+            self._order = old_order
+            self._nsorted = n
+            raise
+
+        return len(self.keys) - n
+
+    def write_to(
+        self,
+        handle: BinaryIO,
+        base: Optional[Iterable[IndexRow]] = None
+    ) -> int:
+        """ Write the index sorted numerically by name.
+
+        `base` should already be sorted numerically.
+        """
+
+        self._sort()
+        if self._order is None:
+            rows: Iterable[IndexRow] = iter(self.index)
+        else:
+            rows = (self._row(i) for i in self._order)
+
+        if base is not None:
+            rows = merge(base, rows, key=self.name_key)
+
+        return write_index_rows(rows, handle)
+
+
+def read_index(handle: Iterable[bytes], keys: str = "bytes") -> FFIndex:
+    """ Read an .ffindex file, using numeric keys if asked to.
+
+    `keys` can be 'bytes' to use an FFIndex, 'numeric' to use a
+    NumericFFIndex, or 'auto' to use a NumericFFIndex only if every name in
+    the file is a number. The file is only read once either way.
+    """
+
+    if keys == "bytes":
+        return FFIndex.from_file(cast(BinaryIO, handle))
+    elif keys not in ("numeric", "auto"):
+        raise ValueError(f"Unknown key type {keys}.")
+
+    index = NumericFFIndex()
+    ihandle = iter(handle)
+    for line in ihandle:
+        row = IndexRow.parse_ffindex_line(line)
+
+        if keys == "auto" and not is_numeric_name(row.name):
+            rows = list(index.index)
+            rows.append(row)
+            rows.extend(IndexRow.parse_ffindex_line(li) for li in ihandle)
+            return FFIndex(rows)
+
+        key = NumericFFIndex._to_key(row.name)
+        if key > 0xFFFFFFFF and index.keys.typecode == "I":
+            index.keys = array("Q", index.keys)
+
+        index.keys.append(key)
+        index.starts.append(row.start)
+        index.sizes.append(row.size)
+
+    # Rows are kept in the order of the ffdata file, like FFIndex.
+    starts = index.starts
+    if any(starts[i] > starts[i + 1] for i in range(len(starts) - 1)):
+        order = _argsort(starts)
+        index.keys = array(index.keys.typecode, (index.keys[i] for i in order))
+        index.starts = array("Q", (starts[i] for i in order))
+        index.sizes = array("Q", (index.sizes[i] for i in order))
+
+    index._sort()
+    index._check_sorted_keys()
+    return index
+
+
+class SortedFFIndex(object):
+
+    def __init__(self, buffer: Union[bytes, mmap]) -> None:
+        """ A read-only view of an .ffindex file that is sorted by name.
+
+        Lookups are binary searches over the raw bytes, so the rows are
+        only parsed as they are needed. This means that we can use huge
+        indices without loading them into memory.
+
+        Examples:
+        >>> index = SortedFFIndex(b"a\\t0\\t5\\nb\\t5\\t3\\nc\\t8\\t2\\n")
+        >>> index[b"b"]
+        IndexRow(name=b'b', start=5, size=3)
+        >>> b"d" in index
+        False
+        >>> len(index)
+        3
+        """
+
+        self.buffer = buffer
+        self._length: Optional[int] = None
+        return
+
+    @classmethod
+    def from_file(
+        cls,
+        handle: BinaryIO,
+        sort: bool = True
+    ) -> "SortedFFIndex":
+        """ Memory map an .ffindex file.
+
+        If the file isn't sorted by name (e.g. it has MMseqs2 style numeric
+        keys), the lines are sorted in memory instead.
+        If `sort` is False, this is skipped and it is up to the caller to
+        check `is_sorted` before doing any lookups.
+        """
+
+        handle.seek(0, 2)
+        if handle.tell() == 0:
+            return cls(b"")
+
+        buffer = mmap(handle.fileno(), 0, access=ACCESS_READ)
+        index = cls(buffer)
+
+        if sort and not index.is_sorted():
+            index = index.sorted_lines()
+
+        return index
+
+    def sorted_lines(self) -> "SortedFFIndex":
+        """ Sort the lines of an unsorted index in memory.
+
+        A memory mapped buffer is closed, so this index can't be used
+        afterwards.
+
+        Examples:
+        >>> index = SortedFFIndex(b"b\\t5\\t3\\na\\t0\\t5\\n").sorted_lines()
+        >>> index.buffer
+        b'a\\t0\\t5\\nb\\t5\\t3\\n'
+        """
+
+        lines = list(self._lines(0, len(self.buffer)))
+        lines.sort(key=lambda x: x.split(b"\t", 1)[0])
+
+        if isinstance(self.buffer, mmap):
+            self.buffer.close()
+
+        return type(self)(b"\n".join(lines) + b"\n")
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[IndexRow]) -> "SortedFFIndex":
+        """ Build a sorted index in memory from some rows. """
+
+        lines = sorted(rows, key=lambda r: r.name)
+        return cls(b"".join(bytes(r) + b"\n" for r in lines))
+
+    def _lines(self, lo: int, hi: int) -> Iterator[bytes]:
+        """ Yield the lines starting in the byte range lo-hi. """
+
+        while lo < hi:
+            end = self.buffer.find(b"\n", lo)
+            if end == -1:
+                end = len(self.buffer)
+
+            line = self.buffer[lo:end]
+            if len(line.strip()) > 0:
+                yield line
+
+            lo = end + 1
+        return
+
+    def _name_at(self, pos: int) -> Tuple[bytes, int]:
+        """ Get the name of the row starting at pos and the end of the line.
+        """
+
+        end = self.buffer.find(b"\n", pos)
+        if end == -1:
+            end = len(self.buffer)
+
+        name = self.buffer[pos:end].split(b"\t", 1)[0]
+        return name, end
+
+    def _bisect(self, before: Callable[[bytes], bool]) -> int:
+        """ Find the offset of the first row where `before(name)` is False.
+
+        `before` must be True for a block of rows at the start of the
+        index and False for the rest.
+        """
+
+        lo = 0
+        hi = len(self.buffer)
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.buffer.rfind(b"\n", lo, mid) + 1
+            if start == 0:
+                start = lo
+
+            this_name, end = self._name_at(start)
+            if before(this_name):
+                lo = end + 1
+            else:
+                hi = start
+
+        return min(lo, len(self.buffer))
+
+    def bisect_left(self, name: bytes) -> int:
+        """ Find the offset of the first row with a name >= `name`. """
+
+        return self._bisect(lambda n: n < name)
+
+    def bisect_right(self, name: bytes) -> int:
+        """ Find the offset of the first row with a name > `name`. """
+
+        return self._bisect(lambda n: n <= name)
+
+    def prefix_span(self, prefix: bytes) -> Tuple[int, int]:
+        """ Find the byte range of rows with names starting with prefix.
+
+        Examples:
+        >>> index = SortedFFIndex(
+        ...     b"a1\\t0\\t1\\nb1\\t1\\t1\\nb2\\t2\\t1\\nc\\t3\\t1\\n"
+        ... )
+        >>> lo, hi = index.prefix_span(b"b")
+        >>> [r.name for r in index.rows(lo, hi)]
+        [b'b1', b'b2']
+        """
+
+        lo = self.bisect_left(prefix)
+        hi = self._bisect(lambda n: n < prefix or n.startswith(prefix))
+        return lo, hi
+
+    def range_span(self, first: bytes, last: bytes) -> Tuple[int, int]:
+        """ Find the byte range of rows with names from first to last.
+
+        Both ends are included.
+        """
+
+        return self.bisect_left(first), self.bisect_right(last)
+
+    def align(self, pos: int) -> int:
+        """ Find the first row starting at or after pos. """
+
+        if pos <= 0:
+            return 0
+
+        end = self.buffer.find(b"\n", pos - 1)
+        if end == -1:
+            return len(self.buffer)
+        return end + 1
+
+    def rows(
+        self,
+        lo: int = 0,
+        hi: Optional[int] = None
+    ) -> Iterator[IndexRow]:
+        """ Iterate over the rows starting in the byte range lo-hi. """
+
+        if hi is None:
+            hi = len(self.buffer)
+
+        for line in self._lines(lo, hi):
+            yield IndexRow.parse_ffindex_line(line)
+        return
+
+    def line_at(self, pos: int) -> Tuple[bytes, bytes]:
+        """ Get the name and the whole line of the row starting at pos. """
+
+        name, end = self._name_at(pos)
+        return name, self.buffer[pos:end]
+
+    def __getitem__(self, key: bytes) -> IndexRow:
+        pos = self.bisect_left(key)
+        name, line = self.line_at(pos)
+
+        if name != key or pos >= len(self.buffer):
+            raise KeyError(key)
+
+        return IndexRow.parse_ffindex_line(line)
+
+    def __contains__(self, key: bytes) -> bool:
+        pos = self.bisect_left(key)
+        return pos < len(self.buffer) and self._name_at(pos)[0] == key
+
+    def __iter__(self) -> Iterator[IndexRow]:
+        return self.rows()
+
+    def __len__(self) -> int:
+        if self._length is None:
+            self._length = sum(1 for _ in self._lines(0, len(self.buffer)))
+        return self._length
+
+    def is_sorted(self) -> bool:
+        last = None
+        for line in self._lines(0, len(self.buffer)):
+            name = line.split(b"\t", 1)[0]
+            if last is not None and name < last:
+                return False
+            last = name
+        return True
+
+
+class FFData(object):
+
+    def __init__(self, handle: BinaryIO) -> None:
+        self.handle = handle
+
+        # The offset that the next appended document will be written to.
+        # We track this ourselves so that we only need to seek when
+        # a read has moved the handle.
+        self._end: Optional[int] = None
+        self._at_end = False
+        return
+
+    @property
+    def end(self) -> int:
+        """ The offset that the next appended document will start at. """
+
+        if self._end is None:
+            self._end = self.handle.seek(0, 2)
+            self._at_end = True
+        return self._end
+
+    def __getitem__(
+        self,
+        key: Union[IndexRow, List[IndexRow]]
+    ) -> Union[bytes, List[bytes]]:
+
+        self._at_end = False
+
+        if isinstance(key, IndexRow):
+            name, start, size = key
+            self.handle.seek(start)
+            return self.handle.read(size)
+
+        elif isinstance(key, list):
+            records = []
+            for name, start, size in key:
+                self.handle.seek(start)
+                records.append(self.handle.read(size))
+            return records
+
+        else:
+            raise ValueError("Must be an IndexRow or a list of IndexRows")
+
+    def will_need(self, rows: Iterable[IndexRow]) -> None:
+        """ Hint to the OS that these rows will be read soon.
+
+        This lets the kernel start reading them in the background.
+        It does nothing if the handle isn't a real file, or the platform
+        doesn't support posix_fadvise.
+        """
+
+        if not hasattr(os, "posix_fadvise"):
+            return
+
+        try:
+            fileno = self.handle.fileno()
+        except (AttributeError, OSError, UnsupportedOperation):
+            return
+
+        rows = sorted(rows, key=lambda r: r.start)
+        for start, end, _ in coalesce_rows(rows):
+            os.posix_fadvise(
+                fileno,
+                start,
+                end - start,
+                os.POSIX_FADV_WILLNEED
+            )
+        return
+
+    def append(self, b: bytes) -> int:
+        assert b[-1:] == b"\0"
+
+        end = self.end
+        if not self._at_end:
+            self.handle.seek(end)
+            self._at_end = True
+
+        written = self.handle.write(b)
+        self._end = end + written
+        return written
+
+    def append_file(self, other: "FFData") -> int:
+        """ Copy the whole of another ffdata file onto the end of this one.
+        """
+
+        end = self.end
+        if not self._at_end:
+            self.handle.seek(end)
+
+        other.write_to(self.handle)
+        self._end = self.handle.tell()
+        self._at_end = True
+        return self._end - end
+
+    def write_to(self, handle: BinaryIO) -> None:
+        self._at_end = False
+        self.handle.seek(0)
+        copyfileobj(self.handle, handle)
+        return
+
+    def write_sized(self, start: int, size: int, handle: BinaryIO) -> int:
+        self._at_end = False
+        self.handle.seek(start)
+        return handle.write(self.handle.read(size))
+
+    def copy_range(
+        self,
+        start: int,
+        size: int,
+        handle: BinaryIO,
+        buffer_size: int = 16 * 1024 * 1024,
+    ) -> int:
+        """ Like write_sized but copies in pieces of at most buffer_size.
+        """
+
+        self._at_end = False
+
+        written = 0
+        while written < size:
+            self.handle.seek(start + written)
+            chunk = self.handle.read(min(buffer_size, size - written))
+            if len(chunk) == 0:
+                break
+            written += handle.write(chunk)
+
+        return written
+
+    def append_range(
+        self,
+        other: "FFData",
+        start: int,
+        size: int,
+        buffer_size: int = 16 * 1024 * 1024,
+    ) -> int:
+        """ Copy a byte range from another ffdata file onto the end. """
+
+        end = self.end
+        if not self._at_end:
+            self.handle.seek(end)
+
+        written = other.copy_range(start, size, self.handle, buffer_size)
+        self._end = end + written
+        self._at_end = True
+        return written
+
+    def truncate(self, size: int) -> None:
+        self.handle.truncate(size)
+        self._end = size
+        self._at_end = False
+        return
+
+    def move_range(
+        self,
+        start: int,
+        size: int,
+        to: int,
+        buffer_size: int = 16 * 1024 * 1024,
+    ) -> int:
+        """ Move bytes towards the start of this file.
+
+        Because `to` is before `start`, copying forward in pieces never
+        overwrites anything that we haven't copied yet, so this only needs
+        `buffer_size` bytes of memory.
+        """
+
+        assert to <= start
+        self._at_end = False
+
+        moved = 0
+        while moved < size:
+            self.handle.seek(start + moved)
+            chunk = self.handle.read(min(buffer_size, size - moved))
+            if len(chunk) == 0:
+                break
+
+            self.handle.seek(to + moved)
+            moved += self.handle.write(chunk)
+
+        return moved
+
+
+class MappedFFData(FFData):
+
+    def __init__(
+        self,
+        handle: BinaryIO,
+        window_size: int = 64 * 1024 * 1024,
+        max_memory: int = 1024 * 1024 * 1024,
+        advice: str = "normal",
+    ) -> None:
+        """ A read-only ffdata file, read through memory mapped windows.
+
+        At most `max_memory` bytes of the file are mapped at any time, in
+        windows of `window_size` bytes. The least recently used window is
+        unmapped when we need a new one. Documents larger than a window
+        are read with regular file reads instead.
+
+        `advice` is given to madvise for each window, and can be 'normal',
+        'sequential', or 'random'. Use 'sequential' if documents are read
+        in file order, and 'random' otherwise so that the kernel doesn't
+        read ahead pages that we won't use.
+
+        The handle only needs to be opened for reading.
+        """
+
+        super().__init__(handle)
+
+        if advice not in MADVICE:
+            raise ValueError(f"Unknown madvise option {advice}.")
+
+        # mmap offsets must be a multiple of the allocation granularity.
+        window_size -= window_size % ALLOCATIONGRANULARITY
+        self.window_size = max(ALLOCATIONGRANULARITY, window_size)
+        self.max_windows = max(1, max_memory // self.window_size)
+        self.advice = advice
+
+        self.windows: "OrderedDict[int, mmap]" = OrderedDict()
+        return
+
+    def _window(self, i: int) -> mmap:
+        """ Get the i'th window, mapping it if necessary. """
+
+        window = self.windows.get(i, None)
+        if window is not None:
+            self.windows.move_to_end(i)
+            return window
+
+        while len(self.windows) >= self.max_windows:
+            _, old = self.windows.popitem(last=False)
+            old.close()
+
+        offset = i * self.window_size
+        window = mmap(
+            self.handle.fileno(),
+            min(self.window_size, self.end - offset),
+            access=ACCESS_READ,
+            offset=offset,
+        )
+
+        advice = MADVICE[self.advice]
+        if advice is not None:
+            window.madvise(advice)
+
+        self.windows[i] = window
+        return window
+
+    def read(self, start: int, size: int) -> bytes:
+        """ Read a range of bytes from the file. """
+
+        end = min(start + size, self.end)
+        if end <= start:
+            return b""
+
+        if (end - start) > self.window_size:
+            self._at_end = False
+            self.handle.seek(start)
+            return self.handle.read(end - start)
+
+        first = start // self.window_size
+        last = (end - 1) // self.window_size
+
+        pieces = []
+        for i in range(first, last + 1):
+            offset = i * self.window_size
+            window = self._window(i)
+            pieces.append(window[max(start - offset, 0):end - offset])
+
+        if len(pieces) == 1:
+            return pieces[0]
+        else:
+            return b"".join(pieces)
+
+    def __getitem__(
+        self,
+        key: Union[IndexRow, List[IndexRow]]
+    ) -> Union[bytes, List[bytes]]:
+
+        if isinstance(key, IndexRow):
+            return self.read(key.start, key.size)
+
+        elif isinstance(key, list):
+            return [self.read(start, size) for _, start, size in key]
+
+        else:
+            raise ValueError("Must be an IndexRow or a list of IndexRows")
+
+    def write_to(self, handle: BinaryIO) -> None:
+        self.copy_range(0, self.end, handle)
+        return
+
+    def write_sized(self, start: int, size: int, handle: BinaryIO) -> int:
+        return handle.write(self.read(start, size))
+
+    def copy_range(
+        self,
+        start: int,
+        size: int,
+        handle: BinaryIO,
+        buffer_size: int = 16 * 1024 * 1024,
+    ) -> int:
+        buffer_size = min(buffer_size, self.window_size)
+
+        written = 0
+        while written < size:
+            chunk_size = min(buffer_size, size - written)
+            chunk = self.read(start + written, chunk_size)
+            if len(chunk) == 0:
+                break
+            written += handle.write(chunk)
+
+        return written
+
+    def close(self) -> None:
+        """ Unmap all of the windows. This doesn't close the handle. """
+
+        while len(self.windows) > 0:
+            _, window = self.windows.popitem()
+            window.close()
+        return
+
+
+class FFDataWriter(object):
+
+    def __init__(
+        self,
+        handle: BinaryIO,
+        offset: Optional[int] = None,
+        buffer_size: int = 1024 * 1024,
+    ) -> None:
+        """ Write documents to an ffdata file through one large buffer.
+
+        The offset of the next document is tracked here, so we never need
+        to seek. Small documents are gathered until we have `buffer_size`
+        bytes, and are written together with a single scatter write, so
+        neither the null terminators nor the documents need to be copied.
+        Each write returns the IndexRow for the document.
+
+        `offset` is where the handle currently is in the file, by default
+        this is taken from `handle.tell()`. Remember to call `flush` (or use
+        this as a context manager) when you're done.
+
+        Examples:
+        >>> handle = BytesIO()
+        >>> with FFDataWriter(handle) as writer:
+        ...     writer.write(b"one", b"ATG")
+        ...     writer.write_parts(b"two", [b"A", b"\\n", b"T"])
+        IndexRow(name=b'one', start=0, size=4)
+        IndexRow(name=b'two', start=4, size=4)
+        >>> handle.getvalue()
+        b'ATG\\x00A\\nT\\x00'
+        """
+
+        self.handle = handle
+
+        if offset is None:
+            offset = handle.tell()
+
+        self.offset = offset
+        self.buffer_size = buffer_size
+
+        self.pending: List[Buffer] = []
+        self.pending_size = 0
+
+        try:
+            self.fileno: Optional[int] = handle.fileno()
+        except (AttributeError, OSError, UnsupportedOperation):
+            self.fileno = None
+        return
+
+    def __enter__(self) -> "FFDataWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.flush()
+        return
+
+    def write(
+        self,
+        name: bytes,
+        document: Buffer
+    ) -> IndexRow:
+        """ Add a document, adding the null terminator if it's missing. """
+
+        return self.write_parts(name, [document])
+
+    def write_parts(
+        self,
+        name: bytes,
+        parts: Sequence[Buffer]
+    ) -> IndexRow:
+        """ Add a document made of several pieces, without joining them.
+        """
+
+        for part in parts:
+            self.pending.append(part)
+            self.pending_size += len(part)
+
+        size = sum(len(p) for p in parts)
+        if size == 0 or parts[-1][-1:] != b"\0":
+            self.pending.append(b"\0")
+            self.pending_size += 1
+            size += 1
+
+        row = IndexRow(name, self.offset, size)
+        self.offset += size
+
+        if self.pending_size >= self.buffer_size:
+            self.flush()
+
+        return row
+
+    def flush(self) -> None:
+        """ Write out any buffered documents. """
+
+        if self.pending_size == 0:
+            return
+
+        if self.fileno is None or not hasattr(os, "writev"):
+            self.handle.write(b"".join(self.pending))
+        else:
+            # Anything buffered in the python file object must go first.
+            self.handle.flush()
+            _writev(self.fileno, self.pending)
+
+        self.pending = []
+        self.pending_size = 0
+        return
+
+
+def _writev(fileno: int, parts: List[Buffer]) -> None:
+    """ Write all of the parts to a file, handling short writes. """
+
+    try:
+        max_parts = os.sysconf("SC_IOV_MAX")
+    except (AttributeError, ValueError, OSError):
+        max_parts = 1024
+
+    views: Deque[memoryview] = deque(memoryview(p) for p in parts if p)
+    while len(views) > 0:
+        written = os.writev(fileno, list(islice(views, max_parts)))
+
+        while written > 0:
+            if written >= len(views[0]):
+                written -= len(views.popleft())
+            else:
+                views[0] = views[0][written:]
+                written = 0
+    return
+
+
+def prefetch(
+    data: FFData,
+    rows: Iterable[IndexRow],
+    lookahead: int = 256,
+    background: bool = False,
+) -> Iterator[Tuple[IndexRow, bytes]]:
+    """ Read documents in the order given, asking for upcoming ones early.
+
+    The next `lookahead` rows are passed to `will_need` while the current
+    ones are being used. If `background` is True, the next chunk of
+    documents is also read on a thread, so that reads overlap with
+    whatever the caller is doing with the current chunk (e.g. writing it).
+    This holds up to 2 * `lookahead` documents in memory.
+    Nothing else should use `data` while this is running.
+
+    Examples:
+    >>> db = FFDB.new()
+    >>> db.extend([b"one\\0", b"two\\0"], [b"a", b"b"])
+    8
+    >>> [d for _, d in prefetch(db.data, db.index, lookahead=1)]
+    [b'one\\x00', b'two\\x00']
+    """
+
+    def read(chunk: List[IndexRow]) -> List[Tuple[IndexRow, bytes]]:
+        documents = data[chunk]
+        assert isinstance(documents, list)
+        return list(zip(chunk, documents))
+
+    irows = iter(rows)
+    chunk = list(islice(irows, lookahead))
+    data.will_need(chunk)
+
+    if not background:
+        while len(chunk) > 0:
+            next_chunk = list(islice(irows, lookahead))
+            data.will_need(next_chunk)
+
+            yield from read(chunk)
+            chunk = next_chunk
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending: Optional[Future[List[Tuple[IndexRow, bytes]]]] = (
+            executor.submit(read, chunk)
+        )
+
+        while pending is not None:
+            next_chunk = list(islice(irows, lookahead))
+            data.will_need(next_chunk)
+
+            documents = pending.result()
+            if len(next_chunk) > 0:
+                pending = executor.submit(read, next_chunk)
+            else:
+                pending = None
+
+            yield from documents
+    return
+
+
+class DedupTable(object):
+
+    # Roughly how many bytes each remembered document takes in the table.
+    ENTRY_SIZE = 200
+
+    def __init__(self, max_memory: int = 256 * 1024 * 1024) -> None:
+        """ Remember where documents were written, so copies can share them.
+
+        Documents are looked up by a 16 byte digest of their contents
+        (including the null terminator) and their size. Once the table holds
+        about `max_memory` bytes, the least recently used documents are
+        forgotten, so later copies of those are written again. The ffindex
+        format allows several rows to point at the same bytes, so this
+        doesn't change how the database is read.
+
+        Examples:
+        >>> dedup = DedupTable()
+        >>> handle = BytesIO()
+        >>> with FFDataWriter(handle) as writer:
+        ...     dedup.write(writer, b"a", b"one")
+        ...     dedup.write(writer, b"b", b"two\\0")
+        ...     dedup.write(writer, b"c", b"one\\0")
+        IndexRow(name=b'a', start=0, size=4)
+        IndexRow(name=b'b', start=4, size=4)
+        IndexRow(name=b'c', start=0, size=4)
+        >>> (dedup.hits, dedup.saved_bytes)
+        (1, 4)
+        """
+
+        self.max_entries = max(1, max_memory // self.ENTRY_SIZE)
+        self.table: "OrderedDict[bytes, Tuple[int, int]]" = OrderedDict()
+
+        self.hits = 0
+        self.saved_bytes = 0
+        return
+
+    @classmethod
+    def key(cls, document: Buffer) -> Tuple[bytes, int]:
+        """ The digest and size of a document, once it is null terminated.
+        """
+
+        return cls.key_parts([document])
+
+    @staticmethod
+    def key_parts(parts: Sequence[Buffer]) -> Tuple[bytes, int]:
+        """ Like `key`, for a document in several pieces (see
+        `FFDataWriter.write_parts`).
+
+        Examples:
+        >>> DedupTable.key_parts([b"on", b"e"]) == DedupTable.key(b"one\\0")
+        True
+        """
+
+        hasher = blake2b(digest_size=16)
+        size = 0
+
+        for part in parts:
+            hasher.update(part)
+            size += len(part)
+
+        if size == 0 or parts[-1][-1:] != b"\0":
+            hasher.update(b"\0")
+            size += 1
+
+        return hasher.digest(), size
+
+    def get(self, key: Tuple[bytes, int]) -> Optional[int]:
+        """ Find the start of an identical document, if we have one. """
+
+        digest, size = key
+        found = self.table.get(digest, None)
+
+        if found is None or found[1] != size:
+            return None
+
+        self.table.move_to_end(digest)
+        self.hits += 1
+        self.saved_bytes += size
+        return found[0]
+
+    def add(self, key: Tuple[bytes, int], start: int) -> None:
+        digest, size = key
+        self.table[digest] = (start, size)
+
+        if len(self.table) > self.max_entries:
+            self.table.popitem(last=False)
+        return
+
+    def write(
+        self,
+        writer: FFDataWriter,
+        name: bytes,
+        document: Buffer
+    ) -> IndexRow:
+        """ Write a document, unless an identical one was already written.
+        """
+
+        return self.write_parts(writer, name, [document])
+
+    def write_parts(
+        self,
+        writer: FFDataWriter,
+        name: bytes,
+        parts: Sequence[Buffer]
+    ) -> IndexRow:
+        """ Like `write`, for a document in several pieces. """
+
+        key = self.key_parts(parts)
+        start = self.get(key)
+
+        if start is not None:
+            return IndexRow(name, start, key[1])
+
+        row = writer.write_parts(name, parts)
+        self.add(key, row.start)
+        return row
+
+
+class FFDB(object):
+
+    def __init__(
+        self,
+        data: FFData,
+        index: FFIndex,
+        base: Optional[SortedFFIndex] = None,
+    ) -> None:
+        """ Construct an ffindex database.
+
+        `base` is the existing index of a database opened with
+        `open_append`. In that case `index` only holds the new rows.
+        """
+
+        self.data: FFData = data
+        self.index: FFIndex = index
+        self.base: Optional[SortedFFIndex] = base
+
+        # Digests of the documents added, if `record_sums` was called.
+        self.sums: Optional[SumSpool] = None
+
+        # Where documents were written, if `dedup_documents` was called.
+        self.dedup: Optional[DedupTable] = None
+        return
+
+    def dedup_documents(self, max_memory: int = 256 * 1024 * 1024) -> None:
+        """ Store documents identical to ones added earlier only once.
+
+        Index rows for the copies point at the bytes of the first one.
+        See `DedupTable` for how `max_memory` is used.
+
+        Examples:
+        >>> db = FFDB.new()
+        >>> db.dedup_documents()
+        >>> db.extend([b"one\\0", b"two\\0", b"one\\0"], [b"a", b"b", b"c"])
+        8
+        >>> db.index[b"c"]
+        IndexRow(name=b'c', start=0, size=4)
+        >>> db[b"c"]
+        b'one\\x00'
+        """
+
+        self.dedup = DedupTable(max_memory)
+        return
+
+    def _store(self, document: bytes) -> Tuple[int, int]:
+        """ Add a null terminated document to the end of the ffdata.
+
+        If dedup is on and an identical document was already added, nothing
+        is written. Returns the start of the document, and the number of
+        bytes written.
+        """
+
+        if self.dedup is None:
+            start = self.data.end
+            return start, self.data.append(document)
+
+        key = self.dedup.key(document)
+        start_ = self.dedup.get(key)
+        if start_ is not None:
+            return start_, 0
+
+        start = self.data.end
+        self.dedup.add(key, start)
+        return start, self.data.append(document)
+
+    def record_sums(self, tmpdir: Optional[str] = None) -> None:
+        """ Keep a digest of each document added from now on.
+
+        Use `write_sums_to` to write them out as a sidecar file.
+
+        Examples:
+        >>> from ffdb.sums import read_sums
+        >>> db = FFDB.new()
+        >>> db.record_sums()
+        >>> db.extend([b"one\\0", b"two\\0"], [b"b", b"a"])
+        8
+        >>> handle = BytesIO()
+        >>> _ = db.write_sums_to(handle)
+        >>> _ = handle.seek(0)
+        >>> [r.name for r in read_sums(handle)]
+        [b'a', b'b']
+        """
 
-    def write_to(self, handle: BinaryIO) -> None:
-        self.handle.seek(0)
-        copyfileobj(self.handle, handle)
+        self.sums = SumSpool(tmpdir)
         return
 
-    def write_sized(self, start: int, size: int, handle: BinaryIO) -> int:
-        self.handle.seek(start)
-        return handle.write(self.handle.read(size))
+    def write_sums_to(
+        self,
+        handle: BinaryIO,
+        base: Optional[Iterable[SumRow]] = None,
+        buffer_size: int = 1000000,
+    ) -> int:
+        """ Write the recorded digests as a sidecar file.
 
+        For a database opened with `open_append`, `base` should be the
+        sidecar of the existing documents. If it isn't given, the existing
+        documents are read to compute their digests.
+        """
 
-class FFDB(object):
+        if self.sums is None:
+            raise ValueError("Digests weren't recorded for this database.")
 
-    def __init__(self, data: FFData, index: FFIndex) -> None:
-        self.data: FFData = data
-        self.index: FFIndex = index
-        return
+        if self.base is not None and base is None:
+            for row, document in prefetch(self.data, self.base):
+                self.sums.add(row.name, document)
+
+        return self.sums.write_to(handle, base, buffer_size)
 
     @classmethod
     def from_file(
         cls,
         data_handle: BinaryIO,
-        index_handle: BinaryIO
+        index_handle: BinaryIO,
+        keys: str = "bytes",
     ) -> "FFDB":
+        """ Open a database, see `read_index` for the `keys` options. """
+
         data = FFData(data_handle)
-        index = FFIndex.from_file(index_handle)
+        index = read_index(index_handle, keys)
         return cls(data, index)
 
     @classmethod
-    def new(cls, data_handle: Optional[BinaryIO] = None) -> "FFDB":
+    def new(
+        cls,
+        data_handle: Optional[BinaryIO] = None,
+        index: Optional[FFIndex] = None,
+    ) -> "FFDB":
         if data_handle is None:
             data_handle = BytesIO()
 
+        if index is None:
+            index = FFIndex()
+
         data = FFData(data_handle)
-        index = FFIndex()
         return cls(data, index)
 
+    @classmethod
+    def open_append(
+        cls,
+        data_handle: BinaryIO,
+        index_handle: BinaryIO
+    ) -> "FFDB":
+        """ Open an existing database to add new documents to.
+
+        The data_handle should be opened for reading and writing
+        (e.g. 'r+b'). New documents are written after the end of the
+        existing ffdata, and only the new index rows are held in memory.
+        The existing index is memory mapped and searched in place.
+
+        Use `write_index_to` to write the full merged index.
+        """
+
+        base = SortedFFIndex.from_file(index_handle)
+        return cls(FFData(data_handle), FFIndex(), base=base)
+
     @classmethod
     def reorder_from(
         cls,
@@ -231,7 +1993,7 @@ class FFDB(object):
         order: Optional[Sequence[IndexRow]] = None,
     ) -> "FFDB":
 
-        new = cls.new(data_handle)
+        new = cls.new(data_handle, other.index.empty_like())
 
         if order is None:
             indices: List[IndexRow] = sorted(
@@ -245,19 +2007,108 @@ class FFDB(object):
         new.extend_from(other, indices)
         return new
 
+    @classmethod
+    def compact_from(
+        cls,
+        other: "FFDB",
+        data_handle: BinaryIO,
+        order: Optional[Sequence[IndexRow]] = None,
+        buffer_size: int = 16 * 1024 * 1024,
+    ) -> "FFDB":
+        """ Copy only the parts of the ffdata that are used by the index.
+
+        Without an order, the live byte ranges are copied in the order that
+        they appear in the file, with neighbouring documents copied together.
+        Otherwise documents are written in the order given.
+        Documents sharing the same range are still shared in the output.
+        """
+
+        new = cls.new(data_handle, other.index.empty_like())
+
+        if order is None:
+            for start, end, rows in coalesce_rows(other.index):
+                offset = new.data.end
+                for row in rows:
+                    new.index.append(row, start=offset + row.start - start)
+
+                new.data.append_range(
+                    other.data,
+                    start,
+                    end - start,
+                    buffer_size
+                )
+            return new
+
+        written_ranges: Dict[Tuple[int, int], int] = {}
+        for row in order:
+            new_start = written_ranges.get((row.start, row.size), None)
+            if new_start is not None:
+                new.index.append(row, start=new_start)
+                continue
+
+            new_start = new.data.end
+            new.index.append(row, start=new_start)
+            new.data.append_range(other.data, row.start, row.size, buffer_size)
+            written_ranges[(row.start, row.size)] = new_start
+
+        return new
+
+    def compact(self, buffer_size: int = 16 * 1024 * 1024) -> int:
+        """ Remove unused parts of the ffdata file in place.
+
+        The data handle must be open for reading and writing.
+        Returns the new size of the ffdata file.
+        """
+
+        new_index = self.index.empty_like()
+        offset = 0
+
+        for start, end, rows in coalesce_rows(self.index):
+            for row in rows:
+                new_index.append(row, start=offset + row.start - start)
+
+            offset += self.data.move_range(
+                start,
+                end - start,
+                offset,
+                buffer_size
+            )
+
+        self.data.truncate(offset)
+        self.index = new_index
+        return offset
+
     def __getitem__(
         self,
         key: Union[bytes, slice, int]
     ) -> Union[bytes, List[bytes]]:
-        indices = self.index[key]
+        if (
+            self.base is not None and
+            isinstance(key, bytes) and
+            key not in self.index
+        ):
+            indices: Union[IndexRow, List[IndexRow]] = self.base[key]
+        else:
+            indices = self.index[key]
         return self.data[indices]
 
     def __contains__(self, key: bytes) -> bool:
+        if self.base is not None and key in self.base:
+            return True
         return key in self.index
 
     def __len__(self) -> int:
+        if self.base is not None:
+            return len(self.base) + len(self.index)
         return len(self.index)
 
+    def _check_new_key(self, key: bytes) -> None:
+        if key in self.index or (self.base is not None and key in self.base):
+            raise FFKeyError(
+                f"The key {key.decode()} is already in the database."
+            )
+        return
+
     def append_from(
         self,
         data: "FFDB",
@@ -276,50 +2127,107 @@ class FFDB(object):
         to_write = data.data[this_key]
         assert isinstance(to_write, bytes)
 
-        self.index.append(this_key)
-        return self.data.append(to_write)
+        return self._append_document(this_key, to_write)
+
+    def _append_document(self, key: IndexRow, document: bytes) -> int:
+        self._check_new_key(key.name)
+        start, written = self._store(document)
+        self.index.append(key, start=start)
+
+        if self.sums is not None:
+            self.sums.add(key.name, document)
+
+        return written
+
+    def _lookup_rows(
+        self,
+        keys: Iterable[Union[bytes, int, IndexRow]]
+    ) -> Iterator[IndexRow]:
+        """ Look up keys one at a time, passing IndexRows through. """
+
+        for k in keys:
+            if isinstance(k, IndexRow):
+                yield k
+            else:
+                ir = self.index[k]
+                assert isinstance(ir, IndexRow)
+                yield ir
+        return
 
     def extend_from(
         self,
         data: "FFDB",
-        keys: Union[None, slice, Sequence[Union[bytes, int, IndexRow]]]
+        keys: Union[None, slice, Iterable[Union[bytes, int, IndexRow]]],
+        lookahead: int = 256,
+        background: bool = True,
     ) -> int:
+        """ Append many documents from another database.
+
+        Documents are read ahead while earlier ones are being written,
+        see `prefetch`.
+        """
 
+        indices: Iterable[IndexRow]
         if isinstance(keys, slice):
-            indices: Union[IndexRow, List[IndexRow]] = data.index[keys]
+            sliced = data.index[keys]
+            assert isinstance(sliced, list)
+            indices = sliced
         elif keys is None:
-            indices = data.index.index
+            # Only the rows there now, in case data is this database.
+            indices = islice(iter(data.index), len(data.index))
         else:
-            indices = []
-            for k in keys:
-                if isinstance(k, IndexRow):
-                    indices.append(k)
-                else:
-                    ir = data.index[k]
-                    assert isinstance(ir, IndexRow)
-                    indices.append(ir)
+            indices = data._lookup_rows(keys)
 
-        assert isinstance(indices, list)
+        # Reading on a thread isn't safe if we're also writing to the file.
+        background = background and (data.data is not self.data)
 
         length = 0
-        for key in indices:
-            length += self.append_from(data, key)
+        for key, document in prefetch(
+            data.data,
+            indices,
+            lookahead,
+            background
+        ):
+            length += self._append_document(key, document)
         return length
 
     def append(self, data: bytes, key: bytes) -> int:
         if data[-1:] != b'\0':
             data = data + b'\0'
 
-        self.data.append(data)
-        self.index.append(IndexRow(key, 0, len(data)))
-        return len(data)
+        self._check_new_key(key)
+        start, written = self._store(data)
+        self.index.append(IndexRow(key, 0, len(data)), start=start)
+
+        if self.sums is not None:
+            self.sums.add(key, data)
+
+        return written
 
     def extend(self, data: Sequence[bytes], keys: Sequence[bytes]) -> int:
         assert len(data) == len(keys)
 
+        for key in keys:
+            self._check_new_key(key)
+
+        if self.dedup is not None:
+            # Rows aren't one after another, so add them one at a time.
+            self.index.check_new_names(keys)
+            return sum(self.append(d, k) for d, k in zip(data, keys))
+
+        # Sizes including the null byte, if it needs to be added.
+        sizes = [len(d) + (d[-1:] != b'\0') for d in data]
+        self.index.extend_columns(keys, sizes, start=self.data.end)
+
         length = 0
-        for k, d in zip(keys, data):
-            length += self.append(d, k)
+        for key, d in zip(keys, data):
+            if d[-1:] != b'\0':
+                d = d + b'\0'
+
+            if self.sums is not None:
+                self.sums.add(key, d)
+
+            length += self.data.append(d)
 
         return length
 
@@ -330,16 +2238,54 @@ class FFDB(object):
     ) -> None:
         assert data_handle.tell() == 0
 
-        self.index.write_to(index_handle)
+        self.write_index_to(index_handle)
         self.data.write_to(data_handle)
         return
 
-    def concat(self, dbs: Sequence["FFDB"]) -> None:
-        # Go to end of file
-        self.data.handle.seek(0, 2)
-        for db in dbs:
-            self.index.extend(db.index.index)
-            db.data.write_to(self.data.handle)
+    def write_index_to(self, index_handle: BinaryIO) -> int:
+        """ Write the index, including any rows from an appended database.
+        """
+
+        return self.index.write_to(index_handle, base=self.base)
+
+    def concat(
+        self,
+        dbs: Sequence["FFDB"],
+        sums: Optional[Sequence[Optional[Iterable[SumRow]]]] = None,
+    ) -> None:
+        """ Append whole databases, copying their ffdata files.
+
+        If digests are being recorded, `sums` can give the existing sidecar
+        rows for each database (or None), so that their documents don't
+        need to be read.
+        """
+
+        if sums is None:
+            sums = [None for _ in dbs]
+
+        for db, db_sums in zip(dbs, sums):
+            if self.dedup is not None:
+                # Each document needs to be checked, so nothing is copied
+                # as a whole file.
+                self.extend_from(db, None)
+                continue
+
+            if self.sums is not None and db_sums is not None:
+                self.sums.extend(db_sums)
+            elif self.sums is not None:
+                for row, document in prefetch(db.data, db.index):
+                    self.sums.add(row.name, document)
+
+            # The whole ffdata file is copied, so offsets within it just
+            # need to be moved to where it starts.
+            view = db.index.view(offset=self.data.end)
+
+            if self.base is not None:
+                for name in view.names():
+                    self._check_new_key(name)
+
+            self.index.append_rows(view)
+            self.data.append_file(db.data)
         return
 
     def documents(
@@ -411,23 +2357,7 @@ class FFDB(object):
         for i in range(nchunks):
             chunk = indices[i::nchunks]
 
-            ffindex_name = template.format(
-                name=name,
-                index=i + 1,
-                ext="ffindex"
-            )
-
-            ffdata_name = template.format(
-                name=name,
-                index=i + 1,
-                ext="ffdata"
-            )
-
-            index_dirname = psplit(ffindex_name)[0]
-            makedirs(index_dirname, exist_ok=True)
-
-            data_dirname = psplit(ffdata_name)[0]
-            makedirs(data_dirname, exist_ok=True)
+            ffdata_name, ffindex_name = partition_paths(template, name, i + 1)
 
             with open(ffindex_name, "wb") as index_handle, \
                     open(ffdata_name, "wb") as data_handle:
@@ -441,6 +2371,49 @@ class FFDB(object):
 
         return nchunks
 
+    def hash_partition(
+        self,
+        name: str,
+        template: str = "{name}_{index}.{ext}",
+        npartitions: int = 10,
+    ) -> int:
+        """ Split a database into partitions by a hash of the names.
+
+        Documents with the same name always go to the same partition, so two
+        databases split into the same number of partitions can be joined
+        partition by partition. Every partition is written, even if it is
+        empty.
+
+        The rows are sorted by partition first, so that the partitions can be
+        written one at a time, with only two files open.
+        """
+
+        order = external_sort(
+            (partition_of(row.name, npartitions), i)
+            for i, row in enumerate(self.index)
+        )
+        groups = groupby(order, key=lambda p: p[0])
+        group = next(groups, None)
+
+        for i in range(npartitions):
+            ffdata_name, ffindex_name = partition_paths(template, name, i + 1)
+
+            with open(ffdata_name, "wb") as data_handle:
+                partdb = FFDB.new(data_handle, self.index.empty_like())
+
+                if group is not None and group[0] == i:
+                    for _, j in group[1]:
+                        row = self.index[j]
+                        assert isinstance(row, IndexRow)
+                        partdb.append_from(self, row)
+
+                    group = next(groups, None)
+
+            with open(ffindex_name, "wb") as index_handle:
+                partdb.index.write_to(index_handle)
+
+        return npartitions
+
     def quick_partition(
         self,
         name: str,
@@ -449,35 +2422,25 @@ class FFDB(object):
     ) -> int:
         """ Chunk a database into partitions of size n """
 
-        start_pos = 0
-        pindices: List[IndexRow] = []
-        partition = 1
-
-        for i, p in enumerate(self.index, 1):
-            if i % n == 0:
-                self._write_quick_partition(
-                    start_pos,
-                    p.start,
-                    template,
-                    name,
-                    pindices,
-                    partition
-                )
+        rows = self.index.index
+        partition = 0
 
-                pindices = []
-                partition += 1
-                start_pos = p.start
+        for lo in range(0, len(rows), n):
+            hi = min(lo + n, len(rows))
+            partition += 1
 
-            pindices.append(p)
+            start = rows[lo].start
+            if hi < len(rows):
+                end = rows[hi].start
+            else:
+                end = rows[-1].start + rows[-1].size
 
-        if len(pindices) > 1:
-            end = pindices[-1].start + pindices[-1].size
             self._write_quick_partition(
-                start_pos,
+                start,
                 end,
                 template,
                 name,
-                pindices,
+                self.index.view(lo, hi, offset=-start),
                 partition
             )
 
@@ -489,35 +2452,354 @@ class FFDB(object):
         end: int,
         template: str,
         name: str,
-        indices: Sequence[IndexRow],
+        partition_index: IndexView,
         partition: int,
     ) -> None:
         size = (end - start)
 
-        ffindex_name = template.format(
-            name=name,
-            index=partition,
-            ext="ffindex"
-        )
+        ffdata_name, ffindex_name = partition_paths(template, name, partition)
+
+        with open(ffindex_name, "wb") as handle:
+            partition_index.write_to(handle)
+
+        with open(ffdata_name, "wb") as handle:
+            self.data.write_sized(start, size, handle)
+
+        return
+
+
+class ShardedFFData(FFData):
+
+    def __init__(self, shards: Sequence[FFData]) -> None:
+        """ Read many ffdata files as if they were concatenated.
+
+        Offsets are relative to the start of the first file, and every
+        following file starts where the previous one ends. This is read-only,
+        the methods that write to the ffdata file raise a ValueError.
+        """
+
+        self.shards = list(shards)
+        self.offsets: List[int] = []
 
-        ffdata_name = template.format(
-            name=name,
-            index=partition,
-            ext="ffdata"
+        offset = 0
+        for shard in self.shards:
+            self.offsets.append(offset)
+            offset += shard.end
+
+        self._end: Optional[int] = offset
+        self._at_end = False
+        return
+
+    @property
+    def handle(self) -> BinaryIO:  # type: ignore
+        raise ValueError("Sharded ffdata files can't be written to.")
+
+    def locate(self, start: int) -> Tuple[FFData, int]:
+        """ Find the shard containing an offset, and the local offset. """
+
+        i = bisect_right(self.offsets, start) - 1
+        return self.shards[i], start - self.offsets[i]
+
+    def _local(self, row: IndexRow) -> Tuple[FFData, IndexRow]:
+        shard, start = self.locate(row.start)
+        return shard, IndexRow(row.name, start, row.size)
+
+    def __getitem__(
+        self,
+        key: Union[IndexRow, List[IndexRow]]
+    ) -> Union[bytes, List[bytes]]:
+
+        if isinstance(key, IndexRow):
+            shard, row = self._local(key)
+            return shard[row]
+
+        elif isinstance(key, list):
+            records = []
+            for k in key:
+                shard, row = self._local(k)
+                document = shard[row]
+                assert isinstance(document, bytes)
+                records.append(document)
+            return records
+
+        else:
+            raise ValueError("Must be an IndexRow or a list of IndexRows")
+
+    def will_need(self, rows: Iterable[IndexRow]) -> None:
+        for row in rows:
+            shard, local = self._local(row)
+            shard.will_need([local])
+        return
+
+    def write_to(self, handle: BinaryIO) -> None:
+        for shard in self.shards:
+            shard.write_to(handle)
+        return
+
+    def write_sized(self, start: int, size: int, handle: BinaryIO) -> int:
+        shard, local = self.locate(start)
+        return shard.write_sized(local, size, handle)
+
+    def copy_range(
+        self,
+        start: int,
+        size: int,
+        handle: BinaryIO,
+        buffer_size: int = 16 * 1024 * 1024,
+    ) -> int:
+        shard, local = self.locate(start)
+        return shard.copy_range(local, size, handle, buffer_size)
+
+
+class _ShardedRows(Sequence[IndexRow]):
+    """ The rows of a ShardedFFIndex, moved to where each shard starts. """
+
+    def __init__(self, index: "ShardedFFIndex") -> None:
+        self._owner = index
+        return
+
+    def __len__(self) -> int:
+        return self._owner.counts[-1]
+
+    def __getitem__(self, i):  # type: ignore
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+
+        if not (0 <= i < len(self)):
+            raise IndexError("index out of range")
+
+        owner = self._owner
+        shard = bisect_right(owner.counts, i) - 1
+        row = owner.indices[shard].index[i - owner.counts[shard]]
+        return IndexRow(row.name, row.start + owner.offsets[shard], row.size)
+
+    def __iter__(self) -> Iterator[IndexRow]:
+        for index, offset in zip(self._owner.indices, self._owner.offsets):
+            for name, start, size in index.index:
+                yield IndexRow(name, start + offset, size)
+        return
+
+
+class ShardedFFIndex(FFIndex):
+
+    def __init__(
+        self,
+        indices: Sequence[FFIndex],
+        offsets: Sequence[int],
+    ) -> None:
+        """ Read the indices of several shards as one index.
+
+        Nothing is copied. Names are looked up in each shard in turn, and
+        the rows are chained together as they are iterated over, with the
+        `offset` of each shard added to its starts. Names should be unique
+        across the shards, but this isn't checked. A repeated name is found
+        in the first shard that has it.
+
+        Examples:
+        >>> index = ShardedFFIndex(
+        ...     [FFIndex([IndexRow(b"a", 0, 5)]),
+        ...      FFIndex([IndexRow(b"b", 0, 3), IndexRow(b"c", 3, 2)])],
+        ...     [0, 5]
+        ... )
+        >>> index[b"c"]
+        IndexRow(name=b'c', start=8, size=2)
+        >>> index[1]
+        IndexRow(name=b'b', start=5, size=3)
+        >>> [r.start for r in index]
+        [0, 5, 8]
+        """
+
+        assert len(indices) == len(offsets)
+
+        self.indices = list(indices)
+        self.offsets = list(offsets)
+
+        # The number of rows before each shard, and the total.
+        self.counts = list(accumulate(chain(
+            [0],
+            (len(i) for i in self.indices)
+        )))
+        return
+
+    @property
+    def index(self) -> Sequence[IndexRow]:  # type: ignore
+        return _ShardedRows(self)
+
+    def __getitem__(  # type: ignore
+        self,
+        key: Union[bytes, slice, int]
+    ) -> Union[IndexRow, List[IndexRow]]:
+
+        if isinstance(key, int):
+            return self.index[key]
+        elif isinstance(key, slice):
+            return list(self.index[key])
+        elif isinstance(key, bytes):
+            for index, offset in zip(self.indices, self.offsets):
+                if key in index:
+                    row = index[key]
+                    assert isinstance(row, IndexRow)
+                    return IndexRow(row.name, row.start + offset, row.size)
+            raise KeyError(key)
+        else:
+            raise ValueError(
+                "Expected either a bytes, an int, or a slice."
+            )
+
+    def __contains__(self, key: bytes) -> bool:
+        return any(key in index for index in self.indices)
+
+    def __iter__(self) -> Iterator[IndexRow]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return self.counts[-1]
+
+    def append(self, value: IndexRow, start: Optional[int] = None) -> None:
+        raise ValueError("Sharded indices can't be added to.")
+
+    def append_rows(self, rows: Iterable[IndexRow]) -> int:
+        raise ValueError("Sharded indices can't be added to.")
+
+    def empty_like(self) -> "FFIndex":
+        return FFIndex()
+
+
+class ShardedFFDB(FFDB):
+
+    def __init__(self, shards: Sequence[FFDB]) -> None:
+        """ Treat many ffindex databases as a single database.
+
+        This is useful for the partitions written by `ffdb split` or
+        `ffdb fasta`, so that we can read them without combining them first.
+        Names should be unique across all of the shards.
+
+        The index is a `ShardedFFIndex` over the shards' indices, which
+        behaves like the index of their ffdata files concatenated in order.
+        """
+
+        self.shards = list(shards)
+        self.data: ShardedFFData = ShardedFFData([s.data for s in shards])
+        self.index: FFIndex = ShardedFFIndex(
+            [s.index for s in self.shards],
+            self.data.offsets
         )
+        self.base = None
+        self.sums = None
+        self.dedup = None
+        self.handles: List[BinaryIO] = []
+        return
 
-        index_dirname = psplit(ffindex_name)[0]
-        makedirs(index_dirname, exist_ok=True)
+    @classmethod
+    def from_files(
+        cls,
+        data_handles: Sequence[BinaryIO],
+        index_handles: Sequence[BinaryIO],
+    ) -> "ShardedFFDB":
+        assert len(data_handles) == len(index_handles)
+
+        return cls([
+            FFDB.from_file(d, i)
+            for d, i
+            in zip(data_handles, index_handles)
+        ])
 
-        data_dirname = psplit(ffdata_name)[0]
-        makedirs(data_dirname, exist_ok=True)
+    @classmethod
+    def from_manifest(cls, handle: Iterable[str]) -> "ShardedFFDB":
+        """ Open all of the shards listed in a manifest file.
 
-        partition_index = FFIndex(indices).bump_starts(by=(-1 * start))
+        Each line should have the path to an ffdata and ffindex file
+        separated by a tab, or a single path that the .ffdata and .ffindex
+        extensions are added to. Relative paths are relative to the manifest.
+        Blank lines and lines starting with '#' are ignored.
+        """
 
-        with open(ffindex_name, "wb") as handle:
-            partition_index.write_to(handle)
+        dirname = psplit(getattr(handle, "name", ""))[0]
 
-        with open(ffdata_name, "wb") as handle:
-            self.data.write_sized(start, size, handle)
+        handles: List[BinaryIO] = []
+        try:
+            for line in handle:
+                sline = line.strip()
+                if len(sline) == 0 or sline.startswith("#"):
+                    continue
 
+                columns = sline.split("\t")
+                if len(columns) == 1:
+                    paths = [columns[0] + ".ffdata", columns[0] + ".ffindex"]
+                else:
+                    paths = columns[:2]
+
+                for path in paths:
+                    handles.append(open(os.path.join(dirname, path), "rb"))
+
+            db = cls.from_files(handles[0::2], handles[1::2])
+        except BaseException:
+            for h in handles:
+                h.close()
+            raise
+
+        db.handles = handles
+        return db
+
+    def close(self) -> None:
+        """ Close any files opened by `from_manifest`. """
+
+        for handle in self.handles:
+            handle.close()
+        return
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def documents(
+        self,
+        trim: Optional[int] = None,
+        threads: int = 1,
+    ) -> Iterator[Tuple[bytes, bytes]]:
+        """ Iterate over all documents, shard by shard.
+
+        With `threads` > 1 the following shards are read in the background
+        while the current one is being consumed. Note that this holds up
+        to `threads` shards worth of documents in memory.
+        """
+
+        if threads <= 1:
+            for shard in self.shards:
+                yield from shard.documents(trim=trim)
+            return
+
+        def read(shard: FFDB) -> List[Tuple[bytes, bytes]]:
+            return list(shard.documents(trim=trim))
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            ishards = iter(self.shards)
+            pending = deque(
+                executor.submit(read, s)
+                for s
+                in islice(ishards, threads)
+            )
+
+            while len(pending) > 0:
+                documents = pending.popleft().result()
+
+                next_shard: Optional[FFDB] = next(ishards, None)
+                if next_shard is not None:
+                    pending.append(executor.submit(read, next_shard))
+
+                yield from documents
+        return
+
+    def collect_into(
+        self,
+        outfile: BinaryIO,
+        trim: Optional[int] = None,
+        threads: int = 1,
+    ) -> None:
+        for key, document in self.documents(trim=trim, threads=threads):
+            outfile.write(document)
+            if not document.endswith(b'\n'):
+                outfile.write(b'\n')
         return
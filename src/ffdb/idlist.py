@@ -0,0 +1,189 @@
+""" Matching document names against very large lists of ids. """
+
+from math import ceil, log
+from hashlib import blake2b
+from mmap import mmap, ACCESS_READ
+from tempfile import TemporaryFile
+
+from typing import Iterable, Iterator, BinaryIO
+from typing import Optional
+
+from ffdb.ffindex import IndexRow, SortedFFIndex
+from ffdb.extsort import external_sort
+from ffdb.exceptions import FFOrderError
+
+
+class BloomFilter(object):
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        """ A compact probabilistic set.
+
+        Membership tests can give false positives at roughly `error_rate`,
+        but never false negatives. With the default error rate it uses
+        about 1.2 bytes per item.
+
+        Examples:
+        >>> bloom = BloomFilter(100)
+        >>> bloom.add(b"one")
+        >>> b"one" in bloom
+        True
+        """
+
+        capacity = max(capacity, 1)
+
+        self.nbits = max(8, ceil(-capacity * log(error_rate) / (log(2) ** 2)))
+        self.nhashes = max(1, round(self.nbits / capacity * log(2)))
+        self.bits = bytearray(ceil(self.nbits / 8))
+        return
+
+    def _positions(self, key: bytes) -> Iterator[int]:
+        digest = blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+
+        for i in range(self.nhashes):
+            yield (h1 + i * h2) % self.nbits
+        return
+
+    def add(self, key: bytes) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        return
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7))
+            for pos
+            in self._positions(key)
+        )
+
+
+def read_ids(handles: Iterable[Iterable[bytes]]) -> Iterator[bytes]:
+    """ Read newline delimited ids, skipping blank lines. """
+
+    for handle in handles:
+        for line in handle:
+            sline = line.strip()
+            if len(sline) == 0:
+                continue
+            yield sline
+    return
+
+
+def check_sorted(ids: Iterable[bytes]) -> Iterator[bytes]:
+    """ Pass ids through, raising an error if they aren't sorted. """
+
+    last: Optional[bytes] = None
+    for id_ in ids:
+        if last is not None and id_ < last:
+            raise FFOrderError(
+                "The id file is not sorted. "
+                f"'{id_.decode()}' came after '{last.decode()}'."
+            )
+        last = id_
+        yield id_
+    return
+
+
+def sorted_ids(
+    handles: Iterable[Iterable[bytes]],
+    presorted: bool = False,
+    buffer_size: int = 1000000,
+    tmpdir: Optional[str] = None,
+) -> Iterator[bytes]:
+    """ Yield the ids in sorted order, using an external sort if needed. """
+
+    ids = read_ids(handles)
+    if presorted:
+        return check_sorted(ids)
+    else:
+        return external_sort(ids, buffer_size=buffer_size, tmpdir=tmpdir)
+
+
+def merge_filter(
+    rows: Iterable[IndexRow],
+    ids: Iterable[bytes],
+    keep: bool = True,
+) -> Iterator[IndexRow]:
+    """ Filter name sorted rows by a sorted stream of ids.
+
+    If keep is True, rows in ids are yielded, otherwise the rows not in ids
+    are yielded. Neither side is held in memory.
+
+    Examples:
+    >>> rows = [IndexRow(b"a", 0, 1), IndexRow(b"b", 1, 1),
+    ...         IndexRow(b"c", 2, 1)]
+    >>> [r.name for r in merge_filter(rows, [b"a", b"c", b"d"])]
+    [b'a', b'c']
+    >>> [r.name for r in merge_filter(rows, [b"b"], keep=False)]
+    [b'a', b'c']
+    """
+
+    iids = iter(ids)
+    current: Optional[bytes] = next(iids, None)
+
+    for row in rows:
+        while current is not None and current < row.name:
+            current = next(iids, None)
+
+        if (current == row.name) == keep:
+            yield row
+    return
+
+
+class IdSet(object):
+
+    def __init__(self, handle: BinaryIO, count: int) -> None:
+        """ A set of ids stored in a sorted temporary file.
+
+        A bloom filter is kept in memory, so that most ids that aren't in the
+        set don't need to touch the file.
+        Any hits are checked with a binary search over the file.
+        Use `from_ids` to construct one.
+        """
+
+        self.handle = handle
+        self.count = count
+
+        handle.seek(0, 2)
+        if handle.tell() == 0:
+            self.exact = SortedFFIndex(b"")
+        else:
+            self.exact = SortedFFIndex(
+                mmap(handle.fileno(), 0, access=ACCESS_READ)
+            )
+
+        self.bloom = BloomFilter(count)
+
+        handle.seek(0)
+        for line in handle:
+            self.bloom.add(line.rstrip(b"\n"))
+        return
+
+    @classmethod
+    def from_ids(
+        cls,
+        ids: Iterable[bytes],
+        buffer_size: int = 1000000,
+        tmpdir: Optional[str] = None,
+    ) -> "IdSet":
+        handle = TemporaryFile(dir=tmpdir)
+
+        last: Optional[bytes] = None
+        count = 0
+        for id_ in external_sort(ids, buffer_size=buffer_size, tmpdir=tmpdir):
+            if id_ == last:
+                continue
+
+            handle.write(id_ + b"\n")
+            last = id_
+            count += 1
+
+        handle.flush()
+        return cls(handle, count)
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self.bloom and key in self.exact
+
+    def __len__(self) -> int:
+        return self.count
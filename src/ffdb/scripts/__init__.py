@@ -9,6 +9,16 @@ from ffdb.scripts.fasta import cli_fasta, fasta
 from ffdb.scripts.join_concat import cli_join_concat, join_concat
 from ffdb.scripts.order import cli_order, order
 from ffdb.scripts.select import cli_select, select
+from ffdb.scripts.map import cli_map, map_documents
+from ffdb.scripts.append import cli_append, append
+from ffdb.scripts.compact import cli_compact, compact
+from ffdb.scripts.fetch_seq import cli_fetch_seq, fetch_seq
+from ffdb.scripts.check import cli_check, check
+from ffdb.scripts.diff import cli_diff, diff
+from ffdb.scripts.update import cli_update, update
+from ffdb.scripts.grep import cli_grep, grep
+from ffdb.scripts.stats import cli_stats, stats
+from ffdb.scripts.sample import cli_sample, sample
 
 
 def cli(prog, args):
@@ -76,10 +86,95 @@ def cli(prog, args):
 
     cli_select(select_subparser)
 
+    map_subparser = subparsers.add_parser(
+        "map",
+        help=("Run a command or python function on each document in an "
+              "ffindex database, in parallel and with checkpointing.")
+    )
+
+    cli_map(map_subparser)
+
+    append_subparser = subparsers.add_parser(
+        "append",
+        help=("Add documents from other ffindex databases to an existing "
+              "database, without rewriting it.")
+    )
+
+    cli_append(append_subparser)
+
+    compact_subparser = subparsers.add_parser(
+        "compact",
+        help=("Remove unused space from an ffdata file, "
+              "and lay out documents sequentially.")
+    )
+
+    cli_compact(compact_subparser)
+
+    fetch_seq_subparser = subparsers.add_parser(
+        "fetch-seq",
+        help=("Fetch single fasta records from a database with many "
+              "records per document, using a sequence index.")
+    )
+
+    cli_fetch_seq(fetch_seq_subparser)
+
+    check_subparser = subparsers.add_parser(
+        "check",
+        help=("Check that an ffindex database is valid, "
+              "and optionally compute checksums of each document.")
+    )
+
+    cli_check(check_subparser)
+
+    diff_subparser = subparsers.add_parser(
+        "diff",
+        help=("List the documents that were added, removed or changed "
+              "between two databases, using their checksum sidecars.")
+    )
+
+    cli_diff(diff_subparser)
+
+    update_subparser = subparsers.add_parser(
+        "update",
+        help=("Update the output of `ffdb map` for a new version of its "
+              "source database, only processing changed documents.")
+    )
+
+    cli_update(update_subparser)
+
+    grep_subparser = subparsers.add_parser(
+        "grep",
+        help=("Find the documents that contain a pattern, "
+              "searching the ffdata file in parallel.")
+    )
+
+    cli_grep(grep_subparser)
+
+    stats_subparser = subparsers.add_parser(
+        "stats",
+        help=("Summarise the document sizes and layout of a database "
+              "from its index, e.g. to choose split settings.")
+    )
+
+    cli_stats(stats_subparser)
+
+    sample_subparser = subparsers.add_parser(
+        "sample",
+        help=("Take a random sample of the documents in a database, "
+              "optionally stratified by document size.")
+    )
+
+    cli_sample(sample_subparser)
+
     parsed = parser.parse_args(args)
 
     # Validate arguments passed to combine
-    if parsed.subparser_name in ("combine", "collect", "join_concat"):
+    if parsed.subparser_name in (
+        "combine",
+        "collect",
+        "join_concat",
+        "append",
+    ):
         files = []
         files.extend(parsed.ffdata)
         files.extend(parsed.ffindex)
@@ -90,6 +185,9 @@ def cli(prog, args):
                 "ffdata files provided to `combine`."
             ))
 
+        if len(files) == 0 and len(getattr(parsed, "manifest", [])) == 0:
+            parser.error("At least one database must be provided.")
+
         parsed.ffdata = files[:len(files)//2]
         parsed.ffindex = files[len(files)//2:]
 
@@ -118,6 +216,26 @@ def main():  # noqa
             order(args)
         elif args.subparser_name == "select":
             select(args)
+        elif args.subparser_name == "map":
+            map_documents(args)
+        elif args.subparser_name == "append":
+            append(args)
+        elif args.subparser_name == "compact":
+            compact(args)
+        elif args.subparser_name == "fetch-seq":
+            fetch_seq(args)
+        elif args.subparser_name == "check":
+            check(args)
+        elif args.subparser_name == "diff":
+            diff(args)
+        elif args.subparser_name == "update":
+            update(args)
+        elif args.subparser_name == "grep":
+            grep(args)
+        elif args.subparser_name == "stats":
+            stats(args)
+        elif args.subparser_name == "sample":
+            sample(args)
         else:
             raise ValueError("I shouldn't reach this point ever")
 
@@ -0,0 +1,92 @@
+import os
+import argparse
+from os.path import exists
+
+from ffdb.ffindex import FFDB
+from ffdb.sums import sums_path, read_sums
+
+
+# Appended documents are gathered into writes of this size.
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def cli_append(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-d", "--data",
+        required=True,
+        type=str,
+        help="The existing ffdata file to add documents to.",
+    )
+
+    parser.add_argument(
+        "-i", "--index",
+        required=True,
+        type=str,
+        help="The existing ffindex file to add documents to.",
+    )
+
+    parser.add_argument(
+        "--sums",
+        action="store_true",
+        default=False,
+        help=(
+            "Also update the checksum sidecar (.ffsum) next to the ffindex "
+            "file, for `ffdb diff` and `ffdb check --sums`. If there isn't "
+            "one yet, the existing documents are read to create it."
+        ),
+    )
+
+    parser.add_argument(
+        "ffdata",
+        metavar="FFDATA",
+        nargs="+",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffdata files to take new documents from.",
+    )
+
+    parser.add_argument(
+        "ffindex",
+        metavar="FFINDEX",
+        nargs="+",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffindex files to take new documents from.",
+    )
+
+    return
+
+
+def append(args: argparse.Namespace) -> None:
+    tmp_index = args.index + ".tmp"
+    sums = sums_path(args.index)
+    tmp_sums = sums + ".tmp"
+
+    with open(args.data, "r+b", buffering=WRITE_BUFFER_SIZE) as data_handle, \
+            open(args.index, "rb") as index_handle:
+
+        outdb = FFDB.open_append(data_handle, index_handle)
+        if args.sums:
+            outdb.record_sums()
+
+        for (data, index) in zip(args.ffdata, args.ffindex):
+            indb = FFDB.from_file(data, index)
+            outdb.extend_from(indb, None)
+
+        data_handle.flush()
+
+        # The old index stays valid until the new one replaces it, so an
+        # interrupted append just leaves some unused bytes in the ffdata.
+        with open(tmp_index, "wb") as handle:
+            outdb.write_index_to(handle)
+
+        if args.sums and exists(sums):
+            with open(sums, "rb") as base, open(tmp_sums, "wb") as handle:
+                outdb.write_sums_to(handle, base=read_sums(base))
+        elif args.sums:
+            with open(tmp_sums, "wb") as handle:
+                outdb.write_sums_to(handle)
+
+    os.replace(tmp_index, args.index)
+
+    if args.sums:
+        os.replace(tmp_sums, sums)
+    return
@@ -0,0 +1,206 @@
+import os
+import sys
+import argparse
+
+from typing import List, Iterable, Iterator, Optional
+
+from ffdb.check import CHUNK_SIZE
+from ffdb.check import index_rows, check_index
+from ffdb.check import check_overlaps, scan_jobs, scan_data
+from ffdb.extsort import external_sort
+from ffdb.sums import SumRow, SumSpool, read_sums, diff_sums
+from ffdb.exceptions import FFCheckError, InvalidOptionError
+
+
+def cli_check(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-j", "--cpus",
+        type=int,
+        default=1,
+        help="The number of processes to use to scan the ffdata file.",
+    )
+
+    parser.add_argument(
+        "--keys",
+        choices=["bytes", "numeric"],
+        default="bytes",
+        help=(
+            "How the index should be sorted. 'numeric' is for MMseqs2 style "
+            "integer keys, which are sorted as numbers. "
+            "Default: bytes, names are sorted as text."
+        ),
+    )
+
+    parser.add_argument(
+        "-s", "--sums",
+        type=argparse.FileType('rb'),
+        default=None,
+        help=(
+            "Check the contents of each document against this checksum "
+            "sidecar (.ffsum) file."
+        ),
+    )
+
+    parser.add_argument(
+        "--write-sums",
+        type=argparse.FileType('wb'),
+        default=None,
+        help=(
+            "Compute a digest of every document while scanning, and write "
+            "them to this checksum sidecar (.ffsum) file."
+        ),
+    )
+
+    parser.add_argument(
+        "--max-problems",
+        type=int,
+        default=20,
+        help=(
+            "The maximum number of problems to print. "
+            "The total number found is always reported. Default: 20."
+        ),
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help=(
+            "The number of bytes of the ffdata file that each process reads "
+            "at a time. Default: 64MiB."
+        ),
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=1000000,
+        help=(
+            "The maximum number of index rows to sort in memory. "
+            "Larger indices are sorted in pieces using temporary files."
+        ),
+    )
+
+    parser.add_argument(
+        "--tmpdir",
+        type=str,
+        default=None,
+        help="Where to write temporary files for sorting.",
+    )
+
+    parser.add_argument(
+        "ffdata",
+        metavar="FFDATA_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffdata file.",
+    )
+
+    parser.add_argument(
+        "ffindex",
+        metavar="FFINDEX_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffindex file.",
+    )
+
+    return
+
+
+def check_sums(
+    expected: Iterable[SumRow],
+    found: Iterable[SumRow],
+) -> Iterator[str]:
+    """ Compare the sidecar digests to those computed from the ffdata. """
+
+    for status, name in diff_sums(expected, found):
+        sname = name.decode(errors="replace")
+        if status == "changed":
+            yield f"Document '{sname}' doesn't match its checksum."
+        elif status == "added":
+            yield f"Document '{sname}' isn't in the checksum file."
+        else:
+            yield f"The checksum file has '{sname}', but the index doesn't."
+    return
+
+
+def check(args: argparse.Namespace) -> None:
+    if args.cpus < 1:
+        raise InvalidOptionError("--cpus must be at least 1.")
+
+    if args.chunk_size < 1:
+        raise InvalidOptionError("--chunk-size must be at least 1.")
+
+    data_size = os.fstat(args.ffdata.fileno()).st_size
+    nproblems = 0
+
+    def report(problems: Iterable[str]) -> None:
+        nonlocal nproblems
+        for problem in problems:
+            if nproblems < args.max_problems:
+                print(problem)
+            nproblems += 1
+        return
+
+    report(check_index(
+        args.ffindex,
+        data_size,
+        keys=args.keys,
+        buffer_size=args.buffer_size,
+        tmpdir=args.tmpdir,
+    ))
+
+    # Read the documents in file order, so that the whole ffdata file is
+    # read sequentially (split between the processes) once.
+    args.ffindex.seek(0)
+    overlaps: List[str] = []
+    rows = check_overlaps(
+        external_sort(
+            index_rows(args.ffindex, []),
+            key=lambda r: r.start,
+            buffer_size=args.buffer_size,
+            tmpdir=args.tmpdir,
+        ),
+        overlaps
+    )
+
+    checksum = args.sums is not None or args.write_sums is not None
+    if checksum:
+        spool: Optional[SumSpool] = SumSpool(args.tmpdir)
+    else:
+        spool = None
+
+    jobs = scan_jobs(
+        rows,
+        args.ffdata.name,
+        checksum=checksum,
+        chunk_size=args.chunk_size,
+    )
+
+    for problems, digests in scan_data(jobs, args.cpus):
+        report(problems)
+
+        if spool is not None:
+            spool.extend(digests)
+
+    report(overlaps)
+
+    if spool is not None and args.sums is not None:
+        report(check_sums(
+            read_sums(args.sums),
+            spool.sorted(args.buffer_size)
+        ))
+
+    # Documents with problems can't be given a trustworthy checksum.
+    if spool is not None and args.write_sums is not None and nproblems == 0:
+        spool.write_to(args.write_sums, buffer_size=args.buffer_size)
+
+    if nproblems > args.max_problems:
+        print(f"... and {nproblems - args.max_problems} more.")
+
+    if nproblems > 0:
+        plural = "" if nproblems == 1 else "s"
+        raise FFCheckError(
+            f"Found {nproblems} problem{plural} with the database."
+        )
+
+    print(f"No problems found in {args.ffdata.name}.", file=sys.stderr)
+    return
@@ -1,6 +1,6 @@
 import sys
 import argparse
-from ffdb.ffindex import FFDB
+from ffdb.ffindex import FFDB, ShardedFFDB
 
 
 def cli_collect(parser: argparse.ArgumentParser) -> None:
@@ -19,10 +19,33 @@ def cli_collect(parser: argparse.ArgumentParser) -> None:
         help=("Write to this file instead of stdout."),
     )
 
+    parser.add_argument(
+        "-m", "--manifest",
+        type=argparse.FileType('r'),
+        action="append",
+        default=[],
+        help=(
+            "A file listing the shards of a partitioned database, "
+            "with one tab separated ffdata and ffindex pair per line. "
+            "These are collected after any databases given as arguments. "
+            "Can be given multiple times."
+        ),
+    )
+
+    parser.add_argument(
+        "-j", "--threads",
+        type=int,
+        default=1,
+        help=(
+            "Read this many databases at a time in the background. "
+            "This can help on network filesystems."
+        ),
+    )
+
     parser.add_argument(
         "ffdata",
         metavar="FFDATA",
-        nargs="+",
+        nargs="*",
         type=argparse.FileType('rb'),
         help="The ffindex .ffdata file.",
     )
@@ -30,7 +53,7 @@ def cli_collect(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
         "ffindex",
         metavar="FFINDEX",
-        nargs="+",
+        nargs="*",
         type=argparse.FileType('rb'),
         help="The ffindex .ffindex file.",
     )
@@ -39,7 +62,18 @@ def cli_collect(parser: argparse.ArgumentParser) -> None:
 
 
 def collect(args: argparse.Namespace) -> None:
+    shards = []
     for (data, index) in zip(args.ffdata, args.ffindex):
-        db = FFDB.from_file(data, index)
-        db.collect_into(args.outfile, args.trim)
+        shards.append(FFDB.from_file(data, index))
+
+    manifests = [ShardedFFDB.from_manifest(m) for m in args.manifest]
+    for manifest in manifests:
+        shards.extend(manifest.shards)
+
+    try:
+        db = ShardedFFDB(shards)
+        db.collect_into(args.outfile, args.trim, threads=args.threads)
+    finally:
+        for manifest in manifests:
+            manifest.close()
     return
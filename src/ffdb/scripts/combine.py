@@ -1,7 +1,10 @@
+import sys
 import argparse
-from typing import List
+from os.path import exists
+from typing import List, Optional, Iterable, BinaryIO
 
-from ffdb.ffindex import FFDB
+from ffdb.ffindex import FFDB, NumericFFIndex
+from ffdb.sums import SumRow, sums_path, read_sums
 
 
 def cli_combine(parser: argparse.ArgumentParser):
@@ -19,6 +22,53 @@ def cli_combine(parser: argparse.ArgumentParser):
         help="The path to write the ffindex file to.",
     )
 
+    parser.add_argument(
+        "--keys",
+        choices=["bytes", "numeric", "auto"],
+        default="bytes",
+        help=(
+            "How to treat the document names. 'numeric' is for MMseqs2 "
+            "style integer keys, which are stored compactly and written in "
+            "numeric order (e.g. 2 before 10). 'auto' uses numeric keys if "
+            "every name is a number. Default: bytes, names are sorted as "
+            "text, as the ffindex tools expect."
+        ),
+    )
+
+    parser.add_argument(
+        "--sums",
+        action="store_true",
+        default=False,
+        help=(
+            "Also write a checksum sidecar (.ffsum) next to the output "
+            "ffindex file, for `ffdb diff` and `ffdb check --sums`. "
+            "The sidecars of the input databases are used if they exist, "
+            "otherwise their documents are read to compute the checksums."
+        ),
+    )
+
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        default=False,
+        help=(
+            "Only store identical documents once, with each of their index "
+            "rows pointing at the same bytes. Each document has to be read, "
+            "rather than copying whole ffdata files."
+        ),
+    )
+
+    parser.add_argument(
+        "--dedup-memory",
+        type=int,
+        default=256 * 1024 * 1024,
+        help=(
+            "The maximum number of bytes to use remembering documents for "
+            "--dedup. When full, the least recently seen documents are "
+            "forgotten. Default: 256MiB."
+        ),
+    )
+
     parser.add_argument(
         "ffdata",
         metavar="FFDATA",
@@ -39,15 +89,54 @@ def cli_combine(parser: argparse.ArgumentParser):
 
 
 def combine(args: argparse.Namespace):
-    outdb = FFDB.new(args.data)
-
     indbs: List[FFDB] = []
     for (data, index) in zip(args.ffdata, args.ffindex):
-        indb = FFDB.from_file(data, index)
+        indb = FFDB.from_file(data, index, keys=args.keys)
         indbs.append(indb)
 
-    # Writes to ffdata since new was provided handle.
-    outdb.concat(indbs)
+    # With 'auto', only use numeric keys if they all turned out numeric.
+    if all(isinstance(db.index, NumericFFIndex) for db in indbs):
+        outdb = FFDB.new(args.data, NumericFFIndex())
+    else:
+        outdb = FFDB.new(args.data)
+
+    if args.dedup:
+        outdb.dedup_documents(args.dedup_memory)
+
+    # Existing sidecars of the input databases, so they don't need to be
+    # read to compute checksums.
+    handles: List[BinaryIO] = []
+    sums: Optional[List[Optional[Iterable[SumRow]]]] = None
+
+    try:
+        if args.sums:
+            outdb.record_sums()
+            sums = []
+
+            for index in args.ffindex:
+                path = sums_path(index.name)
+                if exists(path):
+                    handles.append(open(path, "rb"))
+                    sums.append(read_sums(handles[-1]))
+                else:
+                    sums.append(None)
+
+        # Writes to ffdata since new was provided handle.
+        outdb.concat(indbs, sums)
+        outdb.index.write_to(args.index)
+
+        if args.sums:
+            with open(sums_path(args.index.name), "wb") as sums_handle:
+                outdb.write_sums_to(sums_handle)
+
+    finally:
+        for handle in handles:
+            handle.close()
 
-    outdb.index.write_to(args.index)
+    if outdb.dedup is not None:
+        print(
+            f"Stored {outdb.dedup.hits} duplicate documents only once, "
+            f"saving {outdb.dedup.saved_bytes} bytes.",
+            file=sys.stderr
+        )
     return
@@ -0,0 +1,149 @@
+import os
+import sys
+import argparse
+
+from typing import Optional, List
+
+from ffdb.ffindex import FFDB, IndexRow
+from ffdb.exceptions import InvalidOptionError
+
+
+def cli_compact(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-d", "--data",
+        type=argparse.FileType('wb'),
+        default=None,
+        help="The path to write the ffdata file to.",
+    )
+
+    parser.add_argument(
+        "-i", "--index",
+        type=argparse.FileType('wb'),
+        default=None,
+        help="The path to write the ffindex file to.",
+    )
+
+    parser.add_argument(
+        "--in-place",
+        action="store_true",
+        default=False,
+        help=(
+            "Compact the input database in place instead of writing a new "
+            "one. Only --buffer-size bytes of extra memory are used, and no "
+            "temporary copy of the ffdata is needed. "
+            "Note that the database will be broken if this is interrupted."
+        )
+    )
+
+    parser.add_argument(
+        "--order",
+        type=argparse.FileType('rb'),
+        default=None,
+        help=(
+            "Write the documents in this order instead of the order that "
+            "they appear in the ffdata file. Should be a file of newline "
+            "separated ids, matching the first column of the ffindex file. "
+            "Any documents not in the file are dropped. "
+            "Can't be used with --in-place."
+        )
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=16 * 1024 * 1024,
+        help="The maximum number of bytes to copy at a time.",
+    )
+
+    parser.add_argument(
+        "ffdata",
+        metavar="FFDATA_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffdata file.",
+    )
+
+    parser.add_argument(
+        "ffindex",
+        metavar="FFINDEX_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffindex file.",
+    )
+
+    return
+
+
+def compact(args: argparse.Namespace) -> None:
+    if args.in_place:
+        if args.order is not None:
+            raise InvalidOptionError(
+                "The --order option can't be used with --in-place."
+            )
+
+        if args.data is not None or args.index is not None:
+            raise InvalidOptionError(
+                "The --data and --index options can't be used with "
+                "--in-place."
+            )
+
+    elif args.data is None or args.index is None:
+        raise InvalidOptionError(
+            "Both --data and --index must be specified for 'compact', "
+            "unless --in-place is used."
+        )
+
+    data_size = os.fstat(args.ffdata.fileno()).st_size
+
+    if args.in_place:
+        args.ffdata.close()
+        with open(args.ffdata.name, "r+b") as data_handle:
+            ffdb = FFDB.from_file(data_handle, args.ffindex)
+            layout = ffdb.index.layout(data_size)
+            new_size = ffdb.compact(args.buffer_size)
+
+        tmp_index = args.ffindex.name + ".tmp"
+        with open(tmp_index, "wb") as index_handle:
+            ffdb.index.write_to(index_handle)
+
+        os.replace(tmp_index, args.ffindex.name)
+
+    else:
+        ffdb = FFDB.from_file(args.ffdata, args.ffindex)
+        layout = ffdb.index.layout(data_size)
+
+        if args.order is not None:
+            lorder: List[IndexRow] = []
+
+            for line in args.order:
+                sline = line.strip()
+                if len(sline) == 0:
+                    continue
+
+                ir = ffdb.index[sline]
+                assert isinstance(ir, IndexRow)
+                lorder.append(ir)
+
+            order: Optional[List[IndexRow]] = lorder
+        else:
+            order = None
+
+        # Checked above, this is just for the typechecker.
+        assert args.data is not None and args.index is not None
+
+        outdb = FFDB.compact_from(
+            ffdb,
+            args.data,
+            order=order,
+            buffer_size=args.buffer_size,
+        )
+        outdb.index.write_to(args.index)
+        new_size = outdb.data.end
+
+    print(
+        f"Found {layout.holes} holes ({layout.hole_bytes} bytes), "
+        f"{layout.overlaps} overlapping documents and {layout.shared} "
+        "documents sharing data with another.\n"
+        f"Compacted {data_size} bytes to {new_size} bytes, reclaiming "
+        f"{data_size - new_size} bytes.",
+        file=sys.stderr
+    )
+    return
@@ -0,0 +1,52 @@
+import sys
+import argparse
+
+from ffdb.sums import read_sums, diff_sums
+
+
+def cli_diff(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--show",
+        choices=["added", "removed", "changed"],
+        action="append",
+        default=None,
+        help=(
+            "Only list names with this status. "
+            "Can be given multiple times. Default: all of them."
+        ),
+    )
+
+    parser.add_argument(
+        "-o", "--outfile",
+        type=argparse.FileType('w'),
+        default=sys.stdout,
+        help=("Write to this file instead of stdout."),
+    )
+
+    parser.add_argument(
+        "old",
+        metavar="OLD_FFSUM",
+        type=argparse.FileType('rb'),
+        help="The checksum sidecar (.ffsum) of the old database.",
+    )
+
+    parser.add_argument(
+        "new",
+        metavar="NEW_FFSUM",
+        type=argparse.FileType('rb'),
+        help="The checksum sidecar (.ffsum) of the new database.",
+    )
+
+    return
+
+
+def diff(args: argparse.Namespace) -> None:
+    if args.show is None:
+        show = {"added", "removed", "changed"}
+    else:
+        show = set(args.show)
+
+    for status, name in diff_sums(read_sums(args.old), read_sums(args.new)):
+        if status in show:
+            print(f"{status}\t{name.decode()}", file=args.outfile)
+    return
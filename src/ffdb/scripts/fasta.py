@@ -1,21 +1,41 @@
+import sys
 import argparse
+from heapq import heapreplace
+from itertools import chain
+from tempfile import TemporaryFile
+from os.path import basename, splitext
 
-from ffdb.seq import Seq
-from ffdb.ffindex import FFDB, IndexRow
+from typing import Iterable, Iterator, List, Tuple, BinaryIO, Optional
+from typing import Union
+
+from ffdb.seq import Seq, SeqBatch
+from ffdb.ffindex import FFIndex, FFDataWriter, DedupTable
+from ffdb.ffindex import partition_of, partition_paths
+from ffdb.seqindex import SeqIndexRow, write_seq_index
+from ffdb.sums import SumSpool, sums_path
+from ffdb.exceptions import InvalidOptionError
+
+
+# The name, pieces (views of the batch buffers) and record positions of a
+# document.
+Document = Tuple[bytes, List[Union[bytes, memoryview]], List[SeqIndexRow]]
+
+# The number of fasta records to parse at a time.
+BATCH_SIZE = 1024
 
 
 def cli_fasta(parser: argparse.ArgumentParser):
     parser.add_argument(
         "-d", "--data",
-        required=True,
         type=argparse.FileType('wb'),
+        default=None,
         help="The path to write the ffdata file to.",
     )
 
     parser.add_argument(
         "-i", "--index",
-        required=True,
         type=argparse.FileType('wb'),
+        default=None,
         help="The path to write the ffindex file to.",
     )
 
@@ -26,6 +46,96 @@ def cli_fasta(parser: argparse.ArgumentParser):
         help="The number of fasta records to use per document.",
     )
 
+    parser.add_argument(
+        "-p", "--partitions",
+        type=int,
+        default=None,
+        help=(
+            "Write the documents straight into this many partitions, "
+            "instead of a single database given by --data and --index."
+        ),
+    )
+
+    parser.add_argument(
+        "--partition-by",
+        choices=["count", "hash", "size"],
+        default="count",
+        help=(
+            "How to assign documents to partitions. "
+            "'count' deals documents out to each partition in turn, "
+            "'hash' uses a hash of the document name (like "
+            "`ffdb split --by-hash`), and 'size' adds each document to the "
+            "partition with the fewest bytes so far. Default: count."
+        ),
+    )
+
+    parser.add_argument(
+        "-b", "--basename",
+        type=str,
+        default="{name}_{index}.{ext}",
+        help=(
+            "The output database partition names, when using --partitions. "
+            "Can use python format syntax. "
+            "Some values are available, `name` will be the basename of the "
+            "first fasta file (no extensions), `index` will be the 1-based "
+            "partition number, and ext will be ffindex or ffdata as "
+            "appropriate."
+        )
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=1024 * 1024,
+        help=(
+            "The number of bytes to buffer for each output database "
+            "(or partition) before writing."
+        ),
+    )
+
+    parser.add_argument(
+        "-s", "--seq-index",
+        type=argparse.FileType('wb'),
+        default=None,
+        help=(
+            "Also write a secondary index of where each fasta record is "
+            "within the documents, so that single sequences can be fetched "
+            "with `ffdb fetch-seq`."
+        ),
+    )
+
+    parser.add_argument(
+        "--sums",
+        action="store_true",
+        default=False,
+        help=(
+            "Also write a checksum sidecar (.ffsum) next to the output "
+            "ffindex file (or each partition), for `ffdb diff` and "
+            "`ffdb check --sums`."
+        ),
+    )
+
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        default=False,
+        help=(
+            "Only store identical documents once, with each of their index "
+            "rows pointing at the same bytes."
+        ),
+    )
+
+    parser.add_argument(
+        "--dedup-memory",
+        type=int,
+        default=256 * 1024 * 1024,
+        help=(
+            "The maximum number of bytes to use remembering documents for "
+            "--dedup (split between the partitions). When full, the least "
+            "recently seen documents are forgotten. Default: 256MiB."
+        ),
+    )
+
     parser.add_argument(
         "fasta",
         metavar="FASTA",
@@ -37,42 +147,291 @@ def cli_fasta(parser: argparse.ArgumentParser):
     return
 
 
-def fasta(args: argparse.Namespace) -> None:
-    outdb = FFDB.new(args.data)
+def fasta_documents(
+    batches: Iterable[SeqBatch],
+    size: int,
+    positions: bool = True,
+) -> Iterator[Document]:
+    """ Group records into null terminated documents of `size` records.
+
+    Documents are named after their first record.
+    Also yields the position of each record in the document, unless
+    positions is False.
+
+    Documents are yielded as views of the batch buffers, so the records
+    aren't copied again.
 
-    chunk_data = bytearray()
-    chunk_name = None
-    chunk_size = 1
+    Examples:
+    >>> batches = Seq.parse_batches([b">a", b"A", b">b", b"C", b">c", b"G"])
+    >>> docs = list(fasta_documents(batches, 2))
+    >>> [(n, b"".join(p)) for n, p, _ in docs]
+    [(b'a', b'>a\\nA\\n>b\\nC\\n\\x00'), (b'c', b'>c\\nG\\n\\x00')]
+    >>> [r.offset for r in docs[0][2]]
+    [0, 5]
+    """
 
-    seqs = Seq.parse_many(args.fasta)
+    chunk_data: List[Union[bytes, memoryview]] = []
+    chunk_len = 0
+    chunk_name: Optional[bytes] = None
+    chunk_size = 0
+    chunk_records: List[SeqIndexRow] = []
 
-    for record in seqs:
-        chunk_data.extend(bytes(record) + b'\n')
+    for batch in batches:
+        i = 0
+        while i < len(batch):
+            # Handles first case after write, or just first case.
+            if chunk_name is None:
+                chunk_name = batch.id(i)
 
-        # Handles first case after write, or just first case.
-        if chunk_name is None:
-            chunk_name = record.id
+            # Copy as many records as we can from the batch at once.
+            j = min(len(batch), i + size - chunk_size)
 
-        if chunk_size % args.size != 0:
-            chunk_size += 1
-            continue
+            if positions:
+                offset = chunk_len - batch.starts[i]
+                for k in range(i, j):
+                    chunk_records.append(SeqIndexRow(
+                        batch.id(k),
+                        chunk_name,
+                        offset + batch.starts[k],
+                        batch.starts[k + 1] - batch.starts[k],
+                    ))
 
-        chunk_data.extend(b'\0')
-        index = IndexRow(chunk_name.encode(), 0, len(chunk_data))
+            view = batch.view(i, j)
+            chunk_data.append(view)
+            chunk_len += len(view)
+            chunk_size += j - i
+            i = j
 
-        outdb.data.append(chunk_data)
-        outdb.index.append(index)
+            if chunk_size < size:
+                continue
 
-        chunk_data = bytearray()
-        chunk_name = None
-        chunk_size = 1
+            chunk_data.append(b'\0')
+            yield chunk_name, chunk_data, chunk_records
+
+            chunk_data = []
+            chunk_len = 0
+            chunk_name = None
+            chunk_size = 0
+            chunk_records = []
 
     if chunk_name is not None:
-        chunk_data.extend(b'\0')
-        index = IndexRow(chunk_name.encode(), 0, len(chunk_data))
+        chunk_data.append(b'\0')
+        yield chunk_name, chunk_data, chunk_records
+
+    return
+
+
+def spool_seq_index(
+    documents: Iterable[Document],
+    handle: BinaryIO,
+) -> Iterator[Document]:
+    """ Pass documents through, writing the record positions to handle.
+
+    The positions are in document order, they are sorted at the end.
+    """
+
+    for document in documents:
+        for row in document[2]:
+            handle.write(bytes(row) + b"\n")
+        yield document
+    return
+
+
+def fasta_partitions(
+    documents: Iterable[Document],
+    name: str,
+    template: str,
+    npartitions: int,
+    partition_by: str,
+    buffer_size: int,
+    sums: bool = False,
+    dedup_memory: Optional[int] = None,
+) -> None:
+    """ Write documents into several partitions in a single pass.
+
+    If dedup_memory is given, identical documents within a partition are
+    only stored once.
+    """
+
+    handles: List[Tuple[BinaryIO, BinaryIO]] = []
+    writers: List[FFDataWriter] = []
+    spools: List[SumSpool] = []
+    dedups: List[DedupTable] = []
+
+    # The names, sizes (and starts, with dedup) of the documents written to
+    # each partition.
+    doc_names: List[List[bytes]] = [[] for _ in range(npartitions)]
+    doc_sizes: List[List[int]] = [[] for _ in range(npartitions)]
+    doc_starts: List[List[int]] = [[] for _ in range(npartitions)]
+
+    try:
+        for i in range(npartitions):
+            ffdata_name, ffindex_name = partition_paths(template, name, i + 1)
+
+            handles.append((
+                open(ffdata_name, "wb"),
+                open(ffindex_name, "wb"),
+            ))
+            writers.append(FFDataWriter(handles[-1][0], 0, buffer_size))
+
+            if sums:
+                spools.append(SumSpool())
+
+            if dedup_memory is not None:
+                dedups.append(DedupTable(dedup_memory // npartitions))
+
+        # Heap of (bytes written, partition) for size balancing.
+        sizes = [(0, i) for i in range(npartitions)]
+
+        for j, (chunk_name, chunk_data, _) in enumerate(documents):
+            if partition_by == "hash":
+                i = partition_of(chunk_name, npartitions)
+            elif partition_by == "size":
+                size, i = sizes[0]
+                chunk_len = sum(len(p) for p in chunk_data)
+                heapreplace(sizes, (size + chunk_len, i))
+            else:
+                i = j % npartitions
+
+            if dedup_memory is not None:
+                row = dedups[i].write_parts(
+                    writers[i],
+                    chunk_name,
+                    chunk_data
+                )
+                doc_starts[i].append(row.start)
+            else:
+                row = writers[i].write_parts(chunk_name, chunk_data)
+
+            doc_names[i].append(row.name)
+            doc_sizes[i].append(row.size)
+
+            if sums:
+                spools[i].add_parts(chunk_name, chunk_data)
+
+        for i, ((_, index_handle), writer) in enumerate(zip(handles, writers)):
+            writer.flush()
+
+            index = FFIndex()
+            index.extend_columns(
+                doc_names[i],
+                doc_sizes[i],
+                start=0,
+                starts=doc_starts[i] if dedup_memory is not None else None,
+            )
+            index.write_to(index_handle)
+
+            if sums:
+                with open(sums_path(index_handle.name), "wb") as handle:
+                    spools[i].write_to(handle)
+
+    finally:
+        for data_handle, index_handle in handles:
+            data_handle.close()
+            index_handle.close()
+
+        for spool in spools:
+            spool.close()
+
+    return
+
+
+def fasta(args: argparse.Namespace) -> None:
+    if args.size < 1:
+        raise InvalidOptionError("--size must be at least 1.")
+
+    # Batches hold a whole number of documents where possible.
+    batches = Seq.parse_batches(
+        chain.from_iterable(args.fasta),
+        n=args.size * max(1, BATCH_SIZE // args.size),
+    )
+    documents = fasta_documents(
+        batches,
+        args.size,
+        positions=args.seq_index is not None
+    )
+
+    if args.seq_index is not None:
+        spool: Optional[BinaryIO] = TemporaryFile()
+        assert spool is not None
+        documents = spool_seq_index(documents, spool)
+    else:
+        spool = None
+
+    if args.partitions is not None:
+        if args.data is not None or args.index is not None:
+            raise InvalidOptionError(
+                "--data and --index can't be used with --partitions."
+            )
+
+        if args.partitions < 1:
+            raise InvalidOptionError("--partitions must be at least 1.")
+
+        fasta_partitions(
+            documents,
+            name=splitext(basename(args.fasta[0].name))[0],
+            template=args.basename,
+            npartitions=args.partitions,
+            partition_by=args.partition_by,
+            buffer_size=args.buffer_size,
+            sums=args.sums,
+            dedup_memory=args.dedup_memory if args.dedup else None,
+        )
+
+    elif args.data is None or args.index is None:
+        raise InvalidOptionError(
+            "Both --data and --index must be specified for 'fasta', "
+            "unless --partitions is used."
+        )
+
+    else:
+        names: List[bytes] = []
+        sizes: List[int] = []
+        sums = SumSpool() if args.sums else None
+
+        if args.dedup:
+            dedup: Optional[DedupTable] = DedupTable(args.dedup_memory)
+            starts: Optional[List[int]] = []
+        else:
+            dedup = None
+            starts = None
+
+        with FFDataWriter(args.data, 0, args.buffer_size) as writer:
+            for chunk_name, chunk_data, _ in documents:
+                if dedup is not None and starts is not None:
+                    row = dedup.write_parts(writer, chunk_name, chunk_data)
+                    starts.append(row.start)
+                else:
+                    row = writer.write_parts(chunk_name, chunk_data)
+
+                names.append(row.name)
+                sizes.append(row.size)
+
+                if sums is not None:
+                    sums.add_parts(chunk_name, chunk_data)
+
+        index = FFIndex()
+        index.extend_columns(names, sizes, start=0, starts=starts)
+        index.write_to(args.index)
+
+        if dedup is not None:
+            print(
+                f"Stored {dedup.hits} duplicate documents only once, "
+                f"saving {dedup.saved_bytes} bytes.",
+                file=sys.stderr
+            )
+
+        if sums is not None:
+            with open(sums_path(args.index.name), "wb") as handle:
+                sums.write_to(handle)
+            sums.close()
 
-        outdb.data.append(chunk_data)
-        outdb.index.append(index)
+    if spool is not None:
+        spool.seek(0)
+        write_seq_index(
+            (SeqIndexRow.parse_line(line) for line in spool),
+            args.seq_index
+        )
+        spool.close()
 
-    outdb.index.write_to(args.index)
     return
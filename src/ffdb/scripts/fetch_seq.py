@@ -0,0 +1,97 @@
+import sys
+import argparse
+
+from typing import Iterator
+
+from ffdb.ffindex import FFDB, ShardedFFDB
+from ffdb.seqindex import SeqIndex
+from ffdb.idlist import read_ids
+from ffdb.exceptions import InvalidOptionError
+
+
+def cli_fetch_seq(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-s", "--seq-index",
+        required=True,
+        type=argparse.FileType('rb'),
+        help="The sequence index written by `ffdb fasta --seq-index`.",
+    )
+
+    parser.add_argument(
+        "-n", "--ids",
+        type=argparse.FileType('rb'),
+        default=None,
+        help="Fetch the sequences with ids in this file. Newline-delimited.",
+    )
+
+    parser.add_argument(
+        "-m", "--manifest",
+        type=argparse.FileType('r'),
+        default=None,
+        help=(
+            "Fetch from the partitions listed in this file instead of a "
+            "single database. The file should have one tab separated ffdata "
+            "and ffindex pair per line."
+        ),
+    )
+
+    parser.add_argument(
+        "-o", "--outfile",
+        type=argparse.FileType('wb'),
+        default=sys.stdout.buffer,
+        help=("Write to this file instead of stdout."),
+    )
+
+    parser.add_argument(
+        "-d", "--data",
+        type=argparse.FileType('rb'),
+        default=None,
+        help="The ffindex .ffdata file.",
+    )
+
+    parser.add_argument(
+        "-i", "--index",
+        type=argparse.FileType('rb'),
+        default=None,
+        help="The ffindex .ffindex file.",
+    )
+
+    parser.add_argument(
+        "id",
+        metavar="ID",
+        nargs="*",
+        type=lambda x: x.encode(),
+        help="The ids of the sequences to fetch.",
+    )
+
+    return
+
+
+def fetch_seq(args: argparse.Namespace) -> None:
+    no_files = args.data is None or args.index is None
+    if (args.manifest is None) == no_files:
+        raise InvalidOptionError(
+            "Either --data and --index, or a --manifest must be given to "
+            "'fetch-seq'."
+        )
+
+    if args.manifest is not None:
+        db: FFDB = ShardedFFDB.from_manifest(args.manifest)
+    else:
+        db = FFDB.from_file(args.data, args.index)
+
+    def ids() -> Iterator[bytes]:
+        yield from args.id
+        if args.ids is not None:
+            yield from read_ids([args.ids])
+        return
+
+    try:
+        seq_index = SeqIndex.from_file(args.seq_index)
+
+        for id_ in ids():
+            args.outfile.write(seq_index.fetch(db, id_))
+    finally:
+        if isinstance(db, ShardedFFDB):
+            db.close()
+    return
@@ -0,0 +1,419 @@
+import re
+import sys
+import argparse
+from bisect import bisect_right
+from multiprocessing import Pool
+
+from typing import Optional, List, Tuple, Iterable, Iterator, Union, BinaryIO
+from typing import Pattern
+
+from ffdb.ffindex import IndexRow, chunk_rows, write_index_rows
+from ffdb.check import CHUNK_SIZE, index_rows
+from ffdb.extsort import external_sort
+from ffdb.exceptions import InvalidOptionError
+
+# A pattern to search for, either a compiled regex or a plain string.
+Searcher = Union[Pattern[bytes], bytes]
+
+# A chunk of the ffdata to search, (start, end, rows sorted by start).
+GrepJob = Tuple[int, int, List[IndexRow]]
+
+
+def cli_grep(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-F", "--fixed-strings",
+        action="store_true",
+        default=False,
+        help="Treat the pattern as a plain string instead of a regex.",
+    )
+
+    parser.add_argument(
+        "--ignore-case",
+        action="store_true",
+        default=False,
+        help="Ignore upper/lower case differences when matching.",
+    )
+
+    parser.add_argument(
+        "-v", "--invert-match",
+        action="store_true",
+        default=False,
+        help="Find the documents that don't match instead.",
+    )
+
+    parser.add_argument(
+        "-c", "--count",
+        action="store_true",
+        default=False,
+        help=(
+            "Print the number of (non-overlapping) matches in each matching "
+            "document after its name, separated by a tab."
+        ),
+    )
+
+    parser.add_argument(
+        "-i", "--index",
+        type=argparse.FileType('wb'),
+        default=None,
+        help=(
+            "Write an ffindex file of the matching documents, instead of "
+            "printing their names. It uses the original ffdata file, so no "
+            "documents are copied."
+        ),
+    )
+
+    parser.add_argument(
+        "-o", "--outfile",
+        type=argparse.FileType('w'),
+        default=sys.stdout,
+        help=("Write to this file instead of stdout."),
+    )
+
+    parser.add_argument(
+        "-j", "--cpus",
+        type=int,
+        default=1,
+        help="The number of processes to search with.",
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help=(
+            "The number of bytes of the ffdata file that each process reads "
+            "at a time. Default: 64MiB."
+        ),
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=1000000,
+        help=(
+            "The maximum number of index rows to sort in memory. "
+            "Larger indices are sorted in pieces using temporary files."
+        ),
+    )
+
+    parser.add_argument(
+        "--tmpdir",
+        type=str,
+        default=None,
+        help="Where to write temporary files for sorting.",
+    )
+
+    parser.add_argument(
+        "pattern",
+        metavar="PATTERN",
+        type=str,
+        help=(
+            "The python regular expression to search for. "
+            "'^' and '$' match at the start and end of lines, and the "
+            "start and end of each document."
+        ),
+    )
+
+    parser.add_argument(
+        "ffdata",
+        metavar="FFDATA_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffdata file.",
+    )
+
+    parser.add_argument(
+        "ffindex",
+        metavar="FFINDEX_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffindex file.",
+    )
+
+    return
+
+
+def get_searcher(
+    pattern: str,
+    fixed: bool = False,
+    ignore_case: bool = False,
+) -> Searcher:
+    """ Compile the pattern, leaving plain strings as bytes if we can.
+
+    Examples:
+    >>> get_searcher("ACGT", fixed=True)
+    b'ACGT'
+    >>> get_searcher("AC.T")
+    re.compile(b'AC.T', re.MULTILINE)
+    """
+
+    bpattern = pattern.encode()
+
+    if fixed and not ignore_case:
+        return bpattern
+    elif fixed:
+        bpattern = re.escape(bpattern)
+
+    flags = re.MULTILINE
+    if ignore_case:
+        flags |= re.IGNORECASE
+
+    return re.compile(bpattern, flags)
+
+
+def search_fixed(
+    buf: bytes,
+    offset: int,
+    rows: List[IndexRow],
+    needle: bytes,
+    count: bool,
+) -> Iterator[Tuple[int, int]]:
+    """ Find the documents containing a plain string.
+
+    The whole buffer is searched at once, and the hits are mapped back to
+    documents with a binary search over the starts of the rows.
+    If any rows share or overlap a range (e.g. after `--dedup`), each
+    document is searched separately instead, so every row is reported.
+    Yields the position of each matching row, and the number of matches if
+    count is True (otherwise 1).
+
+    Examples:
+    >>> rows = [IndexRow(b"a", 0, 4), IndexRow(b"b", 4, 6),
+    ...         IndexRow(b"c", 10, 5)]
+    >>> list(search_fixed(b"ACG\\0TACAC\\0CCAT\\0", 0, rows, b"AC", True))
+    [(0, 1), (1, 2)]
+    >>> rows = [IndexRow(b"a", 0, 5), IndexRow(b"b", 0, 5),
+    ...         IndexRow(b"c", 5, 5)]
+    >>> list(search_fixed(b"ACGT\\0TTTT\\0", 0, rows, b"ACG", False))
+    [(0, 1), (1, 1)]
+
+    An empty string matches every document.
+    >>> rows = [IndexRow(b"a", 0, 3), IndexRow(b"b", 3, 1)]
+    >>> list(search_fixed(b"AC\\0\\0", 0, rows, b"", False))
+    [(0, 1), (1, 1)]
+    """
+
+    starts = [r.start - offset for r in rows]
+
+    if any(
+        starts[i] < starts[i - 1] + rows[i - 1].size
+        for i in range(1, len(rows))
+    ):
+        for i, row in enumerate(rows):
+            # The null terminator isn't part of the document.
+            end = starts[i] + max(0, row.size - 1)
+
+            if count:
+                n = buf.count(needle, starts[i], end)
+                if n > 0:
+                    yield i, n
+            elif buf.find(needle, starts[i], end) >= 0:
+                yield i, 1
+        return
+
+    pos = 0
+    while True:
+        hit = buf.find(needle, pos)
+        if hit < 0:
+            break
+
+        i = bisect_right(starts, hit) - 1
+
+        # The null terminator isn't part of the document.
+        end = starts[i] + rows[i].size - 1 if i >= 0 else 0
+
+        if hit + len(needle) > end:
+            # Spans the end of a document, try again from inside it.
+            pos = hit + 1
+            continue
+
+        if count:
+            yield i, buf.count(needle, hit, end)
+        else:
+            yield i, 1
+
+        # Past the terminator, so an empty needle doesn't match here again.
+        pos = end + 1
+    return
+
+
+def search_regex(
+    buf: bytes,
+    offset: int,
+    rows: List[IndexRow],
+    pattern: Pattern[bytes],
+    count: bool,
+) -> Iterator[Tuple[int, int]]:
+    """ Search each document with a regex, like `search_fixed`.
+
+    Examples:
+    >>> rows = [IndexRow(b"a", 0, 3), IndexRow(b"b", 3, 7)]
+    >>> pattern = get_searcher("^A")
+    >>> list(search_regex(b"AC\\0TACA\\nA\\0", 0, rows, pattern, True))
+    [(0, 1), (1, 1)]
+    """
+
+    view = memoryview(buf)
+    for i, row in enumerate(rows):
+        start = row.start - offset
+
+        # Searching a slice means '^' and '$' match at the start and end of
+        # the document. The null terminator isn't included.
+        document = view[start: start + max(0, row.size - 1)]
+
+        if count:
+            n = sum(1 for _ in pattern.finditer(document))
+            if n > 0:
+                yield i, n
+        elif pattern.search(document) is not None:
+            yield i, 1
+    return
+
+
+# The pattern and data file each worker is using.
+_WORKER_SEARCHER: Optional[Searcher] = None
+_WORKER_HANDLE: Optional[BinaryIO] = None
+
+
+def grep_init(path: str, searcher: Searcher) -> None:
+    global _WORKER_SEARCHER
+    global _WORKER_HANDLE
+
+    _WORKER_SEARCHER = searcher
+    _WORKER_HANDLE = open(path, "rb")
+    return
+
+
+def grep_close() -> None:
+    """ Close the file opened by `grep_init` outside of a pool. """
+
+    global _WORKER_HANDLE
+    if _WORKER_HANDLE is not None:
+        _WORKER_HANDLE.close()
+        _WORKER_HANDLE = None
+    return
+
+
+def grep_chunk(
+    job: Tuple[GrepJob, bool, bool]
+) -> List[Tuple[IndexRow, int]]:
+    """ Search one chunk of the ffdata, read in a single sequential read.
+
+    Returns the matching (or non-matching if invert is True) rows, with
+    the number of matches in each.
+    """
+
+    (start, end, rows), count, invert = job
+
+    assert _WORKER_HANDLE is not None
+    assert _WORKER_SEARCHER is not None
+
+    _WORKER_HANDLE.seek(start)
+    buf = _WORKER_HANDLE.read(end - start)
+
+    if isinstance(_WORKER_SEARCHER, bytes):
+        hits = search_fixed(buf, start, rows, _WORKER_SEARCHER, count)
+    else:
+        hits = search_regex(buf, start, rows, _WORKER_SEARCHER, count)
+
+    if not invert:
+        return [(rows[i], n) for i, n in hits]
+
+    matched = {i for i, _ in hits}
+    return [(r, 0) for i, r in enumerate(rows) if i not in matched]
+
+
+def grep_rows(
+    rows: Iterable[IndexRow],
+    path: str,
+    searcher: Searcher,
+    count: bool = False,
+    invert: bool = False,
+    cpus: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Tuple[IndexRow, int]]:
+    """ Search the documents, yielding matching rows in file order.
+
+    Rows should be sorted by start, so that each process reads its part
+    of the ffdata file sequentially.
+    """
+
+    jobs = (
+        (job, count, invert)
+        for job
+        in chunk_rows(rows, chunk_size)
+    )
+
+    if cpus > 1:
+        with Pool(cpus, grep_init, (path, searcher)) as pool:
+            for chunk in pool.imap(grep_chunk, jobs):
+                yield from chunk
+    else:
+        grep_init(path, searcher)
+        try:
+            for job in jobs:
+                yield from grep_chunk(job)
+        finally:
+            grep_close()
+    return
+
+
+def grep(args: argparse.Namespace) -> None:
+    if args.cpus < 1:
+        raise InvalidOptionError("--cpus must be at least 1.")
+
+    if args.chunk_size < 1:
+        raise InvalidOptionError("--chunk-size must be at least 1.")
+
+    if args.count and args.invert_match:
+        raise InvalidOptionError(
+            "--count can't be used with --invert-match."
+        )
+
+    if args.count and args.index is not None:
+        raise InvalidOptionError("--count can't be used with --index.")
+
+    try:
+        searcher = get_searcher(
+            args.pattern,
+            args.fixed_strings,
+            args.ignore_case
+        )
+    except re.error as e:
+        raise InvalidOptionError(f"The pattern isn't a valid regex: {e}.")
+
+    rows = external_sort(
+        index_rows(args.ffindex, []),
+        key=lambda r: r.start,
+        buffer_size=args.buffer_size,
+        tmpdir=args.tmpdir,
+    )
+
+    hits = grep_rows(
+        rows,
+        args.ffdata.name,
+        searcher,
+        count=args.count,
+        invert=args.invert_match,
+        cpus=args.cpus,
+        chunk_size=args.chunk_size,
+    )
+
+    if args.index is not None:
+        write_index_rows(
+            external_sort(
+                (row for row, _ in hits),
+                key=lambda r: r.name,
+                buffer_size=args.buffer_size,
+                tmpdir=args.tmpdir,
+            ),
+            args.index
+        )
+
+    elif args.count:
+        for row, n in hits:
+            print(f"{row.name.decode()}\t{n}", file=args.outfile)
+
+    else:
+        for row, _ in hits:
+            print(row.name.decode(), file=args.outfile)
+
+    return
@@ -1,8 +1,8 @@
 import argparse
 from collections import defaultdict
 
-from ffdb.ffindex import FFDB
-from ffdb.ffindex import IndexRow
+from ffdb.ffindex import FFDB, ShardedFFDB
+from ffdb.ffindex import FFIndex, NumericFFIndex, FFDataWriter
 
 
 def cli_join_concat(parser):
@@ -20,10 +20,36 @@ def cli_join_concat(parser):
         help="The path to write the ffindex file to.",
     )
 
+    parser.add_argument(
+        "-m", "--manifest",
+        type=argparse.FileType('r'),
+        action="append",
+        default=[],
+        help=(
+            "A file listing the shards of a partitioned database, "
+            "with one tab separated ffdata and ffindex pair per line. "
+            "The shards are joined as if they were a single database. "
+            "Can be given multiple times."
+        ),
+    )
+
+    parser.add_argument(
+        "--keys",
+        choices=["bytes", "numeric", "auto"],
+        default="bytes",
+        help=(
+            "How to treat the document names. 'numeric' is for MMseqs2 "
+            "style integer keys, which are stored compactly and written in "
+            "numeric order (e.g. 2 before 10). 'auto' uses numeric keys if "
+            "every name is a number. Default: bytes, names are sorted as "
+            "text, as the ffindex tools expect."
+        ),
+    )
+
     parser.add_argument(
         "ffdata",
         metavar="FFDATA",
-        nargs="+",
+        nargs="*",
         type=argparse.FileType('rb'),
         help="The ffindex .ffdata file.",
     )
@@ -31,7 +57,7 @@ def cli_join_concat(parser):
     parser.add_argument(
         "ffindex",
         metavar="FFINDEX",
-        nargs="+",
+        nargs="*",
         type=argparse.FileType('rb'),
         help="The ffindex .ffindex file.",
     )
@@ -40,28 +66,44 @@ def cli_join_concat(parser):
 
 
 def join_concat(args):
-    outdb = FFDB.new(args.data)
-
     indbs = []
     for (data, index) in zip(args.ffdata, args.ffindex):
-        indb = FFDB.from_file(data, index)
+        indb = FFDB.from_file(data, index, keys=args.keys)
         indbs.append(indb)
 
-    index_names = defaultdict(list)
-    for indb in indbs:
-        for index_row in indb.index:
-            index_names[index_row.name].append((index_row, indb.data))
+    manifests = [ShardedFFDB.from_manifest(m) for m in args.manifest]
+    indbs.extend(manifests)
+
+    names = []
+    sizes = []
+    try:
+        index_names = defaultdict(list)
+        for indb in indbs:
+            for index_row in indb.index:
+                index_names[index_row.name].append((index_row, indb.data))
+
+        with FFDataWriter(args.data, 0) as writer:
+            for index_name in index_names.keys():
+                # The documents are interleaved with newlines as they are
+                # written, rather than being joined.
+                parts = []
+                for index_row, data in index_names[index_name]:
+                    doc = data[index_row]
+                    parts.append(doc.rstrip(b"\0\n"))
+                    parts.append(b"\n")
 
-    for index_name in index_names.keys():
-        new_documents = []
-        for index_row, data in index_names[index_name]:
-            doc = data[index_row]
-            new_documents.append(doc.rstrip(b"\0\n"))
+                new_index = writer.write_parts(index_name, parts)
+                names.append(new_index.name)
+                sizes.append(new_index.size)
+    finally:
+        for manifest in manifests:
+            manifest.close()
 
-        new_document = b'\n'.join(new_documents) + b'\n\0'
-        new_index = IndexRow(index_name, 0, len(new_document))
-        outdb.index.append(new_index)
-        outdb.data.append(new_document)
+    if all(isinstance(db.index, NumericFFIndex) for db in indbs):
+        outindex: FFIndex = NumericFFIndex()
+    else:
+        outindex = FFIndex()
 
-    outdb.index.write_to(args.index)
+    outindex.extend_columns(names, sizes, start=0)
+    outindex.write_to(args.index)
     return
@@ -0,0 +1,452 @@
+import os
+import shlex
+import argparse
+import subprocess
+import multiprocessing as mp
+from glob import glob
+from queue import Full
+from importlib import import_module
+from os.path import join as pjoin
+
+from typing import Optional, List, Set, Tuple, Callable, BinaryIO
+from typing import Iterable
+
+from ffdb.ffindex import FFDB, FFData, FFIndex, IndexRow, FFDataWriter
+from ffdb.exceptions import FFMapError, InvalidOptionError
+
+
+MapFunction = Callable[[bytes, bytes], Optional[bytes]]
+
+
+def cli_map(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-d", "--data",
+        required=True,
+        type=str,
+        help="The path to write the ffdata file to.",
+    )
+
+    parser.add_argument(
+        "-i", "--index",
+        required=True,
+        type=str,
+        help="The path to write the ffindex file to.",
+    )
+
+    parser.add_argument(
+        "-c", "--command",
+        type=str,
+        default=None,
+        help=(
+            "The command to run for each document. "
+            "The document is piped to stdin, and stdout becomes the "
+            "output document. The name of the document is available in the "
+            "FFDB_NAME environment variable. The command is split using "
+            "shell-like quoting but is not run in a shell, so use "
+            "`sh -c '...'` if you need pipes."
+        )
+    )
+
+    parser.add_argument(
+        "-f", "--function",
+        type=str,
+        default=None,
+        help=(
+            "A python function to call for each document, given as "
+            "`module:function`. It will be called with the document name and "
+            "contents (both bytes), and should return the output document as "
+            "bytes, or None to skip writing an output document."
+        )
+    )
+
+    parser.add_argument(
+        "-j", "--cpus",
+        type=int,
+        default=1,
+        help="The number of worker processes to use.",
+    )
+
+    parser.add_argument(
+        "-t", "--tmpdir",
+        type=str,
+        default=None,
+        help=(
+            "The directory to store the partial per-worker databases and "
+            "checkpoints in. Default is the --data path with '.parts' "
+            "appended. If a previous run was interrupted, running the same "
+            "command again will skip any documents that were already "
+            "completed."
+        )
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=0,
+        help=(
+            "The number of bytes of output documents each worker buffers "
+            "before writing them. Documents in the buffer aren't "
+            "checkpointed yet, so they are redone if the run is "
+            "interrupted. Default: 0, write each document straight away."
+        ),
+    )
+
+    parser.add_argument(
+        "ffdata",
+        metavar="FFDATA_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffdata file.",
+    )
+
+    parser.add_argument(
+        "ffindex",
+        metavar="FFINDEX_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffindex file.",
+    )
+
+    return
+
+
+def part_paths(tmpdir: str, part: int) -> Tuple[str, str, str]:
+    """ The data, index, and checkpoint paths for a worker. """
+
+    return (
+        pjoin(tmpdir, f"part_{part}.ffdata"),
+        pjoin(tmpdir, f"part_{part}.ffindex"),
+        pjoin(tmpdir, f"part_{part}.done"),
+    )
+
+
+def list_parts(tmpdir: str) -> List[int]:
+    """ Find the worker numbers of any existing partial databases. """
+
+    parts = []
+    for path in glob(pjoin(tmpdir, "part_*.ffindex")):
+        part = os.path.basename(path)[len("part_"):-len(".ffindex")]
+        parts.append(int(part))
+
+    return sorted(parts)
+
+
+def recover_part(tmpdir: str, part: int) -> Set[bytes]:
+    """ Clean up a partial database from an interrupted run.
+
+    The index rows are only written once the document data is flushed, so
+    anything in the .ffdata file after the last complete index row, or
+    an incomplete last line in the .ffindex file, was from a document
+    that didn't finish. These are truncated so the worker can append to the
+    files again.
+
+    Returns the names of all completed documents.
+    """
+
+    data_path, index_path, done_path = part_paths(tmpdir, part)
+    done: Set[bytes] = set()
+
+    end = 0
+    complete = 0
+    with open(index_path, "rb") as handle:
+        for line in handle:
+            if not line.endswith(b"\n"):
+                break
+
+            row = IndexRow.parse_ffindex_line(line)
+            end = max(end, row.start + row.size)
+            complete += len(line)
+            done.add(row.name)
+
+    os.truncate(index_path, complete)
+    if os.path.exists(data_path):
+        os.truncate(data_path, end)
+
+    if os.path.exists(done_path):
+        complete = 0
+        with open(done_path, "rb") as handle:
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break
+
+                complete += len(line)
+                done.add(line.rstrip(b"\n"))
+
+        os.truncate(done_path, complete)
+
+    return done
+
+
+def get_function(
+    command: Optional[str],
+    function: Optional[str]
+) -> MapFunction:
+    """ Construct the callable that is applied to each document. """
+
+    if function is not None:
+        module_name, _, function_name = function.partition(":")
+        if function_name == "":
+            raise InvalidOptionError(
+                "The --function should be given as `module:function`."
+            )
+
+        module = import_module(module_name)
+        return getattr(module, function_name)
+
+    assert command is not None
+    cmd = shlex.split(command)
+
+    def run_command(name: bytes, document: bytes) -> Optional[bytes]:
+        env = dict(os.environ)
+        env["FFDB_NAME"] = name.decode("utf-8")
+
+        result = subprocess.run(
+            cmd,
+            input=document,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+
+        if result.returncode != 0:
+            raise FFMapError(
+                f"Command exited with code {result.returncode} while "
+                f"processing document {name.decode()}."
+            )
+        return result.stdout
+
+    return run_command
+
+
+def map_worker(
+    part: int,
+    ffdata_path: str,
+    tmpdir: str,
+    command: Optional[str],
+    function: Optional[str],
+    queue: "mp.Queue[Optional[IndexRow]]",
+    errors: "mp.Queue[str]",
+    buffer_size: int = 0,
+) -> None:
+    """ Apply the function to documents from the queue.
+
+    Each worker appends to it's own partial database, so the workers never
+    need to coordinate writes. Output documents are buffered up to
+    `buffer_size` bytes, and are checkpointed as soon as they are written.
+    """
+
+    data_path, index_path, done_path = part_paths(tmpdir, part)
+
+    try:
+        func = get_function(command, function)
+
+        with open(ffdata_path, "rb") as in_handle, \
+                open(data_path, "ab") as data_handle, \
+                open(index_path, "ab") as index_handle, \
+                open(done_path, "ab") as done_handle:
+
+            indata = FFData(in_handle)
+            writer = FFDataWriter(data_handle, buffer_size=buffer_size)
+
+            # Rows for documents that are still in the write buffer.
+            # They're only written once the data is on disk.
+            out_rows: List[IndexRow] = []
+
+            while True:
+                row = queue.get()
+                if row is None:
+                    break
+
+                document = indata[row]
+                assert isinstance(document, bytes)
+
+                # Take up to :-1 to strip the null byte
+                result = func(row.name, document[:-1])
+
+                if result is None:
+                    done_handle.write(row.name + b"\n")
+                    done_handle.flush()
+                    continue
+
+                out_rows.append(writer.write(row.name, result))
+
+                if writer.pending_size == 0:
+                    write_rows(out_rows, index_handle)
+
+            writer.flush()
+            write_rows(out_rows, index_handle)
+
+    except Exception as e:
+        msg = e.msg if isinstance(e, FFMapError) else repr(e)
+        errors.put(f"Worker {part} failed: {msg}")
+
+    return
+
+
+def write_rows(rows: List[IndexRow], handle: BinaryIO) -> None:
+    """ Checkpoint the rows of documents that have been written. """
+
+    for row in rows:
+        handle.write(bytes(row) + b"\n")
+
+    handle.flush()
+    rows.clear()
+    return
+
+
+def feed_queue(
+    queue: "mp.Queue[Optional[IndexRow]]",
+    row: Optional[IndexRow],
+    workers: List[mp.Process],
+) -> None:
+    """ Put a row on the queue, bailing out if all workers have died. """
+
+    while True:
+        try:
+            queue.put(row, timeout=1)
+            return
+        except Full:
+            if not any(w.is_alive() for w in workers):
+                raise FFMapError(
+                    "All map workers exited before all documents were "
+                    "processed."
+                )
+
+
+def merge_parts(tmpdir: str, outdb: FFDB) -> None:
+    """ Concatenate the partial databases onto the output database. """
+
+    handles = []
+
+    try:
+        dbs = []
+        for part in list_parts(tmpdir):
+            data_path, index_path, _ = part_paths(tmpdir, part)
+
+            pdata = open(data_path, "rb")
+            pindex = open(index_path, "rb")
+            handles.extend([pdata, pindex])
+
+            dbs.append(FFDB.from_file(pdata, pindex))
+
+        outdb.concat(dbs)
+    finally:
+        for handle in handles:
+            handle.close()
+
+    return
+
+
+def remove_parts(tmpdir: str) -> None:
+    for part in list_parts(tmpdir):
+        for path in part_paths(tmpdir, part):
+            if os.path.exists(path):
+                os.remove(path)
+
+    os.rmdir(tmpdir)
+    return
+
+
+def map_rows(
+    rows: Iterable[IndexRow],
+    ffdata_path: str,
+    tmpdir: str,
+    command: Optional[str],
+    function: Optional[str],
+    cpus: int = 1,
+    buffer_size: int = 0,
+) -> None:
+    """ Apply the command or function to the documents for rows.
+
+    The outputs are written to partial databases in tmpdir, see
+    `merge_parts`. Documents that were completed by an earlier run in the
+    same tmpdir are skipped.
+    """
+
+    os.makedirs(tmpdir, exist_ok=True)
+
+    done: Set[bytes] = set()
+    for part in list_parts(tmpdir):
+        done.update(recover_part(tmpdir, part))
+
+    queue: "mp.Queue[Optional[IndexRow]]" = mp.Queue(maxsize=cpus * 64)
+    errors: "mp.Queue[str]" = mp.Queue()
+
+    workers = []
+    for part in range(cpus):
+        worker = mp.Process(
+            target=map_worker,
+            args=(
+                part,
+                ffdata_path,
+                tmpdir,
+                command,
+                function,
+                queue,
+                errors,
+                buffer_size,
+            ),
+        )
+        worker.start()
+        workers.append(worker)
+
+    messages = []
+    try:
+        for row in rows:
+            if row.name in done:
+                continue
+            feed_queue(queue, row, workers)
+
+        for _ in workers:
+            feed_queue(queue, None, workers)
+
+    except FFMapError as e:
+        messages.append(e.msg)
+
+    finally:
+        for worker in workers:
+            worker.join()
+
+    while not errors.empty():
+        messages.insert(0, errors.get())
+
+    if len(messages) > 0:
+        raise FFMapError(
+            "\n".join(messages) +
+            "\nCompleted documents are checkpointed, so you can run the "
+            "same command again to resume."
+        )
+    return
+
+
+def map_documents(args: argparse.Namespace) -> None:
+    if (args.command is None) == (args.function is None):
+        raise InvalidOptionError(
+            "Exactly one of --command or --function must be specified for "
+            "the 'map' subcommand."
+        )
+
+    if args.cpus < 1:
+        raise InvalidOptionError("--cpus must be at least 1.")
+
+    tmpdir = args.tmpdir
+    if tmpdir is None:
+        tmpdir = args.data + ".parts"
+
+    index = FFIndex.from_file(args.ffindex)
+
+    map_rows(
+        index,
+        args.ffdata.name,
+        tmpdir,
+        args.command,
+        args.function,
+        args.cpus,
+        args.buffer_size,
+    )
+
+    with open(args.data, "wb") as data_handle, \
+            open(args.index, "wb") as index_handle:
+        outdb = FFDB.new(data_handle)
+        merge_parts(tmpdir, outdb)
+        outdb.index.write_to(index_handle)
+
+    remove_parts(tmpdir)
+    return
@@ -1,9 +1,47 @@
 import argparse
-import mmap
+from multiprocessing import Pool
+from itertools import islice
 
-from typing import Optional, List, cast, BinaryIO
+from typing import Optional, List, Tuple, Any
+from typing import Callable, Dict, Iterable, Iterator
 
-from ffdb.ffindex import FFDB, IndexRow
+from ffdb.ffindex import FFData, MappedFFData, SortedFFIndex, IndexRow
+from ffdb.ffindex import write_index_rows, prefetch
+from ffdb.extsort import external_sort
+from ffdb.exceptions import FFKeyError, FFOrderError
+
+
+def numeric_key(row: IndexRow) -> Tuple[int, Any]:
+    """ Sort names as integers where possible, otherwise put them last. """
+
+    try:
+        return (0, int(row.name))
+    except ValueError:
+        return (1, row.name)
+
+
+INDEX_KEYS: Dict[str, Callable[[IndexRow], Any]] = {
+    "size": lambda r: -r.size,
+    "name": lambda r: r.name,
+    "numeric": numeric_key,
+}
+
+
+def count_records(document: bytes) -> int:
+    """ Count the number of fasta records in a document. """
+
+    return document.count(b"\n>") + document.startswith(b">")
+
+
+def first_line(document: bytes) -> bytes:
+    return document.split(b"\n", 1)[0].rstrip(b"\0\r")
+
+
+CONTENT_KEYS: Dict[str, Callable[[bytes], Any]] = {
+    "records": count_records,
+    "lines": lambda d: d.rstrip(b"\0\n").count(b"\n") + 1,
+    "firstline": first_line,
+}
 
 
 def cli_order(parser: argparse.ArgumentParser):
@@ -32,22 +70,76 @@ def cli_order(parser: argparse.ArgumentParser):
         )
     )
 
-    # TODO add reverse option?
+    parser.add_argument(
+        "-k", "--key",
+        choices=sorted(list(INDEX_KEYS.keys()) + list(CONTENT_KEYS.keys())),
+        default="size",
+        help=(
+            "What to sort the documents by. "
+            "'size' puts the largest documents first, 'name' sorts by the "
+            "name as text, and 'numeric' sorts names as integers. "
+            "'records', 'lines' and 'firstline' sort by the number of "
+            "fasta records, the number of lines, or the first line of each "
+            "document, and need to read the whole ffdata file. "
+            "Ignored if --order is given. Default: size."
+        )
+    )
+
+    parser.add_argument(
+        "-r", "--reverse",
+        action="store_true",
+        default=False,
+        help="Reverse the sort order.",
+    )
+
+    parser.add_argument(
+        "-j", "--cpus",
+        type=int,
+        default=1,
+        help="The number of processes to use to compute content sort keys.",
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=1000000,
+        help=(
+            "The maximum number of documents to sort in memory. "
+            "Larger databases are sorted in pieces using temporary files."
+        ),
+    )
+
+    parser.add_argument(
+        "--tmpdir",
+        type=str,
+        default=None,
+        help="Where to write temporary files for sorting.",
+    )
 
     parser.add_argument(
         "--mmap",
         action="store_true",
         default=False,
-        help=("Memory map the input hhdata file before reading chunks. "
+        help=("Memory map the input ffdata file before reading chunks. "
               "This will significantly reduce IO overhead when doing balanced "
-              "or sorted chunks, but requires enough memory to store the "
-              "entire ffdata file."),
+              "or sorted chunks. The file is mapped in windows, so it "
+              "doesn't need to fit in memory."),
+    )
+
+    parser.add_argument(
+        "--mmap-memory",
+        type=int,
+        default=1024 * 1024 * 1024,
+        help=(
+            "The maximum number of bytes of the ffdata file to have mapped "
+            "at once when using --mmap. Default: 1GiB."
+        ),
     )
 
     parser.add_argument(
         "ffdata",
         metavar="FFDATA_FILE",
-        type=argparse.FileType('r+b'),
+        type=argparse.FileType('rb'),
         help="The ffindex .ffdata file.",
     )
 
@@ -61,47 +153,224 @@ def cli_order(parser: argparse.ArgumentParser):
     return
 
 
+# The documents that each content key worker is reading from.
+_WORKER_DATA: Optional[FFData] = None
+
+
+def content_key_init(path: str) -> None:
+    global _WORKER_DATA
+    _WORKER_DATA = FFData(open(path, "rb"))
+    return
+
+
+def content_key_close() -> None:
+    """ Close the file opened by `content_key_init` outside of a pool. """
+
+    global _WORKER_DATA
+    if _WORKER_DATA is not None:
+        _WORKER_DATA.handle.close()
+        _WORKER_DATA = None
+    return
+
+
+def content_keys(
+    job: Tuple[str, List[IndexRow]]
+) -> List[Tuple[Any, bytes, int, int]]:
+    """ Compute a content sort key for a chunk of rows. """
+
+    key, rows = job
+    func = CONTENT_KEYS[key]
+
+    assert _WORKER_DATA is not None
+    _WORKER_DATA.will_need(rows)
+
+    out = []
+    for row in rows:
+        document = _WORKER_DATA[row]
+        assert isinstance(document, bytes)
+        out.append((func(document), row.name, row.start, row.size))
+
+    return out
+
+
+def chunks(
+    key: str,
+    rows: Iterable[IndexRow],
+    size: int = 1000
+) -> Iterator[Tuple[str, List[IndexRow]]]:
+    irows = iter(rows)
+    while True:
+        chunk = list(islice(irows, size))
+        if len(chunk) == 0:
+            break
+        yield key, chunk
+    return
+
+
+def keyed_rows(
+    index: SortedFFIndex,
+    key: str,
+    data_path: str,
+    cpus: int = 1,
+) -> Iterator[Tuple[Any, bytes, int, int]]:
+    """ Yield tuples of (key, name, start, size) for each row. """
+
+    if key in INDEX_KEYS:
+        func = INDEX_KEYS[key]
+        for row in index:
+            yield (func(row), row.name, row.start, row.size)
+        return
+
+    if cpus > 1:
+        with Pool(cpus, content_key_init, (data_path,)) as pool:
+            for chunk in pool.imap(content_keys, chunks(key, index)):
+                yield from chunk
+    else:
+        content_key_init(data_path)
+        try:
+            for job in chunks(key, index):
+                yield from content_keys(job)
+        finally:
+            content_key_close()
+    return
+
+
+def rows_from_file(
+    index: SortedFFIndex,
+    handle: Iterable[bytes],
+    reverse: bool = False,
+    buffer_size: int = 1000000,
+    tmpdir: Optional[str] = None,
+) -> Iterator[IndexRow]:
+    """ Yield the rows named in an order file, in that order.
+
+    The ids are sorted externally, so that duplicates can be found and the
+    rows looked up in index order, and then put back in the file's order.
+    Every id is checked before the first row is yielded.
+
+    Examples:
+    >>> index = SortedFFIndex(b"a\\t0\\t2\\nb\\t2\\t3\\n")
+    >>> [r.name for r in rows_from_file(index, [b"b\\n", b"\\n", b"a\\n"])]
+    [b'b', b'a']
+    >>> try:
+    ...     list(rows_from_file(index, [b"b\\n", b"a\\n", b"b\\n"]))
+    ... except FFOrderError as e:
+    ...     print(e.msg)
+    The id b appears more than once in the order file.
+    """
+
+    ids = external_sort(
+        (
+            (sline, i)
+            for i, sline in enumerate(line.strip() for line in handle)
+            if len(sline) > 0
+        ),
+        buffer_size=buffer_size,
+        tmpdir=tmpdir,
+    )
+
+    def lookup() -> Iterator[Tuple[int, IndexRow]]:
+        previous: Optional[bytes] = None
+        for sline, i in ids:
+            if sline == previous:
+                raise FFOrderError(
+                    f"The id {sline.decode()} appears more than once in the "
+                    "order file."
+                )
+            previous = sline
+
+            try:
+                row = index[sline]
+            except KeyError:
+                raise FFKeyError(
+                    f"The id {sline.decode()} in the order file is not in "
+                    "the ffindex file."
+                )
+
+            assert isinstance(row, IndexRow)
+            yield i, row
+        return
+
+    for _, row in external_sort(
+        lookup(),
+        key=lambda x: x[0],
+        reverse=reverse,
+        buffer_size=buffer_size,
+        tmpdir=tmpdir,
+    ):
+        yield row
+    return
+
+
+def write_documents(
+    indata: FFData,
+    outdata: FFData,
+    rows: Iterable[IndexRow],
+    readahead: int = 256,
+) -> Iterator[IndexRow]:
+    """ Copy documents in order, yielding the new index rows.
+
+    The next `readahead` documents are read in the background while the
+    current ones are being written.
+    """
+
+    for row, document in prefetch(indata, rows, readahead, background=True):
+        start = outdata.end
+        outdata.append(document)
+        yield IndexRow(row.name, start, len(document))
+    return
+
+
 def order(args: argparse.Namespace) -> None:
+    mm: Optional[MappedFFData] = None
+
     try:
         if args.mmap:
-            mm: Optional[BinaryIO] = cast(
-                BinaryIO,
-                mmap.mmap(args.ffdata.fileno(), 0)
+            mm = MappedFFData(
+                args.ffdata,
+                max_memory=args.mmap_memory,
+                advice="random"
             )
-            # For type checker
-            assert mm is not None
-            db = FFDB.from_file(mm, args.ffindex)
+            indata: FFData = mm
         else:
-            mm = None
-            db = FFDB.from_file(args.ffdata, args.ffindex)
+            indata = FFData(args.ffdata)
 
-        if args.order is not None:
+        index = SortedFFIndex.from_file(args.ffindex)
 
-            # This lorder junk is just for the typechecker
-            lorder: List[IndexRow] = []
-
-            for line in args.order:
-                sline = line.strip()
-                if len(sline) == 0:
-                    continue
+        if args.order is not None:
+            rows: Iterable[IndexRow] = rows_from_file(
+                index,
+                args.order,
+                reverse=args.reverse,
+                buffer_size=args.buffer_size,
+                tmpdir=args.tmpdir,
+            )
 
-                ir = db.index[sline]
-                assert isinstance(ir, IndexRow)
-                lorder.append(ir)
+        else:
+            # Documents with equal keys stay in the order of the ffdata file.
+            keyed = external_sort(
+                keyed_rows(index, args.key, args.ffdata.name, args.cpus),
+                key=lambda x: (x[0], x[2]),
+                reverse=args.reverse,
+                buffer_size=args.buffer_size,
+                tmpdir=args.tmpdir,
+            )
 
-            torder: Optional[List[IndexRow]] = lorder
+            rows = (IndexRow(n, s, z) for _, n, s, z in keyed)
 
-        else:
-            torder = None
+        outdata = FFData(args.data)
+        new_rows = write_documents(indata, outdata, rows)
 
-        outdb = FFDB.reorder_from(
-            other=db,
-            data_handle=args.data,
-            order=torder
+        write_index_rows(
+            external_sort(
+                new_rows,
+                key=lambda r: r.name,
+                buffer_size=args.buffer_size,
+                tmpdir=args.tmpdir,
+            ),
+            args.index
         )
 
-        outdb.index.write_to(args.index)
-
     finally:
         if mm is not None:
             mm.close()
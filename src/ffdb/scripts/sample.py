@@ -0,0 +1,383 @@
+import sys
+import random
+import argparse
+from itertools import islice
+from math import exp, floor, log
+
+from typing import List, Dict, Iterable, Iterator, Generic, TypeVar
+
+from ffdb.ffindex import FFDB, FFData, FFIndex, IndexRow, write_index_rows
+from ffdb.check import index_rows
+from ffdb.exceptions import InvalidOptionError
+
+T = TypeVar("T")
+
+
+def cli_sample(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-d", "--data",
+        type=argparse.FileType('wb'),
+        default=None,
+        help=(
+            "The path to write the ffdata file to. If this isn't given, only "
+            "--index is written, and it uses the original ffdata file."
+        ),
+    )
+
+    parser.add_argument(
+        "-i", "--index",
+        required=True,
+        type=argparse.FileType('wb'),
+        help="The path to write the ffindex file to.",
+    )
+
+    parser.add_argument(
+        "-n", "--number",
+        type=int,
+        default=None,
+        help="Sample exactly this many documents (or all of them, if fewer).",
+    )
+
+    parser.add_argument(
+        "-f", "--fraction",
+        type=float,
+        default=None,
+        help=(
+            "Keep each document with this probability instead, so the number "
+            "sampled varies a little between seeds."
+        ),
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help=(
+            "The random seed to use. Sampling the same index with the same "
+            "seed gives the same documents. By default it's random."
+        ),
+    )
+
+    parser.add_argument(
+        "-s", "--stratify-by-size",
+        action="store_true",
+        default=False,
+        help=(
+            "Sample separately from documents in each power of two size bin "
+            "(as in `ffdb stats`), so that unusually small or large "
+            "documents are represented. This keeps up to --number rows for "
+            "each bin in memory. Can't be used with --fraction."
+        ),
+    )
+
+    parser.add_argument(
+        "--allocation",
+        choices=["proportional", "equal"],
+        default="proportional",
+        help=(
+            "How to divide --number between the size bins with "
+            "--stratify-by-size. 'proportional' samples bins in proportion "
+            "to the number of documents in them, and 'equal' takes the same "
+            "number from each bin where possible. Default: proportional."
+        ),
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=16 * 1024 * 1024,
+        help=(
+            "The maximum number of bytes to copy at a time when writing "
+            "--data. Default: 16MiB."
+        ),
+    )
+
+    parser.add_argument(
+        "ffdata",
+        metavar="FFDATA_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffdata file.",
+    )
+
+    parser.add_argument(
+        "ffindex",
+        metavar="FFINDEX_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffindex file.",
+    )
+
+    return
+
+
+def _open_random(rng: random.Random) -> float:
+    """ A random number strictly between 0 and 1. """
+
+    u = 0.0
+    while u == 0.0:
+        u = rng.random()
+    return u
+
+
+class Reservoir(Generic[T]):
+
+    def __init__(self, size: int, rng: random.Random) -> None:
+        """ A uniform random sample of up to `size` items from a stream.
+
+        This uses reservoir sampling with geometric skips (Li's
+        "Algorithm L"), so random numbers are only drawn for the items that
+        are kept, and `extend` can skip over the rest without looking at
+        them.
+
+        Examples:
+        >>> res = Reservoir(3, random.Random(1))
+        >>> res.extend(range(1000))
+        >>> len(res.items)
+        3
+        >>> res2 = Reservoir(3, random.Random(1))
+        >>> for i in range(1000):
+        ...     res2.add(i)
+        >>> res2.items == res.items
+        True
+        """
+
+        self.size = size
+        self.rng = rng
+        self.items: List[T] = []
+
+        self.seen = 0
+        self.weight = 1.0
+        self.next_index = size - 1
+        return
+
+    def _skip(self) -> None:
+        self.weight *= exp(log(_open_random(self.rng)) / self.size)
+        self.next_index += floor(
+            log(_open_random(self.rng)) / log(1 - self.weight)
+        ) + 1
+        return
+
+    def add(self, item: T) -> None:
+        i = self.seen
+        self.seen += 1
+
+        if i < self.size:
+            self.items.append(item)
+            if self.seen == self.size:
+                self._skip()
+
+        elif i == self.next_index:
+            self.items[self.rng.randrange(self.size)] = item
+            self._skip()
+        return
+
+    def extend(self, items: Iterable[T]) -> None:
+        """ Add many items, skipping the ones that won't be kept.
+
+        `seen` isn't updated after the last kept item.
+        """
+
+        if self.size == 0:
+            return
+
+        it = iter(items)
+        while len(self.items) < self.size:
+            item = next(it, None)
+            if item is None:
+                return
+            self.add(item)
+
+        while True:
+            skip = self.next_index - self.seen
+            item = next(islice(it, skip, None), None)
+            if item is None:
+                return
+
+            self.seen += skip
+            self.add(item)
+
+
+def bernoulli_sample(
+    items: Iterable[T],
+    fraction: float,
+    rng: random.Random,
+) -> Iterator[T]:
+    """ Keep each item with probability `fraction`, in the order given.
+
+    The gaps between kept items are drawn directly, so the skipped items
+    aren't looked at.
+
+    Examples:
+    >>> kept = list(bernoulli_sample(range(100000), 0.01, random.Random(1)))
+    >>> 800 < len(kept) < 1200
+    True
+    >>> kept == sorted(kept)
+    True
+    """
+
+    if fraction <= 0:
+        return
+    elif fraction >= 1:
+        yield from items
+        return
+
+    log_q = log(1 - fraction)
+    it = iter(items)
+
+    while True:
+        skip = floor(log(_open_random(rng)) / log_q)
+        item = next(islice(it, skip, None), None)
+        if item is None:
+            return
+        yield item
+
+
+def allocate(
+    counts: Dict[int, int],
+    n: int,
+    how: str = "proportional",
+) -> Dict[int, int]:
+    """ Divide a sample of n between strata with the given sizes.
+
+    'proportional' uses the largest remainder method, and 'equal' gives
+    each stratum the same share, passing on what the smaller strata can't
+    use.
+
+    Examples:
+    >>> allocate({0: 90, 1: 9, 2: 1}, 10)
+    {0: 9, 1: 1, 2: 0}
+    >>> allocate({0: 90, 1: 9, 2: 1}, 10, "equal")
+    {0: 5, 1: 4, 2: 1}
+    """
+
+    total = sum(counts.values())
+    n = min(n, total)
+    quotas = {s: 0 for s in sorted(counts)}
+
+    if n == 0:
+        return quotas
+
+    if how == "proportional":
+        remainders = []
+        for s in quotas:
+            quotas[s], rem = divmod(n * counts[s], total)
+            remainders.append((-rem, s))
+
+        left = n - sum(quotas.values())
+        for _, s in sorted(remainders)[:left]:
+            quotas[s] += 1
+        return quotas
+
+    while n > 0:
+        available = [s for s in quotas if quotas[s] < counts[s]]
+        share, extra = divmod(n, len(available))
+
+        for i, s in enumerate(available):
+            give = min(counts[s] - quotas[s], share + (i < extra))
+            quotas[s] += give
+            n -= give
+
+    return quotas
+
+
+def stratified_sample(
+    rows: Iterable[IndexRow],
+    n: int,
+    rng: random.Random,
+    how: str = "proportional",
+) -> List[IndexRow]:
+    """ Sample n rows, stratified by power of two size bins.
+
+    Examples:
+    >>> rows = [IndexRow(str(i).encode(), i, 10 ** (i % 3))
+    ...         for i in range(90)]
+    >>> sample = stratified_sample(rows, 9, random.Random(1))
+    >>> sorted(r.size for r in sample)
+    [1, 1, 1, 10, 10, 10, 100, 100, 100]
+    """
+
+    reservoirs: Dict[int, Reservoir[IndexRow]] = {}
+
+    for row in rows:
+        stratum = row.size.bit_length()
+        if stratum not in reservoirs:
+            reservoirs[stratum] = Reservoir(n, rng)
+        reservoirs[stratum].add(row)
+
+    quotas = allocate(
+        {s: r.seen for s, r in reservoirs.items()},
+        n,
+        how
+    )
+
+    sample: List[IndexRow] = []
+    for stratum, quota in quotas.items():
+        sample.extend(rng.sample(reservoirs[stratum].items, quota))
+
+    return sample
+
+
+def sample(args: argparse.Namespace) -> None:
+    if (args.number is None) == (args.fraction is None):
+        raise InvalidOptionError(
+            "Exactly one of --number or --fraction must be specified for "
+            "the 'sample' subcommand."
+        )
+
+    if args.number is not None and args.number < 0:
+        raise InvalidOptionError("--number can't be negative.")
+
+    if args.fraction is not None and not (0 <= args.fraction <= 1):
+        raise InvalidOptionError("--fraction must be between 0 and 1.")
+
+    if args.stratify_by_size and args.fraction is not None:
+        raise InvalidOptionError(
+            "--stratify-by-size can't be used with --fraction."
+        )
+
+    rng = random.Random(args.seed)
+
+    # Lines that aren't sampled are never parsed.
+    lines = (line for line in args.ffindex if not line.isspace())
+
+    if args.stratify_by_size:
+        rows = stratified_sample(
+            index_rows(lines, []),
+            args.number,
+            rng,
+            args.allocation
+        )
+
+    elif args.fraction is not None:
+        rows = list(index_rows(
+            bernoulli_sample(lines, args.fraction, rng),
+            []
+        ))
+
+    else:
+        reservoir: Reservoir[bytes] = Reservoir(args.number, rng)
+        reservoir.extend(lines)
+        rows = list(index_rows(reservoir.items, []))
+
+    # The rows are sorted by start, so the ffdata is read in one direction,
+    # with neighbouring documents copied together.
+    index = FFIndex(rows)
+
+    if args.data is None:
+        write_index_rows(
+            sorted(index, key=index.name_key),
+            args.index
+        )
+    else:
+        outdb = FFDB.compact_from(
+            FFDB(FFData(args.ffdata), index),
+            args.data,
+            buffer_size=args.buffer_size,
+        )
+        outdb.index.write_to(args.index)
+
+    print(
+        f"Sampled {len(index)} documents "
+        f"({sum(r.size for r in index)} bytes).",
+        file=sys.stderr
+    )
+    return
@@ -1,12 +1,29 @@
+import os
+import re
+import stat
 import argparse
 import mmap
+from multiprocessing import Pool
 
-from typing import Set, Optional, cast, BinaryIO
+from typing import Set, Optional, List, Iterable, Iterator, cast, BinaryIO
+from typing import Tuple, Union
 
-from ffdb.ffindex import FFDB, IndexRow
+from ffdb.ffindex import FFDB, FFData, FFIndex, SortedFFIndex, IndexRow
+from ffdb.ffindex import MappedFFData
+from ffdb.ffindex import ShardedFFDB, ShardedFFData
+from ffdb.sums import sums_path
+from ffdb.extsort import external_sort
+from ffdb.idlist import IdSet, read_ids, sorted_ids, merge_filter
 from ffdb.exceptions import InvalidOptionError
 
 
+# Id files smaller than this are just loaded into a python set.
+SET_ENGINE_MAX_BYTES = 64 * 1024 * 1024
+
+# The number of bytes of the .ffindex file that each regex job searches.
+REGEX_CHUNK_SIZE = 4 * 1024 * 1024
+
+
 def cli_select(parser: argparse.ArgumentParser):
 
     parser.add_argument(
@@ -27,10 +44,20 @@ def cli_select(parser: argparse.ArgumentParser):
         "--mmap",
         action="store_true",
         default=False,
-        help=("Memory map the input hhdata file before reading chunks. "
+        help=("Memory map the input ffdata file before reading chunks. "
               "This will significantly reduce IO overhead when doing balanced "
-              "or sorted chunks, but requires enough memory to store the "
-              "entire ffdata file."),
+              "or sorted chunks. The file is mapped in windows, so it "
+              "doesn't need to fit in memory."),
+    )
+
+    parser.add_argument(
+        "--mmap-memory",
+        type=int,
+        default=1024 * 1024 * 1024,
+        help=(
+            "The maximum number of bytes of the ffdata file to have mapped "
+            "at once when using --mmap. Default: 1GiB."
+        ),
     )
 
     parser.add_argument(
@@ -51,16 +78,125 @@ def cli_select(parser: argparse.ArgumentParser):
         )
     )
 
+    parser.add_argument(
+        "-p", "--prefix",
+        type=lambda x: x.encode(),
+        action="append",
+        default=None,
+        help=(
+            "Only include documents with names starting with this prefix. "
+            "Can be given multiple times to include several prefixes."
+        )
+    )
+
+    parser.add_argument(
+        "-r", "--range",
+        type=lambda x: x.encode(),
+        nargs=2,
+        metavar=("FIRST", "LAST"),
+        default=None,
+        help=(
+            "Only include documents with names sorted between FIRST and "
+            "LAST (inclusive). Names are compared as text, so '10' comes "
+            "before '2'."
+        )
+    )
+
+    parser.add_argument(
+        "-x", "--regex",
+        type=lambda x: re.compile(x.encode()),
+        default=None,
+        help=(
+            "Only include documents with names matching this regular "
+            "expression. The pattern can match anywhere in the name, "
+            "use '^' and '$' to match the whole name."
+        )
+    )
+
+    parser.add_argument(
+        "-j", "--cpus",
+        type=int,
+        default=1,
+        help="The number of processes to use for --regex searches.",
+    )
+
+    parser.add_argument(
+        "--engine",
+        choices=["auto", "set", "merge", "bloom"],
+        default="auto",
+        help=(
+            "How to match names against the --include and --exclude ids. "
+            "'set' loads the ids into memory, which is fastest for small "
+            "lists. 'merge' sorts the ids (using temporary files if needed) "
+            "and streams them alongside the name sorted index. "
+            "'bloom' stores the ids in a sorted temporary file, "
+            "and uses a small bloom filter to avoid most lookups in the file, "
+            "which doesn't need the index to be sorted. "
+            "'auto' uses 'set' for small id files, 'merge' if the index is "
+            "sorted by name, and 'bloom' otherwise."
+        )
+    )
+
+    parser.add_argument(
+        "--sorted",
+        action="store_true",
+        default=False,
+        help=(
+            "The --include and --exclude files are already sorted by name, "
+            "so they don't need to be sorted for the 'merge' engine."
+        )
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=1000000,
+        help=(
+            "The maximum number of ids to sort in memory. "
+            "Larger id lists are sorted in pieces using temporary files."
+        ),
+    )
+
+    parser.add_argument(
+        "--tmpdir",
+        type=str,
+        default=None,
+        help="Where to write temporary files for sorting ids.",
+    )
+
+    parser.add_argument(
+        "--sums",
+        action="store_true",
+        default=False,
+        help=(
+            "Also write a checksum sidecar (.ffsum) next to the output "
+            "ffindex file, for `ffdb diff` and `ffdb check --sums`."
+        ),
+    )
+
+    parser.add_argument(
+        "-m", "--manifest",
+        type=argparse.FileType('r'),
+        default=None,
+        help=(
+            "Select from the shards of a partitioned database listed in this "
+            "file instead of a single database. The file should have one "
+            "tab separated ffdata and ffindex pair per line."
+        ),
+    )
+
     parser.add_argument(
         "ffdata",
         metavar="FFDATA_FILE",
-        type=argparse.FileType('r+b'),
+        nargs="?",
+        type=argparse.FileType('rb'),
         help="The ffindex .ffdata files.",
     )
 
     parser.add_argument(
         "ffindex",
         metavar="FFINDEX_FILE",
+        nargs="?",
         type=argparse.FileType('rb'),
         help="The ffindex .ffindex files.",
     )
@@ -68,68 +204,296 @@ def cli_select(parser: argparse.ArgumentParser):
     return
 
 
+def is_small(handles: Iterable[BinaryIO]) -> bool:
+    """ Check if all files are regular files that are small enough to load.
+    """
+
+    total = 0
+    for handle in handles:
+        st = os.fstat(handle.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        total += st.st_size
+
+    return total <= SET_ENGINE_MAX_BYTES
+
+
+def name_spans(
+    index: SortedFFIndex,
+    prefixes: Optional[List[bytes]],
+    range_: Optional[Tuple[bytes, bytes]],
+) -> List[Tuple[int, int]]:
+    """ Find byte ranges in the sorted index matching prefixes or a range.
+    """
+
+    if prefixes is None:
+        spans = [(0, len(index.buffer))]
+    else:
+        spans = []
+        for lo, hi in sorted(index.prefix_span(p) for p in prefixes):
+            # Prefixes can overlap, e.g. 'A' and 'AB'.
+            if len(spans) > 0 and lo <= spans[-1][1]:
+                spans[-1] = (spans[-1][0], max(hi, spans[-1][1]))
+            else:
+                spans.append((lo, hi))
+
+    if range_ is not None:
+        rlo, rhi = index.range_span(*range_)
+        spans = [
+            (max(lo, rlo), min(hi, rhi))
+            for lo, hi
+            in spans
+            if max(lo, rlo) < min(hi, rhi)
+        ]
+
+    return spans
+
+
+# The index that each regex worker is searching.
+_REGEX_INDEX: Optional[SortedFFIndex] = None
+
+
+def regex_init(path: str) -> None:
+    global _REGEX_INDEX
+    _REGEX_INDEX = SortedFFIndex.from_file(open(path, "rb"), sort=False)
+    return
+
+
+def regex_rows(job: Tuple["re.Pattern[bytes]", int, int]) -> List[IndexRow]:
+    pattern, lo, hi = job
+    assert _REGEX_INDEX is not None
+
+    return [
+        row
+        for row
+        in _REGEX_INDEX.rows(lo, hi)
+        if pattern.search(row.name) is not None
+    ]
+
+
+def regex_select(
+    index: SortedFFIndex,
+    path: str,
+    spans: List[Tuple[int, int]],
+    pattern: "re.Pattern[bytes]",
+    cpus: int = 1,
+) -> Iterator[IndexRow]:
+    """ Search for names matching a regex in chunks of the index.
+
+    Chunks are searched in parallel if the index is a memory mapped file,
+    and results are yielded in index order.
+    """
+
+    jobs = []
+    for lo, hi in spans:
+        while lo < hi:
+            chunk_hi = min(hi, index.align(lo + REGEX_CHUNK_SIZE))
+            jobs.append((pattern, lo, chunk_hi))
+            lo = chunk_hi
+
+    if cpus > 1 and isinstance(index.buffer, mmap.mmap):
+        with Pool(cpus, regex_init, (path,)) as pool:
+            for rows in pool.imap(regex_rows, jobs):
+                yield from rows
+
+    else:
+        global _REGEX_INDEX
+        _REGEX_INDEX = index
+        for job in jobs:
+            yield from regex_rows(job)
+    return
+
+
+def choose_engine(args: argparse.Namespace, is_sorted: bool) -> str:
+    if args.engine != "auto":
+        return args.engine
+
+    handles = [h for h in (args.include, args.exclude) if h is not None]
+    if is_small(handles):
+        return "set"
+    elif args.sorted or is_sorted:
+        return "merge"
+    else:
+        return "bloom"
+
+
+def select_set(
+    rows: Iterable[IndexRow],
+    include: Optional[BinaryIO],
+    exclude: Optional[BinaryIO],
+) -> Iterator[IndexRow]:
+    if include is not None:
+        include_set: Set[bytes] = set(read_ids([include]))
+        rows = (ir for ir in rows if ir.name in include_set)
+
+    if exclude is not None:
+        exclude_set: Set[bytes] = set(read_ids([exclude]))
+        rows = (ir for ir in rows if ir.name not in exclude_set)
+
+    return iter(rows)
+
+
+def select_merge(
+    rows: Iterable[IndexRow],
+    include: Optional[BinaryIO],
+    exclude: Optional[BinaryIO],
+    presorted: bool,
+    buffer_size: int,
+    tmpdir: Optional[str],
+) -> Iterator[IndexRow]:
+    """ Rows must be sorted by name. """
+
+    for handle, keep in ((include, True), (exclude, False)):
+        if handle is None:
+            continue
+
+        ids = sorted_ids([handle], presorted, buffer_size, tmpdir)
+        rows = merge_filter(rows, ids, keep=keep)
+
+    return iter(rows)
+
+
+def select_bloom(
+    rows: Iterable[IndexRow],
+    include: Optional[BinaryIO],
+    exclude: Optional[BinaryIO],
+    buffer_size: int,
+    tmpdir: Optional[str],
+) -> Iterator[IndexRow]:
+    if include is not None:
+        include_set = IdSet.from_ids(read_ids([include]), buffer_size, tmpdir)
+        rows = (ir for ir in rows if ir.name in include_set)
+
+    if exclude is not None:
+        exclude_set = IdSet.from_ids(read_ids([exclude]), buffer_size, tmpdir)
+        rows = (ir for ir in rows if ir.name not in exclude_set)
+
+    return iter(rows)
+
+
 def select(args: argparse.Namespace) -> None:
 
-    if args.include is None and args.exclude is None:
+    if all(
+        a is None
+        for a
+        in (args.include, args.exclude, args.prefix, args.range, args.regex)
+    ):
         raise InvalidOptionError(
-            "Either --include or --exclude must be specified for "
-            "'select' subcommand."
+            "One of --include, --exclude, --prefix, --range or --regex must "
+            "be specified for 'select' subcommand."
         )
 
-    outdb = FFDB.new(args.data)
-
-    include: Set[IndexRow] = set()
-    if args.include is not None:
-        for line in args.include:
-            sline = line.strip()
-            if len(sline) == 0:
-                continue
+    no_files = args.ffdata is None or args.ffindex is None
+    if (args.manifest is None) == no_files:
+        raise InvalidOptionError(
+            "Either an ffdata and ffindex file, or a --manifest must be "
+            "given to 'select'."
+        )
 
-            include.add(sline)
+    outdb = FFDB.new(args.data)
+    if args.sums:
+        outdb.record_sums(args.tmpdir)
 
-    exclude: Set[IndexRow] = set()
-    if args.exclude is not None:
-        for line in args.exclude:
-            sline = line.strip()
-            if len(sline) == 0:
-                continue
+    sharded: Optional[ShardedFFDB] = None
 
-            exclude.add(sline)
+    mm: Optional[MappedFFData] = None
 
     try:
-        if args.mmap:
-            mm: Optional[BinaryIO] = cast(
-                BinaryIO,
-                mmap.mmap(args.ffdata.fileno(), 0)
+        ffdata: Union[FFData, ShardedFFData]
+        if args.manifest is not None:
+            sharded = ShardedFFDB.from_manifest(args.manifest)
+            ffdata = sharded.data
+
+        elif args.mmap:
+            # Selected documents are read in file order.
+            mm = MappedFFData(
+                args.ffdata,
+                max_memory=args.mmap_memory,
+                advice="sequential"
             )
-            # This is for typechecker
-            assert mm is not None
-            ffdb = FFDB.from_file(mm, args.ffindex)
+            ffdata = mm
         else:
-            mm = None
-            ffdb = FFDB.from_file(args.ffdata, args.ffindex)
+            ffdata = FFData(args.ffdata)
 
-        if len(include) > 0:
-            included_rows = (ir for ir in ffdb.index if ir.name in include)
+        # Rows are read in file order, we only rely on the order if it
+        # turns out to be sorted.
+        if sharded is not None:
+            index = SortedFFIndex.from_rows(sharded.index)
+            is_sorted = True
         else:
-            included_rows = (ir for ir in ffdb.index)
-
-        if len(exclude) > 0:
-            irs = [
-                ir
-                for ir
-                in included_rows
-                if ir.name not in exclude
-            ]
+            index = SortedFFIndex.from_file(args.ffindex, sort=False)
+            is_sorted = index.is_sorted()
+
+        if (
+            any(a is not None for a in (args.prefix, args.range, args.regex))
+            and not is_sorted
+        ):
+            index = index.sorted_lines()
+            is_sorted = True
+
+        rows: Iterable[IndexRow] = index
+        if args.prefix is not None or args.range is not None:
+            spans = name_spans(index, args.prefix, args.range)
+            rows = (r for lo, hi in spans for r in index.rows(lo, hi))
         else:
-            irs = list(included_rows)
+            spans = [(0, len(index.buffer))]
+
+        if args.regex is not None:
+            rows = regex_select(
+                index,
+                getattr(args.ffindex, "name", ""),
+                spans,
+                args.regex,
+                args.cpus
+            )
 
-        irs.sort(key=lambda x: x.start)
+        engine = choose_engine(args, is_sorted)
+
+        if engine == "set":
+            selected = select_set(rows, args.include, args.exclude)
+
+        elif engine == "merge":
+            if not is_sorted:
+                index = index.sorted_lines()
+                rows = index
+
+            selected = select_merge(
+                rows,
+                args.include,
+                args.exclude,
+                args.sorted,
+                args.buffer_size,
+                args.tmpdir,
+            )
 
-        outdb.extend_from(ffdb, irs)
+        else:
+            selected = select_bloom(
+                rows,
+                args.include,
+                args.exclude,
+                args.buffer_size,
+                args.tmpdir,
+            )
+
+        # Documents are copied in file order.
+        irs = external_sort(
+            selected,
+            key=lambda x: x.start,
+            buffer_size=args.buffer_size,
+            tmpdir=args.tmpdir,
+        )
+
+        outdb.extend_from(FFDB(cast(FFData, ffdata), FFIndex()), irs)
         outdb.index.write_to(args.index)
 
+        if args.sums:
+            with open(sums_path(args.index.name), "wb") as handle:
+                outdb.write_sums_to(handle, buffer_size=args.buffer_size)
+
     finally:
         if mm is not None:
             mm.close()
+
+        if sharded is not None:
+            sharded.close()
     return
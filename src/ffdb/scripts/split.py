@@ -1,11 +1,11 @@
 import argparse
+from math import ceil
 from os.path import basename, splitext
-from mmap import mmap
 
-from typing import Optional, List, BinaryIO, cast
+from typing import Optional, List
 
-from ffdb.exceptions import FFOrderError
-from ffdb.ffindex import FFDB, IndexRow
+from ffdb.exceptions import FFOrderError, InvalidOptionError
+from ffdb.ffindex import FFDB, IndexRow, MappedFFData
 
 
 def cli_split(parser: argparse.ArgumentParser):
@@ -42,6 +42,30 @@ def cli_split(parser: argparse.ArgumentParser):
         )
     )
 
+    parser.add_argument(
+        "--by-hash",
+        action="store_true",
+        default=False,
+        help=(
+            "Assign documents to partitions using a hash of their names. "
+            "Two databases split into the same number of partitions will "
+            "have matching names in the same partition numbers, so they "
+            "can be joined or selected partition by partition."
+        )
+    )
+
+    parser.add_argument(
+        "-p", "--partitions",
+        type=int,
+        default=None,
+        help=(
+            "The number of partitions to write with --by-hash. "
+            "By default this is the number of documents divided by --size. "
+            "Set this explicitly when splitting databases that you want to "
+            "join later."
+        )
+    )
+
     parser.add_argument(
         "--order",
         type=argparse.FileType('rb'),
@@ -57,16 +81,39 @@ def cli_split(parser: argparse.ArgumentParser):
         "--mmap",
         action="store_true",
         default=False,
-        help=("Memory map the input hhdata file before reading chunks. "
+        help=("Memory map the input ffdata file before reading chunks. "
               "This will significantly reduce IO overhead when doing balanced "
-              "or sorted chunks, but requires enough memory to store the "
-              "entire ffdata file."),
+              "or sorted chunks. The file is mapped in windows, so it "
+              "doesn't need to fit in memory."),
+    )
+
+    parser.add_argument(
+        "--mmap-memory",
+        type=int,
+        default=1024 * 1024 * 1024,
+        help=(
+            "The maximum number of bytes of the ffdata file to have mapped "
+            "at once when using --mmap. Default: 1GiB."
+        ),
+    )
+
+    parser.add_argument(
+        "--keys",
+        choices=["bytes", "numeric", "auto"],
+        default="bytes",
+        help=(
+            "How to treat the document names. 'numeric' is for MMseqs2 "
+            "style integer keys, which are stored compactly and written in "
+            "numeric order (e.g. 2 before 10). 'auto' uses numeric keys if "
+            "every name is a number. Default: bytes, names are sorted as "
+            "text, as the ffindex tools expect."
+        ),
     )
 
     parser.add_argument(
         "ffdata",
         metavar="FFDATA_FILE",
-        type=argparse.FileType('r+b'),
+        type=argparse.FileType('rb'),
         help="The ffindex .ffdata files.",
     )
 
@@ -85,22 +132,45 @@ def simplename(path: str) -> str:
 
 
 def split(args: argparse.Namespace) -> None:
+    mm: Optional[MappedFFData] = None
+
     try:
+        ffdb = FFDB.from_file(args.ffdata, args.ffindex, keys=args.keys)
+
         if args.mmap:
-            mm: Optional[BinaryIO] = cast(
-                BinaryIO,
-                mmap(args.ffdata.fileno(), 0)
+            # Unbalanced and hash partitions read the file in order.
+            if args.by_hash or (args.unbalanced and args.order is None):
+                advice = "sequential"
+            else:
+                advice = "random"
+
+            mm = MappedFFData(
+                args.ffdata,
+                max_memory=args.mmap_memory,
+                advice=advice
             )
-            # I know this looks stupid, it's for mypy
-            assert mm is not None
-            ffdb = FFDB.from_file(mm, args.ffindex)
-        else:
-            mm = None
-            ffdb = FFDB.from_file(args.ffdata, args.ffindex)
+            ffdb.data = mm
 
         file_basename = simplename(args.ffdata.name)
 
-        if args.unbalanced and args.order is None:
+        if args.by_hash:
+            if args.unbalanced or args.order is not None:
+                raise InvalidOptionError(
+                    "--by-hash can't be used with --unbalanced or --order."
+                )
+
+            if args.partitions is None:
+                npartitions = ceil(len(ffdb.index) / args.size)
+            else:
+                npartitions = args.partitions
+
+            ffdb.hash_partition(
+                name=file_basename,
+                template=args.basename,
+                npartitions=max(1, npartitions),
+            )
+
+        elif args.unbalanced and args.order is None:
             ffdb.quick_partition(
                 name=file_basename,
                 template=args.basename,
@@ -0,0 +1,494 @@
+import os
+import sys
+import argparse
+from collections import Counter
+from heapq import heappush, heappushpop
+from math import ceil
+from multiprocessing import Pool
+
+from typing import Optional, List, Tuple, Iterable, Iterator, BinaryIO
+
+from ffdb.ffindex import IndexRow, chunk_rows, rows_layout, partition_of
+from ffdb.check import CHUNK_SIZE, index_rows
+from ffdb.extsort import external_sort
+from ffdb.scripts.order import CONTENT_KEYS
+from ffdb.exceptions import InvalidOptionError
+
+# A chunk of the ffdata to count, (start, end, rows sorted by start).
+ContentJob = Tuple[int, int, List[IndexRow]]
+
+QUANTILES = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+
+
+def cli_stats(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-o", "--outfile",
+        type=argparse.FileType('w'),
+        default=sys.stdout,
+        help=("Write to this file instead of stdout."),
+    )
+
+    parser.add_argument(
+        "-q", "--quantiles",
+        type=float,
+        nargs="+",
+        default=QUANTILES,
+        help=(
+            "The document size quantiles to report, between 0 and 1. "
+            "Default: 0 0.01 0.1 0.25 0.5 0.75 0.9 0.99 1."
+        ),
+    )
+
+    parser.add_argument(
+        "-n", "--largest",
+        type=int,
+        default=10,
+        help="Report the names of this many of the largest documents.",
+    )
+
+    parser.add_argument(
+        "--split-size",
+        type=int,
+        default=None,
+        help=(
+            "Project how many bytes each partition would get from "
+            "`ffdb split --size`, with this many documents per partition."
+        ),
+    )
+
+    parser.add_argument(
+        "--split-by",
+        choices=["balanced", "unbalanced", "hash"],
+        default="balanced",
+        help=(
+            "The split strategy to project. 'balanced' is the default for "
+            "`ffdb split`, 'unbalanced' is `--unbalanced` and 'hash' is "
+            "`--by-hash`. Default: balanced."
+        ),
+    )
+
+    parser.add_argument(
+        "--split-partitions",
+        type=int,
+        default=None,
+        help=(
+            "The number of partitions to project with '--split-by hash', "
+            "like `ffdb split --partitions`."
+        ),
+    )
+
+    parser.add_argument(
+        "--content",
+        type=argparse.FileType('w'),
+        default=None,
+        help=(
+            "Also read the ffdata file, and write the number of fasta "
+            "records and lines in each document to this file, as "
+            "tab separated name, records and lines. Documents are written "
+            "in the order they are in the ffdata file."
+        ),
+    )
+
+    parser.add_argument(
+        "-j", "--cpus",
+        type=int,
+        default=1,
+        help="The number of processes to read documents with for --content.",
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help=(
+            "The number of bytes of the ffdata file that each process reads "
+            "at a time for --content. Default: 64MiB."
+        ),
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=1000000,
+        help=(
+            "The maximum number of index rows to sort in memory. "
+            "Larger indices are sorted in pieces using temporary files."
+        ),
+    )
+
+    parser.add_argument(
+        "--tmpdir",
+        type=str,
+        default=None,
+        help="Where to write temporary files for sorting.",
+    )
+
+    parser.add_argument(
+        "ffdata",
+        metavar="FFDATA_FILE",
+        type=argparse.FileType('rb'),
+        help=(
+            "The ffindex .ffdata file. "
+            "Only its size is used, unless --content is given."
+        ),
+    )
+
+    parser.add_argument(
+        "ffindex",
+        metavar="FFINDEX_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffindex file.",
+    )
+
+    return
+
+
+class SizeStats(object):
+
+    def __init__(self, largest: int = 10) -> None:
+        """ Summarise document sizes in a single pass over the index.
+
+        Only the number of documents with each distinct size is kept,
+        so memory use doesn't depend on the number of documents.
+
+        Examples:
+        >>> stats = SizeStats(largest=2)
+        >>> for i, size in enumerate([5, 3, 9, 3, 12]):
+        ...     stats.add(IndexRow(str(i).encode(), 0, size))
+        >>> stats.count, stats.total
+        (5, 32)
+        >>> stats.quantiles([0, 0.5, 1])
+        [3, 5, 12]
+        >>> stats.histogram()
+        [(2, 3, 2, 6), (4, 7, 1, 5), (8, 15, 2, 21)]
+        >>> [r.name for r in stats.largest()]
+        [b'4', b'2']
+        """
+
+        self.count = 0
+        self.total = 0
+        self.sizes: Counter = Counter()
+
+        self.nlargest = largest
+        self.heap: List[Tuple[int, bytes]] = []
+        return
+
+    def add(self, row: IndexRow) -> None:
+        self.count += 1
+        self.total += row.size
+        self.sizes[row.size] += 1
+
+        if len(self.heap) < self.nlargest:
+            heappush(self.heap, (row.size, row.name))
+        elif self.nlargest > 0 and row.size > self.heap[0][0]:
+            heappushpop(self.heap, (row.size, row.name))
+        return
+
+    def observe(self, rows: Iterable[IndexRow]) -> Iterator[IndexRow]:
+        """ Pass rows through, adding each one. """
+
+        for row in rows:
+            self.add(row)
+            yield row
+        return
+
+    def quantiles(self, qs: List[float]) -> List[int]:
+        """ Get the size at each quantile, using the nearest rank. """
+
+        if self.count == 0:
+            return [0 for _ in qs]
+
+        ranks = [min(self.count, max(1, ceil(q * self.count))) for q in qs]
+        order = sorted(range(len(qs)), key=lambda i: ranks[i])
+        out = [0 for _ in qs]
+
+        seen = 0
+        sizes = iter(sorted(self.sizes.items()))
+        size, n = next(sizes)
+        for i in order:
+            while seen + n < ranks[i]:
+                seen += n
+                size, n = next(sizes)
+            out[i] = size
+
+        return out
+
+    def histogram(self) -> List[Tuple[int, int, int, int]]:
+        """ Count the documents in power of two size bins.
+
+        Returns the smallest and largest size of each bin (inclusive), and
+        the number and total size of the documents in it. Empty bins
+        aren't included.
+        """
+
+        bins: Counter = Counter()
+        bin_bytes: Counter = Counter()
+
+        for size, n in self.sizes.items():
+            b = size.bit_length()
+            bins[b] += n
+            bin_bytes[b] += n * size
+
+        out = []
+        for b in sorted(bins):
+            lo = 0 if b == 0 else 2 ** (b - 1)
+            hi = 0 if b == 0 else 2 ** b - 1
+            out.append((lo, hi, bins[b], bin_bytes[b]))
+
+        return out
+
+    def largest(self) -> List[IndexRow]:
+        """ The largest documents, biggest first. """
+
+        return [
+            IndexRow(name, 0, size)
+            for size, name
+            in sorted(self.heap, reverse=True)
+        ]
+
+    def by_size(self) -> Iterator[int]:
+        """ Iterate over the sizes of every document, largest first. """
+
+        for size, n in sorted(self.sizes.items(), reverse=True):
+            for _ in range(n):
+                yield size
+        return
+
+
+def project_partitions(
+    sizes: Iterable[Tuple[bytes, int]],
+    npartitions: int,
+    by: str = "balanced",
+    size: int = 1,
+) -> List[Tuple[int, int]]:
+    """ Find how many documents and bytes `ffdb split` puts in each partition.
+
+    For 'balanced' the (name, size) pairs should be sorted by size,
+    largest first, and for 'unbalanced' they should be in index order.
+
+    Examples:
+    >>> sizes = [(b"a", 9), (b"b", 5), (b"c", 3), (b"d", 1)]
+    >>> project_partitions(sizes, 2, "balanced")
+    [(2, 12), (2, 6)]
+    >>> project_partitions(sizes, 2, "unbalanced", size=2)
+    [(2, 14), (2, 4)]
+    """
+
+    out = [(0, 0) for _ in range(npartitions)]
+
+    for j, (name, nbytes) in enumerate(sizes):
+        if by == "hash":
+            i = partition_of(name, npartitions)
+        elif by == "unbalanced":
+            i = j // size
+        else:
+            i = j % npartitions
+
+        ndocs, total = out[i]
+        out[i] = (ndocs + 1, total + nbytes)
+
+    return out
+
+
+def count_content(document: bytes) -> Tuple[int, int]:
+    """ Count the fasta records and lines in a document.
+
+    Examples:
+    >>> count_content(b">a\\nACGT\\n>b\\nTT\\n\\0")
+    (2, 4)
+    """
+
+    return (
+        CONTENT_KEYS["records"](document),
+        CONTENT_KEYS["lines"](document),
+    )
+
+
+# The data file each worker is reading.
+_WORKER_HANDLE: Optional[BinaryIO] = None
+
+
+def content_init(path: str) -> None:
+    global _WORKER_HANDLE
+
+    _WORKER_HANDLE = open(path, "rb")
+    return
+
+
+def content_close() -> None:
+    """ Close the file opened by `content_init` outside of a pool. """
+
+    global _WORKER_HANDLE
+    if _WORKER_HANDLE is not None:
+        _WORKER_HANDLE.close()
+        _WORKER_HANDLE = None
+    return
+
+
+def content_chunk(job: ContentJob) -> List[Tuple[IndexRow, int, int]]:
+    """ Count the records and lines in one chunk of the ffdata.
+
+    The chunk is read in a single sequential read.
+    """
+
+    start, end, rows = job
+
+    assert _WORKER_HANDLE is not None
+
+    _WORKER_HANDLE.seek(start)
+    buf = _WORKER_HANDLE.read(end - start)
+
+    out = []
+    for row in rows:
+        offset = row.start - start
+        records, lines = count_content(buf[offset: offset + row.size])
+        out.append((row, records, lines))
+
+    return out
+
+
+def content_rows(
+    rows: Iterable[IndexRow],
+    path: str,
+    cpus: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Tuple[IndexRow, int, int]]:
+    """ Count the records and lines in each document, in file order.
+
+    Rows should be sorted by start, so that each process reads its part
+    of the ffdata file sequentially.
+    """
+
+    jobs = chunk_rows(rows, chunk_size)
+
+    if cpus > 1:
+        with Pool(cpus, content_init, (path,)) as pool:
+            for chunk in pool.imap(content_chunk, jobs):
+                yield from chunk
+    else:
+        content_init(path)
+        try:
+            for job in jobs:
+                yield from content_chunk(job)
+        finally:
+            content_close()
+    return
+
+
+def stats(args: argparse.Namespace) -> None:
+    if args.cpus < 1:
+        raise InvalidOptionError("--cpus must be at least 1.")
+
+    if args.chunk_size < 1:
+        raise InvalidOptionError("--chunk-size must be at least 1.")
+
+    if args.largest < 0:
+        raise InvalidOptionError("--largest can't be negative.")
+
+    if any(q < 0 or q > 1 for q in args.quantiles):
+        raise InvalidOptionError("--quantiles must be between 0 and 1.")
+
+    if args.split_size is not None and args.split_size < 1:
+        raise InvalidOptionError("--split-size must be at least 1.")
+
+    if args.split_partitions is not None:
+        if args.split_by != "hash":
+            raise InvalidOptionError(
+                "--split-partitions can only be used with '--split-by hash'."
+            )
+        elif args.split_partitions < 1:
+            raise InvalidOptionError("--split-partitions must be at least 1.")
+
+    data_size = os.fstat(args.ffdata.fileno()).st_size
+    sizes = SizeStats(args.largest)
+
+    # The sizes are counted as the rows go into the sort.
+    layout = rows_layout(
+        external_sort(
+            sizes.observe(index_rows(args.ffindex, [])),
+            key=lambda r: r.start,
+            buffer_size=args.buffer_size,
+            tmpdir=args.tmpdir,
+        ),
+        data_size
+    )
+
+    out = args.outfile
+    print(f"documents\t{sizes.count}", file=out)
+    print(f"document_bytes\t{sizes.total}", file=out)
+    for field, value in zip(layout._fields, layout):
+        print(f"{field}\t{value}", file=out)
+    print(f"reclaimable\t{layout.reclaimable}", file=out)
+
+    for q, size in zip(args.quantiles, sizes.quantiles(args.quantiles)):
+        print(f"quantile\t{q:g}\t{size}", file=out)
+
+    for lo, hi, n, nbytes in sizes.histogram():
+        print(f"histogram\t{lo}\t{hi}\t{n}\t{nbytes}", file=out)
+
+    for row in sizes.largest():
+        print(f"largest\t{row.name.decode()}\t{row.size}", file=out)
+
+    if args.split_size is not None or args.split_partitions is not None:
+        if args.split_partitions is not None:
+            npartitions = args.split_partitions
+        else:
+            npartitions = max(1, ceil(sizes.count / args.split_size))
+
+        if args.split_by == "balanced":
+            rows: Iterable[Tuple[bytes, int]] = (
+                (b"", s)
+                for s
+                in sizes.by_size()
+            )
+        else:
+            args.ffindex.seek(0)
+            rows = ((r.name, r.size) for r in index_rows(args.ffindex, []))
+
+        partitions = project_partitions(
+            rows,
+            npartitions,
+            args.split_by,
+            args.split_size if args.split_size is not None else 1,
+        )
+
+        for i, (n, nbytes) in enumerate(partitions, 1):
+            print(f"partition\t{i}\t{n}\t{nbytes}", file=out)
+
+        totals = [nbytes for _, nbytes in partitions]
+        mean = sum(totals) / len(totals)
+        print(
+            f"Projected {len(totals)} partitions with {min(totals)} to "
+            f"{max(totals)} bytes each. The largest is "
+            f"{max(totals) / mean if mean > 0 else 1:.2f} times the mean.",
+            file=sys.stderr
+        )
+
+    if args.content is not None:
+        args.ffindex.seek(0)
+        rows_by_start = external_sort(
+            index_rows(args.ffindex, []),
+            key=lambda r: r.start,
+            buffer_size=args.buffer_size,
+            tmpdir=args.tmpdir,
+        )
+
+        total_records = 0
+        total_lines = 0
+        for row, records, lines in content_rows(
+            rows_by_start,
+            args.ffdata.name,
+            cpus=args.cpus,
+            chunk_size=args.chunk_size,
+        ):
+            total_records += records
+            total_lines += lines
+            print(
+                f"{row.name.decode()}\t{records}\t{lines}",
+                file=args.content
+            )
+
+        print(f"records\t{total_records}", file=out)
+        print(f"lines\t{total_lines}", file=out)
+
+    return
@@ -0,0 +1,254 @@
+import sys
+import argparse
+from os.path import exists
+
+from typing import Iterator, Set, Optional
+
+from ffdb.ffindex import FFDB, FFIndex, IndexRow, prefetch
+from ffdb.sums import sums_path, read_sums, diff_sums
+from ffdb.scripts.map import map_rows, merge_parts, remove_parts
+from ffdb.exceptions import InvalidOptionError
+
+
+def cli_update(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-d", "--data",
+        required=True,
+        type=str,
+        help="The path to write the ffdata file to.",
+    )
+
+    parser.add_argument(
+        "-i", "--index",
+        required=True,
+        type=str,
+        help="The path to write the ffindex file to.",
+    )
+
+    parser.add_argument(
+        "--old-data",
+        required=True,
+        type=argparse.FileType('rb'),
+        help=(
+            "The ffdata file of the source database the previous output "
+            "was made from."
+        ),
+    )
+
+    parser.add_argument(
+        "--old-index",
+        required=True,
+        type=argparse.FileType('rb'),
+        help=(
+            "The ffindex file of the source database the previous output "
+            "was made from."
+        ),
+    )
+
+    parser.add_argument(
+        "--previous-data",
+        required=True,
+        type=argparse.FileType('rb'),
+        help="The ffdata file of the previous output.",
+    )
+
+    parser.add_argument(
+        "--previous-index",
+        required=True,
+        type=argparse.FileType('rb'),
+        help="The ffindex file of the previous output.",
+    )
+
+    parser.add_argument(
+        "-c", "--command",
+        type=str,
+        default=None,
+        help=(
+            "The command to run for each new or changed document, "
+            "like `ffdb map --command`."
+        )
+    )
+
+    parser.add_argument(
+        "-f", "--function",
+        type=str,
+        default=None,
+        help=(
+            "A python function to call for each new or changed document, "
+            "like `ffdb map --function`."
+        )
+    )
+
+    parser.add_argument(
+        "--compare",
+        choices=["auto", "sums", "content"],
+        default="auto",
+        help=(
+            "How to find the changed documents. 'sums' compares the "
+            "checksum sidecars (.ffsum) of the old and new source databases, "
+            "and 'content' compares the documents themselves. "
+            "Default: auto, use the sidecars if both exist."
+        ),
+    )
+
+    parser.add_argument(
+        "-j", "--cpus",
+        type=int,
+        default=1,
+        help="The number of worker processes to use.",
+    )
+
+    parser.add_argument(
+        "-t", "--tmpdir",
+        type=str,
+        default=None,
+        help=(
+            "The directory to store the partial per-worker databases and "
+            "checkpoints in, like `ffdb map --tmpdir`. Default is the "
+            "--data path with '.parts' appended."
+        )
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=0,
+        help=(
+            "The number of bytes of output documents each worker buffers "
+            "before writing them, like `ffdb map --buffer-size`."
+        ),
+    )
+
+    parser.add_argument(
+        "ffdata",
+        metavar="FFDATA_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffdata file of the new source database.",
+    )
+
+    parser.add_argument(
+        "ffindex",
+        metavar="FFINDEX_FILE",
+        type=argparse.FileType('rb'),
+        help="The ffindex .ffindex file of the new source database.",
+    )
+
+    return
+
+
+def changed_by_content(old: FFDB, new: FFDB) -> Iterator[bytes]:
+    """ Find the names in new that aren't in old, or have different content.
+
+    Documents are only read if they are the same size. The names aren't
+    yielded in any particular order.
+
+    Examples:
+    >>> old = FFDB.new()
+    >>> old.extend([b"one\\0", b"two\\0", b"three\\0"], [b"a", b"b", b"c"])
+    14
+    >>> new = FFDB.new()
+    >>> new.extend([b"one\\0", b"tWo\\0", b"four\\0"], [b"a", b"b", b"d"])
+    13
+    >>> sorted(changed_by_content(old, new))
+    [b'b', b'd']
+    """
+
+    same_size = []
+    for row in new.index:
+        if row.name not in old.index:
+            yield row.name
+            continue
+
+        old_row = old.index[row.name]
+        assert isinstance(old_row, IndexRow)
+
+        if old_row.size != row.size:
+            yield row.name
+        else:
+            same_size.append(row)
+
+    for row, document in prefetch(new.data, same_size, background=True):
+        if old[row.name] != document:
+            yield row.name
+    return
+
+
+def changed_by_sums(old_path: str, new_path: str) -> Iterator[bytes]:
+    """ Find the names that were added or changed, using the sidecars. """
+
+    with open(old_path, "rb") as old, open(new_path, "rb") as new:
+        for status, name in diff_sums(read_sums(old), read_sums(new)):
+            if status != "removed":
+                yield name
+    return
+
+
+def update(args: argparse.Namespace) -> None:
+    if (args.command is None) == (args.function is None):
+        raise InvalidOptionError(
+            "Exactly one of --command or --function must be specified for "
+            "the 'update' subcommand."
+        )
+
+    if args.cpus < 1:
+        raise InvalidOptionError("--cpus must be at least 1.")
+
+    old_sums = sums_path(args.old_index.name)
+    new_sums = sums_path(args.ffindex.name)
+    has_sums = exists(old_sums) and exists(new_sums)
+
+    if args.compare == "sums" and not has_sums:
+        raise InvalidOptionError(
+            "--compare sums needs checksum sidecars for the old and new "
+            f"databases, at {old_sums} and {new_sums}."
+        )
+
+    new = FFDB.from_file(args.ffdata, args.ffindex)
+    previous = FFDB.from_file(args.previous_data, args.previous_index)
+
+    changed: Set[bytes]
+    if args.compare != "content" and has_sums:
+        changed = set(changed_by_sums(old_sums, new_sums))
+    else:
+        old = FFDB.from_file(args.old_data, args.old_index)
+        changed = set(changed_by_content(old, new))
+        del old
+
+    tmpdir: Optional[str] = args.tmpdir
+    if tmpdir is None:
+        tmpdir = args.data + ".parts"
+
+    map_rows(
+        (r for r in new.index if r.name in changed),
+        args.ffdata.name,
+        tmpdir,
+        args.command,
+        args.function,
+        args.cpus,
+        args.buffer_size,
+    )
+
+    # Outputs of documents that are still in the source unchanged.
+    keep = FFIndex([
+        r
+        for r
+        in previous.index
+        if r.name not in changed and r.name in new.index
+    ])
+    dropped = sum(1 for r in previous.index if r.name not in new.index)
+
+    with open(args.data, "wb") as data_handle, \
+            open(args.index, "wb") as index_handle:
+        outdb = FFDB.compact_from(FFDB(previous.data, keep), data_handle)
+        merge_parts(tmpdir, outdb)
+        outdb.index.write_to(index_handle)
+
+    remove_parts(tmpdir)
+
+    print(
+        f"Reused {len(keep)} documents from the previous output, "
+        f"processed {len(changed)} new or changed documents, and dropped "
+        f"{dropped} documents that were removed from the source.",
+        file=sys.stderr
+    )
+    return
@@ -1,33 +1,74 @@
 """ Simple fasta parser and utilities. """
 
+from io import BytesIO
+from array import array
+
 from typing import Optional, Union, Any
-from typing import Sequence, List, Iterable, Iterator
-from typing import Tuple
+from typing import Sequence, Iterable, Iterator
+from typing import Tuple, BinaryIO
 
-from ffdb.exceptions import FastaHeaderError, EmptySequenceError
+from ffdb.exceptions import FastaHeaderError
 
 
 class Seq(object):
 
-    def __init__(self, id: str, desc: Optional[str], seq: bytes):
+    # Avoids a per-instance __dict__, which adds up for millions of records.
+    __slots__ = ("raw_id", "raw_desc", "seq")
+
+    def __init__(
+        self,
+        id: Union[str, bytes],
+        desc: Optional[Union[str, bytes]],
+        seq: Union[bytes, bytearray]
+    ):
         """ Construct a new Seq object.
 
+        The id and description are stored as bytes, and are only decoded
+        when the `id` and `desc` attributes are used. `raw_id` and
+        `raw_desc` give the undecoded values.
+
         Keyword arguments:
-        id -- The sequence id <str>.
-        desc -- A short description of the sequence <str>.
-        seq -- The biological sequence <bytes>.
+        id -- The sequence id <str or bytes>.
+        desc -- A short description of the sequence <str or bytes>.
+        seq -- The biological sequence <bytes or bytearray>.
 
         Examples:
         >>> Seq("test", "description", b"ATGCA")
         Seq(id='test', desc='description', seq=b'ATGCA')
+        >>> Seq(b"test", None, b"ATGCA").raw_id
+        b'test'
         """
 
-        self.id = id
-        self.desc = desc
+        self.id = id  # type: ignore
+        self.desc = desc  # type: ignore
 
         self.seq = seq
         return
 
+    @property
+    def id(self) -> str:
+        return self.raw_id.decode("utf-8")
+
+    @id.setter
+    def id(self, value: Union[str, bytes]) -> None:
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        self.raw_id = value
+        return
+
+    @property
+    def desc(self) -> Optional[str]:
+        if self.raw_desc is None:
+            return None
+        return self.raw_desc.decode("utf-8")
+
+    @desc.setter
+    def desc(self, value: Optional[Union[str, bytes]]) -> None:
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        self.raw_desc = value
+        return
+
     def __str__(self) -> str:
         """ Returns a FASTA string from the object.
 
@@ -55,17 +96,39 @@ class Seq(object):
         >>> bytes(Seq("test", "description", b"ATGCA"))
         b'>test description\\nATGCA'
         """
-        line_length = 60
+        handle = BytesIO()
+        self.write_to(handle)
+        return handle.getvalue()
 
-        if self.desc is None:
-            lines = [">{}".format(self.id).encode("utf-8")]
-        else:
-            lines = [">{} {}".format(self.id, self.desc).encode("utf-8")]
+    def write_to(self, handle: BinaryIO, line_length: int = 60) -> int:
+        """ Write the record as FASTA, wrapping the sequence as we go.
 
-        for i in range(0, len(self), line_length):
-            lines.append(self.seq[i:i+line_length])
+        Lines are written straight from the sequence without copying it,
+        so this is suitable for very large records. Like `bytes(seq)`, no
+        trailing newline is written.
 
-        return b"\n".join(lines)
+        Examples:
+        >>> handle = BytesIO()
+        >>> Seq("test", None, b"ATGCA").write_to(handle, line_length=2)
+        13
+        >>> handle.getvalue()
+        b'>test\\nAT\\nGC\\nA'
+        """
+
+        length = handle.write(self._header())
+
+        view = memoryview(self.seq)
+        for i in range(0, len(view), line_length):
+            length += handle.write(b"\n")
+            length += handle.write(view[i:i+line_length])
+
+        return length
+
+    def _header(self) -> bytes:
+        if self.raw_desc is None:
+            return b">" + self.raw_id
+        else:
+            return b">" + self.raw_id + b" " + self.raw_desc
 
     def __repr__(self) -> str:
         """ Returns a simple string representation of the object. """
@@ -91,7 +154,7 @@ class Seq(object):
             key = slice(key, key + 1)
 
         seq = self.seq[key]
-        return self.__class__(self.id, self.desc, seq)
+        return self.__class__(self.raw_id, self.raw_desc, seq)
 
     def __eq__(self, other: Any) -> bool:
         """ Allows us to compare two Seq objects directly using '==' .
@@ -152,33 +215,47 @@ class Seq(object):
                 "The sequence that we're trying to parse was empty."
             )
 
-        try:
-            id_, desc = cls._split_id_line(line)
-        except ValueError:
-            raise FastaHeaderError(
-                "Encountered malformed fasta header. "
-                f"Offending line is: '{line.decode()}'"
-            )
+        id_, desc = cls._parse_header(line)
 
-        # tuple comprehensions are generators so we're still doing lazy eval
-        seq = b"".join((l.strip() for l in ihandle))
+        # Extending a bytearray avoids holding every line at once.
+        seq = bytearray()
+        for l in ihandle:
+            seq.extend(l.strip())
 
-        if seq == "":
-            raise EmptySequenceError(
-                f"Record with id {id_} has no sequence data. "
-                f"This could be a truncated file or a non-standard format."
-            )
+        return cls._from_buffer(id_, desc, seq)
 
-        return Seq(id_, desc, seq)
+    @classmethod
+    def _from_buffer(
+        cls,
+        id_: bytes,
+        desc: Optional[bytes],
+        seq: bytearray,
+        mutable: bool = False,
+    ) -> "Seq":
+        # Records without any sequence lines are kept, with an empty seq.
+        if mutable:
+            return cls(id_, desc, seq)
+        else:
+            return cls(id_, desc, bytes(seq))
 
     @classmethod
-    def parse(cls, handle: Sequence[bytes]) -> Iterator["Seq"]:
+    def parse(
+        cls,
+        handle: Iterable[bytes],
+        mutable: bool = False,
+    ) -> Iterator["Seq"]:
         """ Parse multiple fasta records.
 
         Parses a multi-fasta formatted file-like object.
+        Sequence lines are appended to a single buffer as they are read,
+        so we never hold all of the lines of a record at once.
 
         Keyword arguments:
         handle -- A file-like object or any iterable over the fasta file lines.
+        mutable -- Leave the sequences as the bytearray they were read into.
+            This avoids copying the sequence at the end of each record, which
+            keeps the peak memory close to the size of the sequence for very
+            large records (e.g. chromosomes).
 
         Yields:
         Seq objects.
@@ -195,36 +272,66 @@ class Seq(object):
         Seq(id='test1', desc='description', seq=b'ATGCA')
         >>> next(seqs)
         Seq(id='test2', desc='descr', seq=b'TGACA')
+        >>> list(Seq.parse([b">empty", b">test3", b"ACGT"]))[0]
+        Seq(id='empty', desc=None, seq=b'')
+        >>> list(Seq.parse([b"\\n", b">test4", b"ACGT"]))
+        [Seq(id='test4', desc=None, seq=b'ACGT')]
         """
 
-        # Store the initial state to avoid outputting empty record.
-        first = True
-        # Store lines for this block here.
-        current_record: List[bytes] = []
+        header: Optional[bytes] = None
+        leading: Optional[bytes] = None
+        seq = bytearray()
 
         for line in handle:
             if line.startswith(b">"):
-                if not first:
+                # The first header won't have a record before it.
+                if header is not None:
                     # Yield makes this function a generator.
-                    # NB we reuse the read method to avoid repetition.
-                    # It's also easier to test.
-                    yield cls.read(current_record)
-                else:
-                    # Once we've passed the first sequence this passes.
-                    first = False
+                    yield cls._parse_record(header, seq, mutable)
 
                 # Start a new block
-                current_record = [line]
+                header = line.strip()
+                seq = bytearray()
+
+            elif header is None:
+                # Lines before the first header (e.g. blank lines) are
+                # skipped. We keep the first one in case there's no header.
+                if leading is None:
+                    leading = line.strip()
+
             else:
                 # For lines containing sequences we simply append the sequence.
-                current_record.append(line)
+                seq.extend(line.strip())
 
         # The last sequence in the file won't have a ">" following it.
         # so we yield the last block too.
-        if len(current_record) > 0:
-            yield cls.read(current_record)
+        if header is not None:
+            yield cls._parse_record(header, seq, mutable)
+        elif leading is not None:
+            # Raises a FastaHeaderError, like read does.
+            cls._parse_header(leading)
         return
 
+    @classmethod
+    def _parse_record(
+        cls,
+        header: bytes,
+        seq: bytearray,
+        mutable: bool = False,
+    ) -> "Seq":
+        id_, desc = cls._parse_header(header)
+        return cls._from_buffer(id_, desc, seq, mutable)
+
+    @classmethod
+    def _parse_header(cls, line: bytes) -> Tuple[bytes, Optional[bytes]]:
+        try:
+            return cls._split_id_bytes(line)
+        except ValueError:
+            raise FastaHeaderError(
+                "Encountered malformed fasta header. "
+                f"Offending line is: '{line.decode()}'"
+            )
+
     @classmethod
     def parse_many(cls, handles: Sequence[Sequence[bytes]]) -> Iterator["Seq"]:
         """ Parses many files yielding an iterator over all of them. """
@@ -234,6 +341,65 @@ class Seq(object):
                 yield record
         return
 
+    @classmethod
+    def parse_batches(
+        cls,
+        handle: Iterable[bytes],
+        n: int = 1024,
+        line_length: int = 60,
+    ) -> Iterator["SeqBatch"]:
+        """ Parse fasta records into batches of up to `n` records.
+
+        No Seq objects are created, the sequence lines are re-wrapped to
+        `line_length` and written straight into each batch's buffer as they
+        are read, so each record is only stored once.
+        Lines before the first header are skipped.
+        To read several files as one stream, chain their lines together.
+
+        Examples:
+        >>> fasta = [b">test1 description", b"ATGCA", b">test2", b"TGACA"]
+        >>> batches = list(Seq.parse_batches(fasta, n=1))
+        >>> len(batches)
+        2
+        >>> batches[1][0]
+        Seq(id='test2', desc=None, seq=b'TGACA')
+        >>> next(Seq.parse_batches([b"\\n", b">test3", b"ACGT"]))[0]
+        Seq(id='test3', desc=None, seq=b'ACGT')
+        """
+
+        batch = SeqBatch(line_length)
+        header: Optional[bytes] = None
+        leading: Optional[bytes] = None
+
+        for line in handle:
+            if line.startswith(b">"):
+                if header is not None:
+                    batch.end_record()
+
+                    if len(batch) >= n:
+                        yield batch
+                        batch = SeqBatch(line_length)
+
+                header = line.strip()
+                batch.start_record(header)
+
+            elif header is None:
+                # Skip anything before the first header, like `parse`.
+                if leading is None:
+                    leading = line.strip()
+
+            else:
+                batch.extend_seq(line.strip())
+
+        if header is not None:
+            batch.end_record()
+        elif leading is not None:
+            cls._parse_header(leading)
+
+        if len(batch) > 0:
+            yield batch
+        return
+
     @staticmethod
     def _split_id_line(line: bytes) -> Tuple[str, Optional[str]]:
         """ Parse the FASTA header line into id and description components.
@@ -254,13 +420,168 @@ class Seq(object):
         ('one', None)
         """
 
+        id_, desc = Seq._split_id_bytes(line)
+
+        if desc is None:
+            return id_.decode("utf-8"), None
+        else:
+            return id_.decode("utf-8"), desc.decode("utf-8")
+
+    @staticmethod
+    def _split_id_bytes(line: bytes) -> Tuple[bytes, Optional[bytes]]:
+        """ Like _split_id_line, but without decoding the components.
+
+        Examples:
+        >>> Seq._split_id_bytes(b">one two")
+        (b'one', b'two')
+        """
+
         if not line[:1] == b">":
             raise ValueError()
 
         # Strip the ">" character and split at most 1 time on spaces.
-        sline = line[1:].decode("utf-8").split(" ", 1)
+        sline = line[1:].split(b" ", 1)
 
         if len(sline) == 1:
             return sline[0], None
         else:
             return sline[0], sline[1]
+
+
+class SeqBatch(object):
+
+    __slots__ = (
+        "line_length",
+        "data",
+        "starts",
+        "id_ends",
+        "seq_starts",
+        "_fill",
+    )
+
+    def __init__(self, line_length: int = 60) -> None:
+        """ Many fasta records stored in a single buffer.
+
+        Records are stored in FASTA format, with sequence lines wrapped at
+        `line_length` and each record followed by a newline, so a run of
+        records can be written out directly with `view`.
+        The offsets of each record, the end of each id, and the start of
+        each sequence are stored in arrays alongside.
+        Use `Seq.parse_batches` to read batches from a file.
+
+        Examples:
+        >>> batch = SeqBatch()
+        >>> batch.append(b">one desc", b"ATGCA")
+        >>> batch.append(b">two", b"TGACA")
+        >>> batch.id(1)
+        b'two'
+        >>> bytes(batch.view(0, 2))
+        b'>one desc\\nATGCA\\n>two\\nTGACA\\n'
+        """
+
+        self.line_length = line_length
+        self.data = bytearray()
+        self.starts = array("Q", [0])
+        self.id_ends = array("Q")
+        self.seq_starts = array("Q")
+
+        # How much of the last sequence line of the current record is used.
+        self._fill = 0
+        return
+
+    def append(
+        self,
+        header: bytes,
+        seq: Union[bytes, bytearray]
+    ) -> None:
+        """ Add a record from its header line and unwrapped sequence.
+
+        Records with no sequence are kept, with just their header line.
+        """
+
+        self.start_record(header)
+        self.extend_seq(seq)
+        self.end_record()
+        return
+
+    def start_record(self, header: bytes) -> None:
+        """ Start a new record, whose sequence is added with `extend_seq`.
+
+        Examples:
+        >>> batch = SeqBatch(line_length=4)
+        >>> batch.start_record(b">one")
+        >>> batch.extend_seq(b"ATG")
+        >>> batch.extend_seq(b"CATG")
+        >>> batch.end_record()
+        >>> bytes(batch.view(0, 1))
+        b'>one\\nATGC\\nATG\\n'
+        """
+
+        id_, _ = Seq._parse_header(header)
+
+        start = len(self.data)
+        self.id_ends.append(start + 1 + len(id_))
+
+        self.data.extend(header)
+        self.data.extend(b"\n")
+        self.seq_starts.append(len(self.data))
+        self._fill = 0
+        return
+
+    def extend_seq(self, seq: Union[bytes, bytearray]) -> None:
+        """ Add unwrapped sequence to the current record.
+
+        It is wrapped into the buffer as it comes, continuing any partly
+        filled line, so the whole sequence is never held separately.
+        """
+
+        view = memoryview(seq)
+        i = 0
+        while i < len(view):
+            j = min(len(view), i + self.line_length - self._fill)
+            self.data.extend(view[i:j])
+            self._fill += j - i
+            i = j
+
+            if self._fill == self.line_length:
+                self.data.extend(b"\n")
+                self._fill = 0
+        return
+
+    def end_record(self) -> None:
+        if self._fill > 0:
+            self.data.extend(b"\n")
+            self._fill = 0
+
+        self.starts.append(len(self.data))
+        return
+
+    def __len__(self) -> int:
+        return len(self.id_ends)
+
+    def id(self, i: int) -> bytes:
+        """ The id of the i'th record, without creating a Seq. """
+
+        return bytes(self.data[self.starts[i] + 1:self.id_ends[i]])
+
+    def view(self, i: int, j: int) -> memoryview:
+        """ The FASTA formatted records i up to (not including) j. """
+
+        return memoryview(self.data)[self.starts[i]:self.starts[j]]
+
+    def __getitem__(self, i: int) -> Seq:
+        if i < 0:
+            i += len(self)
+
+        start = self.starts[i]
+        seq_start = self.seq_starts[i]
+        end = self.starts[i + 1]
+
+        id_, desc = Seq._parse_header(bytes(self.data[start:seq_start - 1]))
+        seq = self.data[seq_start:end].replace(b"\n", b"")
+        return Seq(id_, desc, bytes(seq))
+
+    def __iter__(self) -> Iterator[Seq]:
+        for i in range(len(self)):
+            yield self[i]
+        return
@@ -0,0 +1,116 @@
+""" A secondary index of the fasta records within ffindex documents. """
+
+from typing import NamedTuple, Iterable, Union, BinaryIO
+
+from ffdb.ffindex import FFDB, IndexRow, SortedFFIndex
+from ffdb.extsort import external_sort
+from ffdb.exceptions import FFKeyError
+
+
+class SeqIndexRow(NamedTuple):
+
+    id: bytes
+    document: bytes
+    offset: int
+    size: int
+
+    @classmethod
+    def parse_line(cls, line: bytes) -> "SeqIndexRow":
+        """ Parse a line from a sequence index file.
+
+        Examples:
+        >>> SeqIndexRow.parse_line(b"seq2\tdoc1\t30\t25")
+        SeqIndexRow(id=b'seq2', document=b'doc1', offset=30, size=25)
+        """
+
+        id_, document, offset, size = line.strip().split()
+        return cls(id_, document, int(offset), int(size))
+
+    def __bytes__(self):
+        return b'\t'.join([
+            self.id,
+            self.document,
+            str(self.offset).encode("utf-8"),
+            str(self.size).encode("utf-8")
+        ])
+
+
+def write_seq_index(
+    rows: Iterable[SeqIndexRow],
+    handle: BinaryIO,
+    buffer_size: int = 1000000,
+) -> int:
+    """ Sort rows by sequence id and write them to a file. """
+
+    length = 0
+    srows = external_sort(rows, key=lambda r: r.id, buffer_size=buffer_size)
+    for row in srows:
+        length += handle.write(bytes(row) + b"\n")
+    return length
+
+
+class SeqIndex(object):
+
+    def __init__(self, index: SortedFFIndex) -> None:
+        """ Find individual fasta records in multi-record documents.
+
+        The sequence index file maps each record id to the document it is in,
+        and the byte offset and size of the record within that document.
+        It is sorted by record id, so it is searched in place like a
+        SortedFFIndex.
+        """
+
+        self.index = index
+        return
+
+    @classmethod
+    def from_file(cls, handle: BinaryIO) -> "SeqIndex":
+        return cls(SortedFFIndex.from_file(handle))
+
+    def __getitem__(self, key: bytes) -> SeqIndexRow:
+        pos = self.index.bisect_left(key)
+        id_, line = self.index.line_at(pos)
+
+        if id_ != key or len(line) == 0:
+            raise KeyError(key)
+
+        return SeqIndexRow.parse_line(line)
+
+    def __contains__(self, key: bytes) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def fetch(self, db: FFDB, key: Union[bytes, SeqIndexRow]) -> bytes:
+        """ Read a single fasta record from the database. """
+
+        if isinstance(key, SeqIndexRow):
+            row = key
+        else:
+            try:
+                row = self[key]
+            except KeyError:
+                raise FFKeyError(
+                    f"The sequence {key.decode()} is not in the sequence "
+                    "index."
+                )
+
+        try:
+            document = db.index[row.document]
+        except KeyError:
+            raise FFKeyError(
+                f"The document {row.document.decode()} containing sequence "
+                f"{row.id.decode()} is not in the database."
+            )
+
+        assert isinstance(document, IndexRow)
+        record = db.data[IndexRow(
+            row.id,
+            document.start + row.offset,
+            row.size
+        )]
+
+        assert isinstance(record, bytes)
+        return record
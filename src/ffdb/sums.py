@@ -0,0 +1,265 @@
+""" Per-document content digests, stored in a binary sidecar file.
+
+A sidecar holds the name and digest of every document in a database,
+sorted by name (as bytes). It starts with an 8 byte magic string, followed
+by one record per document: the length of the name as a little endian
+32 bit integer, the name, and an 8 byte blake2b digest of the document
+(including the null terminator).
+Sidecars are written next to the ffindex file, see `sums_path`.
+"""
+
+import struct
+from hashlib import blake2b
+from heapq import merge
+from tempfile import TemporaryFile
+from os.path import splitext
+
+from typing import NamedTuple, Iterable, Iterator, BinaryIO
+from typing import Optional, Tuple, Union, Sequence
+
+from ffdb.extsort import external_sort
+from ffdb.exceptions import FFOrderError, FFCheckError
+
+MAGIC = b"FFSUM\x01\0\0"
+DIGEST_SIZE = 8
+
+_LENGTH = struct.Struct("<I")
+
+
+class SumRow(NamedTuple):
+
+    name: bytes
+    digest: bytes
+
+
+def digest(document: Union[bytes, bytearray, memoryview]) -> bytes:
+    """ A short digest of a document's contents.
+
+    This isn't meant to be secure, just fast and unlikely to collide.
+
+    Examples:
+    >>> len(digest(b"one\\n\\0"))
+    8
+    >>> digest(b"one\\n\\0") == digest(b"two\\n\\0")
+    False
+    """
+
+    return blake2b(document, digest_size=DIGEST_SIZE).digest()
+
+
+def digest_parts(
+    parts: Sequence[Union[bytes, bytearray, memoryview]]
+) -> bytes:
+    """ The digest of a document in several pieces, without joining them.
+
+    Examples:
+    >>> digest_parts([b"one", b"\\n\\0"]) == digest(b"one\\n\\0")
+    True
+    """
+
+    hasher = blake2b(digest_size=DIGEST_SIZE)
+    for part in parts:
+        hasher.update(part)
+    return hasher.digest()
+
+
+def sums_path(index_path: str) -> str:
+    """ Get the sidecar path for an ffindex file.
+
+    Examples:
+    >>> sums_path("my.ffindex")
+    'my.ffsum'
+    >>> sums_path("my_db")
+    'my_db.ffsum'
+    """
+
+    root, ext = splitext(index_path)
+    if ext == ".ffindex":
+        return root + ".ffsum"
+    return index_path + ".ffsum"
+
+
+def _pack(row: Tuple[bytes, bytes]) -> bytes:
+    name, digest_ = row
+    return _LENGTH.pack(len(name)) + name + digest_
+
+
+def _unpack(handle: BinaryIO) -> Iterator[SumRow]:
+    while True:
+        length = handle.read(_LENGTH.size)
+        if len(length) == 0:
+            break
+
+        name = handle.read(_LENGTH.unpack(length)[0])
+        yield SumRow(name, handle.read(DIGEST_SIZE))
+    return
+
+
+def write_sums(rows: Iterable[Tuple[bytes, bytes]], handle: BinaryIO) -> int:
+    """ Write name sorted (name, digest) rows to a sidecar file.
+
+    Examples:
+    >>> from io import BytesIO
+    >>> handle = BytesIO()
+    >>> write_sums([(b"a", bytes(8)), (b"b", bytes(8))], handle)
+    34
+    >>> _ = handle.seek(0)
+    >>> [r.name for r in read_sums(handle)]
+    [b'a', b'b']
+    """
+
+    length = handle.write(MAGIC)
+    last: Optional[bytes] = None
+
+    for row in rows:
+        if last is not None and row[0] <= last:
+            raise FFOrderError(
+                "Checksums must be written with unique names in sorted "
+                f"order. '{row[0].decode()}' came after '{last.decode()}'."
+            )
+
+        length += handle.write(_pack(row))
+        last = row[0]
+
+    return length
+
+
+def read_sums(handle: BinaryIO) -> Iterator[SumRow]:
+    """ Read the rows from a sidecar file, in name order. """
+
+    if handle.read(len(MAGIC)) != MAGIC:
+        raise FFCheckError(
+            f"The file {getattr(handle, 'name', '')} isn't a checksum file."
+        )
+
+    return _unpack(handle)
+
+
+class SumSpool(object):
+
+    def __init__(self, tmpdir: Optional[str] = None) -> None:
+        """ Collect document digests in a temporary file, in any order.
+
+        Digests are only sorted by name when they are written out,
+        so memory use doesn't depend on the number of documents.
+
+        Examples:
+        >>> from io import BytesIO
+        >>> spool = SumSpool()
+        >>> spool.add(b"b", b"two\\0")
+        >>> spool.add(b"a", b"one\\0")
+        >>> handle = BytesIO()
+        >>> _ = spool.write_to(handle)
+        >>> _ = handle.seek(0)
+        >>> [r.name for r in read_sums(handle)]
+        [b'a', b'b']
+        """
+
+        self.tmpdir = tmpdir
+        self.handle = TemporaryFile(dir=tmpdir)
+        return
+
+    def add(
+        self,
+        name: bytes,
+        document: Union[bytes, bytearray]
+    ) -> None:
+        self.handle.write(_pack((name, digest(document))))
+        return
+
+    def add_parts(
+        self,
+        name: bytes,
+        parts: Sequence[Union[bytes, bytearray, memoryview]]
+    ) -> None:
+        """ Add a document in several pieces, like `add`. """
+
+        self.handle.write(_pack((name, digest_parts(parts))))
+        return
+
+    def extend(self, rows: Iterable[Tuple[bytes, bytes]]) -> None:
+        """ Add (name, digest) rows that have already been computed. """
+
+        for row in rows:
+            self.handle.write(_pack(row))
+        return
+
+    def __iter__(self) -> Iterator[SumRow]:
+        self.handle.flush()
+        self.handle.seek(0)
+        return _unpack(self.handle)
+
+    def sorted(self, buffer_size: int = 1000000) -> Iterator[SumRow]:
+        """ Iterate over the digests sorted by name. """
+
+        return external_sort(
+            self,
+            key=lambda r: r.name,
+            buffer_size=buffer_size,
+            tmpdir=self.tmpdir,
+        )
+
+    def write_to(
+        self,
+        handle: BinaryIO,
+        base: Optional[Iterable[SumRow]] = None,
+        buffer_size: int = 1000000,
+    ) -> int:
+        """ Write the digests as a sidecar file, sorted by name.
+
+        Rows from an existing name sorted sidecar can be merged in with
+        `base`, e.g. when appending to a database.
+        """
+
+        rows: Iterable[SumRow] = self.sorted(buffer_size)
+
+        if base is not None:
+            rows = merge(base, rows, key=lambda r: r.name)
+
+        length = write_sums(rows, handle)
+        self.handle.seek(0, 2)
+        return length
+
+    def close(self) -> None:
+        self.handle.close()
+        return
+
+
+def diff_sums(
+    old: Iterable[SumRow],
+    new: Iterable[SumRow],
+) -> Iterator[Tuple[str, bytes]]:
+    """ Compare two name sorted sidecars, without reading any documents.
+
+    Yields ("added", name), ("removed", name), or ("changed", name) for
+    each name that differs, in name order.
+
+    Examples:
+    >>> old = [SumRow(b"a", b"1"), SumRow(b"b", b"2"), SumRow(b"c", b"3")]
+    >>> new = [SumRow(b"b", b"2"), SumRow(b"c", b"4"), SumRow(b"d", b"5")]
+    >>> list(diff_sums(old, new))
+    [('removed', b'a'), ('changed', b'c'), ('added', b'd')]
+    """
+
+    iold = iter(old)
+    inew = iter(new)
+    o: Optional[SumRow] = next(iold, None)
+    n: Optional[SumRow] = next(inew, None)
+
+    while o is not None or n is not None:
+        if n is None or (o is not None and o.name < n.name):
+            assert o is not None
+            yield "removed", o.name
+            o = next(iold, None)
+
+        elif o is None or n.name < o.name:
+            yield "added", n.name
+            n = next(inew, None)
+
+        else:
+            if o.digest != n.digest:
+                yield "changed", n.name
+
+            o = next(iold, None)
+            n = next(inew, None)
+    return